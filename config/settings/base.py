@@ -40,8 +40,10 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'profiles.middleware.ProfileMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'utils.middleware.RateLimitHeadersMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -64,6 +66,9 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'config.wsgi.application'
 
+# Threads (and so database connections) per process used by async views for ORM work, see utils.aio.
+ASYNC_DB_POOL_SIZE = 8
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -97,6 +102,37 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploads are named by content hash and deduplicated, see utils.storages.
+DEFAULT_FILE_STORAGE = 'utils.storages.ContentAddressedStorage'
+
+# Widths of the thumbnails and WebP variants generated for uploaded images, see utils.images.
+IMAGE_DERIVATIVE_WIDTHS = (160, 320, 640, 1280)
+
+# Uploads over 256 KB stream to a temporary file instead of memory, and image uploads
+# are bounded before decoding then downscaled and stripped of EXIF, see utils.forms.BoundedImageField.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 256 * 1024
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.MemoryFileUploadHandler',
+    'utils.uploadhandlers.BoundedTemporaryFileUploadHandler',
+]
+IMAGE_UPLOAD_MAX_SIZE = 15 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 50_000_000
+IMAGE_UPLOAD_MAX_DIMENSION = 2560
+
+# Built user data exports, kept outside MEDIA_ROOT as they are private to each user.
+EXPORT_ROOT = BASE_DIR / 'exports'
+
+# Threads per process running background jobs, see utils.tasks.
+BACKGROUND_WORKERS = 2
+
+# Throttle buckets must live in a cache shared by every worker (e.g. Redis or Memcached) in production.
+# The local memory cache only limits requests per process and suits a single node.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+THROTTLE_CACHE = 'default'
 
 LOGIN_REDIRECT_URL = 'accounts:account'
 LOGIN_URL = 'accounts:login'
@@ -112,5 +148,15 @@ REST_FRAMEWORK = {
     #     'rest_framework.authentication.BasicAuthentication', # Set by default
     #     'rest_framework.authentication.TokenAuthentication',
     # ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'utils.throttling.UserTokenBucketThrottle',
+        'utils.throttling.IPTokenBucketThrottle',
+    ],
+    # Token bucket rates, '<burst capacity>/<refill period>'.
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '120/min',
+        'ip': '300/min',
+        'diary_write': '30/min',
+    },
 }
 
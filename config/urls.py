@@ -6,6 +6,7 @@ from django.contrib.auth import views as auth_views
 from django.urls import include, path
 
 from diaries.views import DiaryDayListView
+from utils.views import content_addressed_media_view
 
 urlpatterns = [
     # Project urls
@@ -42,6 +43,8 @@ urlpatterns = [
     ),
     # Debug toolbar
     path('__debug__/', include(debug_toolbar.urls)),
+    # Content addressed uploads, see utils.storages
+    path(f'{settings.MEDIA_URL.strip("/")}/cas/<path:path>', content_addressed_media_view, name='content_addressed_media'),
 ]
 
 if settings.DEBUG:
@@ -0,0 +1,53 @@
+"""
+Async read endpoints, served without tying up a worker thread when deployed with config.asgi.
+ORM work runs on the bounded pool from utils.aio.
+"""
+import datetime
+
+from django.http import Http404, JsonResponse
+
+from utils.aio import async_login_required, run_in_pool
+
+from .models import Diary
+
+ENTRY_FIELDS = (
+    'id',
+    'meal',
+    'quantity',
+    'food_id',
+    'food_name',
+    'brand_name',
+    'data_value',
+    'data_value_measurement',
+    'energy',
+    'fat',
+    'saturates',
+    'carbohydrate',
+    'sugars',
+    'fibre',
+    'protein',
+    'salt',
+    'sodium',
+)
+
+
+def _day_bundle(user, date):
+    object_list = Diary.objects.filter(user=user, date=date).summary().order_by('datetime_created')
+    return {
+        'date': date,
+        'entries': list(object_list.values(*ENTRY_FIELDS)),
+        'total': object_list.total(),
+        'meal_totals': {meal: object_list.filter(meal=meal).total() for meal in Diary.Meal.values},
+        'remaining': object_list.remaining(user=user),
+    }
+
+
+@async_login_required
+async def diary_day_bundle_view(request, year, month, day):
+    """ Everything the diary day page displays, as one JSON document. """
+    try:
+        date = datetime.date(year, month, day)
+    except ValueError:
+        raise Http404('Invalid date. Must be in format YYYY-MM-DD.')
+    bundle = await run_in_pool(_day_bundle, request.user, date)
+    return JsonResponse(bundle)
@@ -0,0 +1,40 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from diaries.suggestions import score_candidates
+
+
+class Command(BaseCommand):
+    help = 'Times the macro gap suggestion scoring for a range of candidate set sizes.'
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes', type=int, nargs='+', default=[100, 500, 1000, 2000, 5000, 10000], help='Candidate set sizes.'
+        )
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per size, the median is reported.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        remaining = np.array([650, 45, 70, 20])
+        self.stdout.write(f'{"candidates":>12}{"median ms":>12}{"max ms":>12}')
+        for size in options['sizes']:
+            # Energy, protein, carbohydrate and fat per quantity of 1, roughly shaped like real food.
+            matrix = np.column_stack(
+                [
+                    rng.uniform(20, 600, size),
+                    rng.uniform(0, 35, size),
+                    rng.uniform(0, 80, size),
+                    rng.uniform(0, 40, size),
+                ]
+            )
+            max_quantity = rng.uniform(1, 5, size)
+            timings = []
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                score_candidates(matrix, remaining, max_quantity)
+                timings.append((time.perf_counter() - start) * 1000)
+            self.stdout.write(f'{size:>12}{np.median(timings):>12.2f}{max(timings):>12.2f}')
@@ -1,4 +1,9 @@
-from django.db import models
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
 from django.db.models import (
     Avg,
     Case,
@@ -12,6 +17,7 @@ from django.db.models import (
 )
 from django.db.models.functions import Coalesce, Concat, Round
 
+from meals.models import MealItem
 from profiles.models import Profile
 
 
@@ -29,6 +35,11 @@ class Round2(Func):
     template = '%(function)s(%(expressions)s::numeric, 2)'
 
 
+def max_decimal(field):
+    """ The largest value a DecimalField can store, e.g. 99.99 for max_digits=4, decimal_places=2. """
+    return Decimal(10) ** (field.max_digits - field.decimal_places) - Decimal(10) ** -field.decimal_places
+
+
 class DiaryQuerySet(models.QuerySet):
     def summary(self):
         """
@@ -78,30 +89,78 @@ class DiaryQuerySet(models.QuerySet):
             total_sodium=Coalesce(Sum('sodium'), 0),
         )
 
-    def remaining(self, user):
+    def remaining(self, user, target=None):
         """
         Calculates the remaining calories and macronutrients for the diary
         display page, based off the current user's dietary target.
+        `target` is the user's already loaded profile, e.g. request.profile,
+        otherwise the target columns are fetched.
         """
         total = self.filter(user=user).total()
-        target = (
-            Profile.objects.filter(user=user)
-            .annotate(sodium=ExpressionWrapper(F('salt') * 400, output_field=models.IntegerField()))
-            .values()
-            .first()
-        )
+        if target is None:
+            target = Profile.objects.targets().filter(user=user).first()
         return {
-            'energy': target.get('energy', 0) - total.get('total_energy', 0),
-            'fat': target.get('fat', 0) - total.get('total_fat', 0),
-            'saturates': target.get('saturates', 0) - total.get('total_saturates', 0),
-            'carbohydrate': target.get('carbohydrate', 0) - total.get('total_carbohydrate', 0),
-            'sugars': target.get('sugars', 0) - total.get('total_sugars', 0),
-            'fibre': target.get('fibre', 0) - total.get('total_fibre', 0),
-            'protein': target.get('protein', 0) - total.get('total_protein', 0),
-            'salt': target.get('salt', 0) - total.get('total_salt', 0),
-            'sodium': target.get('sodium', 0) - total.get('total_sodium', 0),
+            'energy': getattr(target, 'energy', 0) - total.get('total_energy', 0),
+            'fat': getattr(target, 'fat', 0) - total.get('total_fat', 0),
+            'saturates': getattr(target, 'saturates', 0) - total.get('total_saturates', 0),
+            'carbohydrate': getattr(target, 'carbohydrate', 0) - total.get('total_carbohydrate', 0),
+            'sugars': getattr(target, 'sugars', 0) - total.get('total_sugars', 0),
+            'fibre': getattr(target, 'fibre', 0) - total.get('total_fibre', 0),
+            'protein': getattr(target, 'protein', 0) - total.get('total_protein', 0),
+            'salt': getattr(target, 'salt', 0) - total.get('total_salt', 0),
+            'sodium': (getattr(target, 'sodium', None) or 0) - total.get('total_sodium', 0),
         }
 
+    def add_saved_meals(self, user, date, selections):
+        """
+        Copies the items of the user's saved meals into their diary on the given date.
+        `selections` is a list of (saved meal id, diary meal number) pairs, or
+        (saved meal id, diary meal number, scale) triples to add a saved meal at e.g.
+        1.5 portions, so several saved meals can be added to several diary meals at once.
+        Scaled quantities are calculated in the SELECT, all items are read with one
+        SELECT and written with one INSERT inside a transaction.
+        Returns the number of diary entries created, or raises ValidationError, adding
+        nothing, if a scaled quantity doesn't fit Diary.quantity.
+        """
+        slots = defaultdict(list)
+        scales = {}
+        for saved_meal, diary_meal, *scale in selections:
+            saved_meal = uuid.UUID(str(saved_meal))
+            scale = Decimal(str(scale[0])) if scale else Decimal(1)
+            if scales.setdefault(saved_meal, scale) != scale:
+                raise ValueError('A saved meal can only be added at one scale at a time.')
+            slots[saved_meal].append(diary_meal)
+        if not slots:
+            return 0
+
+        quantity = F('quantity')
+        if any(scale != 1 for scale in scales.values()):
+            quantity = ExpressionWrapper(
+                quantity
+                * Case(
+                    *[When(meal_id=saved_meal, then=Value(scale)) for saved_meal, scale in scales.items()],
+                    default=Value(Decimal(1)),
+                ),
+                output_field=models.DecimalField(),
+            )
+
+        with transaction.atomic(using=self.db):
+            items = list(
+                MealItem.objects.filter(meal__in=slots, meal__user=user)
+                .annotate(scaled_quantity=Round2(quantity))
+                .values_list('meal_id', 'food_id', 'scaled_quantity')
+            )
+            max_quantity = max_decimal(self.model._meta.get_field('quantity'))
+            if any(quantity > max_quantity for _, _, quantity in items):
+                raise ValidationError(f'Scaled quantities can be at most {max_quantity}, add fewer portions.')
+            entries = [
+                self.model(user=user, date=date, meal=diary_meal, food_id=food_id, quantity=quantity)
+                for meal_id, food_id, quantity in items
+                for diary_meal in slots[meal_id]
+            ]
+            self.bulk_create(entries)
+        return len(entries)
+
     def custom_summary(self, macro_1='protein', macro_2='carbohydrate', macro_3='fat'):
         return self.select_related('food').annotate(
             name=F('food__name'),
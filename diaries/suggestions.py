@@ -0,0 +1,156 @@
+"""
+"Fill my remaining macros" suggestions.
+Candidates are the user's frequently logged food and their saved meals, held as a
+NumPy nutrient matrix with one row per candidate (per quantity of 1) and one column
+per macro. Every candidate, and every pair of the best candidates, is given the
+quantity which best fits the remaining targets by weighted least squares, all
+vectorised so a few thousand candidates score in a few milliseconds.
+"""
+import datetime
+
+import numpy as np
+from django.db.models import Avg, Count, Max
+
+from meals.models import Meal
+
+from .models import Diary
+
+MACROS = ('energy', 'protein', 'carbohydrate', 'fat')
+
+# Errors are scaled by the remaining target, these floors stop a nearly met target
+# (e.g. 2g of fat left) dominating the score.
+SCALE_FLOORS = np.array([100.0, 10.0, 10.0, 5.0])
+
+QUANTITY_STEP = 0.25
+MAX_QUANTITY = 5.0
+PAIR_POOL = 50
+FREQUENT_FOOD_DAYS = 180
+FREQUENT_FOOD_LIMIT = 3000
+
+
+def _round_quantities(quantities, max_quantity):
+    quantities = np.clip(quantities, 0, max_quantity)
+    return np.round(quantities / QUANTITY_STEP) * QUANTITY_STEP
+
+
+def score_candidates(matrix, remaining, max_quantity=MAX_QUANTITY, limit=10, pair_pool=PAIR_POOL):
+    """
+    Finds the single candidates and pairs of candidates, with quantities, which best
+    match the remaining macros.
+
+    matrix: (n, 4) array of macros per quantity of 1 for each candidate.
+    remaining: (4,) array of remaining energy, protein, carbohydrate and fat.
+    max_quantity: scalar or (n,) array of the largest quantity suggested per candidate.
+    Returns up to `limit` (indices, quantities, score) tuples, lowest (best) score first.
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    remaining = np.clip(np.asarray(remaining, dtype=float), 0, None)
+    n = len(matrix)
+    if n == 0 or not remaining.any():
+        return []
+    max_quantity = np.broadcast_to(np.asarray(max_quantity, dtype=float), (n,))
+
+    weights = 1 / np.maximum(remaining, SCALE_FLOORS)
+    scaled = matrix * weights  # (n, 4)
+    target = remaining * weights  # (4,)
+
+    # Singles: q = <x, r> / <x, x> in the weighted space.
+    gram = np.einsum('ij,ij->i', scaled, scaled)
+    rhs = scaled @ target
+    with np.errstate(divide='ignore', invalid='ignore'):
+        single_q = np.where(gram > 0, rhs / gram, 0)
+    single_q = _round_quantities(single_q, max_quantity)
+    single_residual = single_q[:, None] * scaled - target
+    single_score = np.einsum('ij,ij->i', single_residual, single_residual)
+    single_score[single_q == 0] = np.inf
+
+    # Pairs of the best singles: solve the 2x2 normal equations for every pair at once.
+    pool = np.argsort(single_score)[: min(pair_pool, n)]
+    pool = pool[np.isfinite(single_score[pool])]
+    results = [((int(i),), (float(single_q[i]),), float(single_score[i])) for i in pool]
+
+    if len(pool) > 1:
+        x = scaled[pool]
+        a = gram[pool]
+        d = rhs[pool]
+        b = x @ x.T  # cross terms
+        i, j = np.triu_indices(len(pool), k=1)
+        det = a[i] * a[j] - b[i, j] ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            qi = np.where(det > 0, (a[j] * d[i] - b[i, j] * d[j]) / det, 0)
+            qj = np.where(det > 0, (a[i] * d[j] - b[i, j] * d[i]) / det, 0)
+        qi = _round_quantities(qi, max_quantity[pool][i])
+        qj = _round_quantities(qj, max_quantity[pool][j])
+        residual = qi[:, None] * x[i] + qj[:, None] * x[j] - target
+        pair_score = np.einsum('ij,ij->i', residual, residual)
+        # Pairs where one quantity rounds to zero are just a single, already listed.
+        pair_score[(qi == 0) | (qj == 0)] = np.inf
+        best = np.argsort(pair_score)[:limit]
+        results.extend(
+            ((int(pool[i[k]]), int(pool[j[k]])), (float(qi[k]), float(qj[k])), float(pair_score[k]))
+            for k in best
+            if np.isfinite(pair_score[k])
+        )
+
+    results.sort(key=lambda result: result[2])
+    return results[:limit]
+
+
+def get_candidates(user, today=None):
+    """
+    Returns a list of candidate dicts and their (n, 4) macro matrix for the user's
+    frequently logged food (last FREQUENT_FOOD_DAYS days) and saved meals.
+    """
+    today = today or datetime.date.today()
+    foods = (
+        Diary.objects.filter(user=user, date__gte=today - datetime.timedelta(days=FREQUENT_FOOD_DAYS))
+        .values('food_id', 'food__name', 'food__brand__name', *(f'food__{macro}' for macro in MACROS))
+        .annotate(uses=Count('id'), usual_quantity=Avg('quantity'), largest_quantity=Max('quantity'))
+        .order_by('-uses')[:FREQUENT_FOOD_LIMIT]
+    )
+    meals = Meal.objects.filter(user=user, item_count__gt=0).values('id', 'name', *MACROS)
+
+    candidates = []
+    rows = []
+    for food in foods:
+        candidates.append(
+            {
+                'type': 'food',
+                'id': food['food_id'],
+                'name': food['food__name'],
+                'brand': food['food__brand__name'],
+                # Allow a little more than the user has ever logged at once.
+                'max_quantity': min(MAX_QUANTITY, float(food['largest_quantity']) * 1.5),
+            }
+        )
+        rows.append([food[f'food__{macro}'] for macro in MACROS])
+    for meal in meals:
+        candidates.append({'type': 'meal', 'id': meal['id'], 'name': meal['name'], 'max_quantity': 2.0})
+        rows.append([meal[macro] for macro in MACROS])
+    return candidates, np.array(rows, dtype=float).reshape(-1, len(MACROS))
+
+
+def suggest(user, remaining, limit=10):
+    """ Returns JSON ready suggestions for filling the remaining macros of the user's diary day. """
+    candidates, matrix = get_candidates(user)
+    target = [float(remaining[macro]) for macro in MACROS]
+    max_quantity = np.array([candidate['max_quantity'] for candidate in candidates])
+    suggestions = []
+    for indices, quantities, score in score_candidates(matrix, target, max_quantity, limit=limit):
+        totals = sum(matrix[index] * quantity for index, quantity in zip(indices, quantities))
+        suggestions.append(
+            {
+                'items': [
+                    {
+                        'type': candidates[index]['type'],
+                        'id': candidates[index]['id'],
+                        'name': candidates[index]['name'],
+                        'quantity': quantity,
+                    }
+                    for index, quantity in zip(indices, quantities)
+                ],
+                'totals': {macro: round(float(value), 1) for macro, value in zip(MACROS, totals)},
+                'score': round(score, 4),
+            }
+        )
+    return suggestions
@@ -0,0 +1,202 @@
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import AsyncClient, SimpleTestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from food.models import Brand, Category, Food
+from meals.models import MealItem
+from meals.tests import MealTestCase
+
+from .models import Diary
+from .suggestions import score_candidates
+
+
+class DiaryDayBundleViewTests(TransactionTestCase):
+    # Async views query on the pool's own connections, which can't see a TestCase transaction.
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        food = Food.objects.create(
+            name='Chicken Breast',
+            brand=Brand.objects.create(name='Tesco'),
+            category=Category.objects.create(name='Generic'),
+            data_value=100,
+            data_measurement='g',
+            energy=105,
+            fat=1,
+            saturates=1,
+            carbohydrate=0,
+            sugars=0,
+            fibre=0,
+            protein=22,
+            salt=1,
+        )
+        self.date = datetime.date(2021, 3, 1)
+        Diary.objects.create(user=self.user, date=self.date, meal=Diary.Meal.MEAL1, food=food, quantity=2)
+        Diary.objects.create(user=self.user, date=self.date, meal=Diary.Meal.MEAL5, food=food, quantity=1)
+        Diary.objects.create(user=self.user, date=self.date - datetime.timedelta(days=1), meal=1, food=food, quantity=1)
+        self.async_client.login(username='user', password='password')
+
+    def url(self, date):
+        return reverse('diaries:day_bundle_api', kwargs={'year': date.year, 'month': date.month, 'day': date.day})
+
+    async def test_bundle(self):
+        response = await self.async_client.get(self.url(self.date))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['date'], '2021-03-01')
+        self.assertEqual([entry['meal'] for entry in data['entries']], [1, 5])
+        self.assertEqual(data['entries'][0]['food_name'], 'Chicken Breast')
+        self.assertEqual(Decimal(str(data['total']['total_energy'])), 315)
+        self.assertEqual(Decimal(str(data['meal_totals']['1']['total_energy'])), 210)
+        self.assertEqual(Decimal(str(data['meal_totals']['3']['total_energy'])), 0)
+        self.assertEqual(Decimal(str(data['remaining']['energy'])), 2000 - 315)
+
+    async def test_invalid_date(self):
+        url = reverse('diaries:day_bundle_api', kwargs={'year': 2021, 'month': 2, 'day': 30})
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 404)
+
+    async def test_anonymous(self):
+        response = await AsyncClient().get(self.url(self.date))
+        self.assertEqual(response.status_code, 403)
+
+
+class DiaryAddMealViewTests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+        self.meal = self.create_meal('Meal 1')
+        self.date = datetime.date(2021, 3, 1)
+
+    def test_add_saved_meals(self):
+        other = self.create_meal('Meal 2')
+        selections = [(self.meal.pk, Diary.Meal.MEAL1), (self.meal.pk, Diary.Meal.MEAL5), (other.pk, 3, Decimal('2'))]
+        with CaptureQueriesContext(connection) as queries:
+            count = Diary.objects.add_saved_meals(self.user, self.date, selections)
+        self.assertEqual(count, 6)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT')]), 1)
+        rows = Diary.objects.filter(user=self.user, date=self.date).values_list('meal', 'food', 'quantity')
+        self.assertEqual(
+            sorted(rows, key=lambda row: (row[0], row[2])),
+            [
+                (1, self.rice.pk, Decimal('1.50')),
+                (1, self.chicken.pk, Decimal('2.00')),
+                (3, self.rice.pk, Decimal('3.00')),
+                (3, self.chicken.pk, Decimal('4.00')),
+                (5, self.rice.pk, Decimal('1.50')),
+                (5, self.chicken.pk, Decimal('2.00')),
+            ],
+        )
+
+    def test_add_saved_meals_other_user(self):
+        other = get_user_model().objects.create_user(username='other', email='other@email.com', password='password')
+        meal = self.create_meal('Other', user=other)
+        self.assertEqual(Diary.objects.add_saved_meals(self.user, self.date, [(meal.pk, 1)]), 0)
+        with self.assertRaises(ValueError):
+            Diary.objects.add_saved_meals(self.user, self.date, [(self.meal.pk, 1, 1), (self.meal.pk, 2, 2)])
+
+    def test_post(self):
+        other = self.create_meal('Meal 2')
+        url = reverse('diaries:browse_saved_meal', kwargs={'year': 2021, 'month': 3, 'day': 1, 'meal': 1})
+        data = {
+            f'slot_{self.meal.pk}': 1,
+            f'scale_{self.meal.pk}': '',
+            f'slot_{other.pk}': 5,
+            f'scale_{other.pk}': '0.5',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data)
+        self.assertRedirects(response, reverse('diaries:day', args=(2021, 3, 1)), fetch_redirect_response=False)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "diaries_diary"')]), 1)
+        self.assertEqual(
+            sorted(Diary.objects.filter(user=self.user, date=self.date).values_list('meal', 'quantity')),
+            [(1, Decimal('1.50')), (1, Decimal('2.00')), (5, Decimal('0.75')), (5, Decimal('1.00'))],
+        )
+
+    def test_post_nothing_selected(self):
+        url = reverse('diaries:browse_saved_meal', kwargs={'year': 2021, 'month': 3, 'day': 1, 'meal': 1})
+        response = self.client.post(url, {f'slot_{self.meal.pk}': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Diary.objects.filter(user=self.user).exists())
+
+    def test_invalid_scale(self):
+        url = reverse('diaries:browse_saved_meal', kwargs={'year': 2021, 'month': 3, 'day': 1, 'meal': 1})
+        response = self.client.post(url, {f'slot_{self.meal.pk}': 1, f'scale_{self.meal.pk}': '0.1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['errors']), 1)
+        self.assertTrue(response.context['errors'][0].startswith('Meal 1: '))
+        self.assertFalse(Diary.objects.filter(user=self.user).exists())
+
+    def test_scaled_quantity_too_large(self):
+        MealItem.objects.create(meal=self.meal, food=self.rice, quantity=12)
+        url = reverse('diaries:browse_saved_meal', kwargs={'year': 2021, 'month': 3, 'day': 1, 'meal': 1})
+        response = self.client.post(url, {f'slot_{self.meal.pk}': 1, f'scale_{self.meal.pk}': '10'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('at most 99.99', response.context['errors'][0])
+        self.assertFalse(Diary.objects.filter(user=self.user).exists())
+
+    def test_confirm_invalid_scale(self):
+        url = reverse(
+            'diaries:saved_meal_to_diary',
+            kwargs={'year': 2021, 'month': 3, 'day': 1, 'meal': 1, 'saved_meal': self.meal.pk},
+        )
+        response = self.client.post(url, {'scale': '11'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('scale', response.context['scale_form'].errors)
+        MealItem.objects.create(meal=self.meal, food=self.rice, quantity=12)
+        response = self.client.post(url, {'scale': '10'})
+        self.assertIn('at most 99.99', response.context['scale_form'].errors['scale'][0])
+        self.assertFalse(Diary.objects.filter(user=self.user).exists())
+
+
+class ScoreCandidatesTests(SimpleTestCase):
+    matrix = [[100, 10, 0, 5], [200, 0, 50, 0], [50, 0, 0, 5], [0, 0, 0, 0]]
+
+    def test_best_pair_first(self):
+        results = score_candidates(self.matrix, [400, 20, 50, 10])
+        self.assertEqual(
+            [(indices, quantities) for indices, quantities, _ in results[:3]],
+            [((0, 1), (2.0, 1.0)), ((1, 2), (1.0, 2.0)), ((0,), (2.25,))],
+        )
+        self.assertEqual(results[0][2], 0)
+        self.assertEqual([score for _, _, score in results], sorted(score for _, _, score in results))
+        # A candidate with no macros can't help fill any of them.
+        self.assertFalse(any(3 in indices for indices, _, _ in results))
+
+    def test_max_quantity(self):
+        results = score_candidates(self.matrix, [400, 20, 50, 10], max_quantity=[1, 5, 5, 5], limit=3)
+        self.assertEqual(len(results), 3)
+        self.assertEqual(results[0][:2], ((0, 1), (1.0, 1.0)))
+        self.assertAlmostEqual(results[0][2], 0.5625)
+
+    def test_nothing_to_fill(self):
+        self.assertEqual(score_candidates(self.matrix, [0, -10, 0, 0]), [])
+        self.assertEqual(score_candidates([], [400, 20, 50, 10]), [])
+
+
+class DiarySuggestionViewTests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_suggestions(self):
+        today = datetime.date.today()
+        Diary.objects.create(user=self.user, date=today, meal=1, food=self.chicken, quantity=2)
+        yesterday = today - datetime.timedelta(days=1)
+        Diary.objects.create(user=self.user, date=yesterday, meal=1, food=self.rice, quantity=1)
+        meal = self.create_meal('Meal 1')
+        url = reverse('diaries:suggestions', kwargs={'year': today.year, 'month': today.month, 'day': today.day})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(Decimal(str(data['remaining']['energy'])), 2000 - 210)
+        self.assertTrue(data['suggestions'])
+        candidates = {('food', str(self.chicken.pk)), ('food', str(self.rice.pk)), ('meal', str(meal.pk))}
+        for suggestion in data['suggestions']:
+            for item in suggestion['items']:
+                self.assertIn((item['type'], str(item['id'])), candidates)
+                self.assertGreater(item['quantity'], 0)
+        scores = [suggestion['score'] for suggestion in data['suggestions']]
+        self.assertEqual(scores, sorted(scores))
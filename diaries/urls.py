@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 app_name = 'diaries'
 urlpatterns = [
@@ -16,6 +16,11 @@ urlpatterns = [
         views.DiaryMealListView.as_view(),
         name='meal_list',
     ),
+    path(
+        'api/<int:year>-<int:month>-<int:day>/',
+        async_views.diary_day_bundle_view,
+        name='day_bundle_api',
+    ),
     # Adding food to diary
     path(
         '<int:year>-<int:month>-<int:day>/add-multiple-food-to-diary/<int:meal>/',
@@ -42,6 +47,11 @@ urlpatterns = [
         views.DiaryAddMealConfirmView.as_view(),
         name='saved_meal_to_diary',
     ),
+    path(
+        '<int:year>-<int:month>-<int:day>/suggestions/',
+        views.DiarySuggestionView.as_view(),
+        name='suggestions',
+    ),
     # Updating food in diary
     path('<uuid:pk>/detail-update/', views.DiaryDetailUpdateView.as_view(), name='update'),
     # Deleting food in diary
@@ -1,11 +1,14 @@
+import uuid
+
 from django.contrib import messages
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.core.exceptions import ValidationError
 from django.core.paginator import Paginator
 from django.db.models import Case, F, Q, Value, When
-from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import (
     HttpResponseRedirect,
     get_list_or_404,
@@ -29,11 +32,14 @@ from django.views.generic import (
 )
 
 from food.models import Food
+from meals.forms import MealScaleForm
 from meals.models import Meal, MealItem
+from utils.mixins import OwnedObjectMixin, ThrottleMixin
 
 from .forms import AddRecentToDiaryFormSet, AddToDiaryFormSet, DiaryUpdateForm
 from .mixins import DiaryDateMixin, DiaryMealMixin, FoodFilterMixin
 from .models import Diary
+from .suggestions import suggest
 
 User = get_user_model()
 
@@ -65,8 +71,8 @@ class DiaryDayListView(LoginRequiredMixin, DiaryDateMixin, TemplateView):
         context['total_meal_4'] = object_list.filter(meal=4).total()
         context['total_meal_5'] = object_list.filter(meal=5).total()
         context['total_meal_6'] = object_list.filter(meal=6).total()
-        context['target'] = user_.profile
-        context['remaining'] = object_list.remaining(user=user_)
+        context['target'] = self.request.profile
+        context['remaining'] = object_list.remaining(user=user_, target=self.request.profile)
         return context
 
     def post(self, request, *args, **kwargs):
@@ -104,13 +110,14 @@ class DiaryMealListView(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixin, Temp
 """ Diary create views """
 
 
-class DiaryAddMultipleFoodView(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixin, FoodFilterMixin, TemplateView):
+class DiaryAddMultipleFoodView(LoginRequiredMixin, ThrottleMixin, DiaryDateMixin, DiaryMealMixin, FoodFilterMixin, TemplateView):
     """
     Allows the user to add multiple food items to their food diary via formset.
     Renders the formset with food name and details and a quantity input field.
     """
 
     template_name = 'diaries/diary_add_food_multiple.html'
+    throttle_scope = 'diary_write'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -157,7 +164,7 @@ class DiaryAddMultipleFoodView(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixi
         return self.render_to_response(context)
 
 
-class DiaryCopyMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
+class DiaryCopyMealPreviousDay(LoginRequiredMixin, ThrottleMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
     """
     Allows the user to copy all food and quantities from the specified
     diary meal on a previous day to the same diary meal on the diary
@@ -165,6 +172,7 @@ class DiaryCopyMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixi
     """
 
     template_name = 'diaries/diary_copy_previous_day.html'
+    throttle_scope = 'diary_write'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -194,7 +202,7 @@ class DiaryCopyMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixi
         return self.render_to_response(context)
 
 
-class DiaryCopyAllMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, TemplateView):
+class DiaryCopyAllMealPreviousDay(LoginRequiredMixin, ThrottleMixin, DiaryDateMixin, TemplateView):
     """
     Allows the user to copy all food and associated quantities from the previous diary day.
     TODO: Copies food even if the user has the same amount of food for
@@ -202,6 +210,7 @@ class DiaryCopyAllMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, TemplateVi
     """
 
     template_name = 'diaries/diary_copy_previous_day.html'
+    throttle_scope = 'diary_write'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -226,66 +235,130 @@ class DiaryCopyAllMealPreviousDay(LoginRequiredMixin, DiaryDateMixin, TemplateVi
         return self.render_to_response(context)
 
 
-class DiaryAddMealView(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
+class DiaryAddMealView(LoginRequiredMixin, ThrottleMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
     """
     Displays a list of users saved meals to select from and add to the food diary.
+    Several saved meals can be added at once, each to its own chosen diary meal.
     """
 
     template_name = 'diaries/diary_add_meal_list.html'
+    throttle_scope = 'diary_write'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['object_list'] = Meal.objects.filter(user=self.request.user)
+        context['object_list'] = Meal.objects.filter(user=self.request.user).summary().order_by('name')
+        context['diary_meals'] = Diary.Meal.choices
         return context
 
+    def get_selections(self):
+        """
+        Returns the (saved meal id, diary meal, scale) selections and the errors of
+        invalid scales by saved meal id.
+        """
+        # Each saved meal row posts 'slot_<saved meal id>' with the diary meal to add it to, or blank,
+        # and 'scale_<saved meal id>' with the portions to add, blank for 1.
+        selections = []
+        scale_errors = {}
+        for key, value in self.request.POST.items():
+            if key.startswith('slot_') and value:
+                scale_form = MealScaleForm({'scale': self.request.POST.get(f'scale_{key[5:]}')})
+                if not scale_form.is_valid():
+                    scale_errors[key[5:]] = scale_form.errors['scale']
+                    continue
+                try:
+                    selections.append((uuid.UUID(key[5:]), Diary.Meal(int(value)), scale_form.get_scale()))
+                except ValueError:
+                    raise Http404('Invalid saved meal or diary meal selection.')
+        return selections, scale_errors
 
-class DiaryAddMealConfirmView(LoginRequiredMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
+    def post(self, request, *args, **kwargs):
+        context = self.get_context_data(**kwargs)
+        selections, scale_errors = self.get_selections()
+        if scale_errors:
+            names = {str(saved_meal.pk): saved_meal.name for saved_meal in context['object_list']}
+            context['errors'] = [
+                f'{names.get(pk, "Saved meal")}: {error}' for pk, errors in scale_errors.items() for error in errors
+            ]
+            return self.render_to_response(context)
+        if selections:
+            try:
+                count = Diary.objects.add_saved_meals(request.user, self.date, selections)
+            except ValidationError as error:
+                context['errors'] = error.messages
+                return self.render_to_response(context)
+            messages.success(request, f'Added {count} items from {len(selections)} saved meals to {self.date}')
+            return redirect('diaries:day', self.date.year, self.date.month, self.date.day)
+        messages.error(request, 'You have not selected any saved meals to add')
+        return self.render_to_response(context)
+
+
+class DiaryAddMealConfirmView(LoginRequiredMixin, ThrottleMixin, DiaryDateMixin, DiaryMealMixin, TemplateView):
     """
     Allows the user to confirm addition of their chosen saved meal to the diary meal specified in URL parameters.
     """
 
     template_name = 'diaries/diary_add_meal_confirm.html'
+    throttle_scope = 'diary_write'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['saved_meal_obj'] = get_object_or_404(Meal, id=self.kwargs.get('saved_meal'))
-        context['object_list'] = MealItem.objects.filter(meal_id=context['saved_meal_obj'])
+        context['scale_form'] = MealScaleForm(self.request.POST or self.request.GET or None)
+        context['scale'] = context['scale_form'].get_scale()
+        context['saved_meal_obj'] = get_object_or_404(Meal, id=self.kwargs.get('saved_meal'), user=self.request.user)
+        context['object_list'] = MealItem.objects.filter(meal_id=context['saved_meal_obj']).summary(scale=context['scale'])
         return context
 
     def post(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         saved_meal_obj = context['saved_meal_obj']
-        meal_item_list = context['object_list']
-        if meal_item_list:
-            count = len(meal_item_list)
-            for food_item in meal_item_list:
-                Diary.objects.create(
-                    user=request.user,
-                    date=self.date,
-                    meal=self.diary_meal,
-                    food=food_item.food,
-                    quantity=food_item.quantity,
-                )
+        if not context['scale_form'].is_valid():
+            return self.render_to_response(context)
+        try:
+            count = Diary.objects.add_saved_meals(
+                request.user, self.date, [(saved_meal_obj.pk, self.diary_meal, context['scale'])]
+            )
+        except ValidationError as error:
+            context['scale_form'].add_error('scale', error)
+            return self.render_to_response(context)
+        if count:
+            scale = f' x{context["scale"].normalize()}' if context['scale'] != 1 else ''
             messages.success(
                 request,
-                f'Added {count} items from saved meal {saved_meal_obj} to {self.diary_meal_name}, {self.date}',
+                f'Added {count} items from saved meal {saved_meal_obj}{scale} to {self.diary_meal_name}, {self.date}',
             )
             return redirect('diaries:day', self.date.year, self.date.month, self.date.day)
         return self.render_to_response(context)
 
 
+class DiarySuggestionView(LoginRequiredMixin, DiaryDateMixin, View):
+    """
+    Suggests food and saved meals, with quantities, to fill the user's remaining
+    calories and macronutrients for the diary day. Returns JSON.
+    """
+
+    def get(self, request, *args, **kwargs):
+        self.get_diary_date()
+        remaining = Diary.objects.filter(user=request.user, date=self.date).remaining(
+            user=request.user, target=request.profile
+        )
+        return JsonResponse({'remaining': remaining, 'suggestions': suggest(request.user, remaining)})
+
+
 """ Diary update views """
 
 
-class DiaryDetailUpdateView(LoginRequiredMixin, DiaryDateMixin, TemplateView):
+class DiaryDetailUpdateView(LoginRequiredMixin, OwnedObjectMixin, DiaryDateMixin, TemplateView):
     """
     Detail and update view combined.
     """
     template_name = 'diaries/diary_update.html'
 
+    def get_owned_queryset(self):
+        return Diary.objects.summary()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['object'] = Diary.objects.filter(id=self.kwargs.get('pk')).summary().first()
+        context['object'] = self.get_owned_object()
         context['form'] = DiaryUpdateForm(self.request.POST or None, instance=context['object'])
         return context
 
@@ -316,22 +389,19 @@ class DiaryDetailUpdateView(LoginRequiredMixin, DiaryDateMixin, TemplateView):
 """ Diary delete views """
 
 
-class DiaryDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class DiaryDeleteView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     """
     Allows the user to confirm deletion of single diary food item.
     """
 
     model = Diary
+    owned_select_related = ('food', 'food__brand')
 
-    def get_context_data_data(self, **kwargs):
-        context = super().get_context_data_data(**kwargs)
-        context['date'] = self.get_object().date
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['date'] = self.object.date
         return context
 
-    def test_func(self):
-        obj = self.get_object()
-        return obj.user == self.request.user
-
     def delete(self, request, *args, **kwargs):
         obj = self.get_object()
         messages.warning(self.request, f'{obj.food.name} was deleted')
@@ -1,14 +1,27 @@
 from rest_framework.generics import ListCreateAPIView, RetrieveUpdateDestroyAPIView
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+
+from utils.renderers import FastJSONRenderer
 
 from ..models import Food
-from .serializers import FoodSerializer
+from .serializers import FoodSerializer, FoodValuesSerializer
 
 
 class FoodListCreateAPIView(ListCreateAPIView):
     queryset = Food.objects.all()
     permission_classes = (IsAuthenticated,)
     serializer_class = FoodSerializer
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path, serializes from values_list() rows instead of model instances.
+        rows = FoodValuesSerializer.get_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(FoodValuesSerializer(page).data)
+        return Response(FoodValuesSerializer(rows.iterator(chunk_size=2000)).data)
 
 
 class FoodRetrieveUpdateDestroyAPIView(RetrieveUpdateDestroyAPIView):
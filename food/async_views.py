@@ -0,0 +1,64 @@
+"""
+Async read endpoints, served without tying up a worker thread when deployed with config.asgi.
+ORM work runs on the bounded pool from utils.aio.
+"""
+from django.db.models import F
+from django.http import JsonResponse
+
+from utils.aio import async_login_required, run_in_pool
+
+from .models import Food
+
+SEARCH_FIELDS = (
+    'id',
+    'slug',
+    'name',
+    'food_brand',
+    'data_value_measurement',
+    'energy',
+    'protein',
+    'carbohydrate',
+    'fat',
+)
+
+
+def _search(q, page, page_size):
+    queryset = Food.objects.summary().filter(active=True)
+    if q:
+        queryset = queryset.filter(name__icontains=q)
+    offset = (page - 1) * page_size
+    # Fetch one extra row to know if there is a next page without a COUNT query.
+    rows = list(queryset.order_by('name', 'brand__name').values(*SEARCH_FIELDS)[offset : offset + page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+
+def _autocomplete(q, limit):
+    return list(
+        Food.objects.filter(active=True, name__istartswith=q)
+        .order_by('name')
+        .values('id', 'slug', 'name', brand_name=F('brand__name'))[:limit]
+    )
+
+
+def _get_int(request, name, default, maximum):
+    try:
+        return min(max(int(request.GET.get(name, default)), 1), maximum)
+    except ValueError:
+        return default
+
+
+@async_login_required
+async def food_search_view(request):
+    page = _get_int(request, 'page', 1, 1000)
+    page_size = _get_int(request, 'page_size', 20, 100)
+    results, has_next = await run_in_pool(_search, request.GET.get('q', '').strip(), page, page_size)
+    return JsonResponse({'page': page, 'has_next': has_next, 'results': results})
+
+
+@async_login_required
+async def food_autocomplete_view(request):
+    q = request.GET.get('q', '').strip()
+    if len(q) < 2:
+        return JsonResponse({'results': []})
+    results = await run_in_pool(_autocomplete, q, _get_int(request, 'limit', 10, 25))
+    return JsonResponse({'results': results})
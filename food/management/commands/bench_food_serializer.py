@@ -0,0 +1,76 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from food.api.serializers import FoodSerializer, FoodValuesSerializer
+from food.models import Brand, Category, Food
+from utils.renderers import FastJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Compares rows/sec of FoodSerializer against the FoodValuesSerializer fast path.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help='Number of food rows to serialize.')
+        parser.add_argument('--repeat', type=int, default=3, help='Best of this many runs is reported.')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+
+        # All benchmark data is rolled back once the timings have been taken.
+        with transaction.atomic():
+            self.create_food(rows)
+            queryset = Food.objects.all()
+
+            def baseline():
+                return JSONRenderer().render(FoodSerializer(queryset.all(), many=True).data)
+
+            def fast_path():
+                data = FoodValuesSerializer(FoodValuesSerializer.get_rows(queryset.all()).iterator(chunk_size=2000)).data
+                return FastJSONRenderer().render(data)
+
+            baseline_time = self.best_of(baseline, repeat)
+            fast_time = self.best_of(fast_path, repeat)
+            transaction.set_rollback(True)
+
+        self.stdout.write(f'Rows: {rows}')
+        self.stdout.write(f'FoodSerializer:       {baseline_time:.3f}s, {rows / baseline_time:,.0f} rows/sec')
+        self.stdout.write(f'FoodValuesSerializer: {fast_time:.3f}s, {rows / fast_time:,.0f} rows/sec')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {baseline_time / fast_time:.1f}x'))
+
+    def create_food(self, rows):
+        brand = Brand.objects.create(name='Benchmark Brand')
+        category = Category.objects.create(name='Benchmark Category')
+        Food.objects.bulk_create(
+            (
+                Food(
+                    name=f'Benchmark Food {i}',
+                    slug=f'benchmark-food-{i}',
+                    brand=brand,
+                    category=category,
+                    data_value=100,
+                    data_measurement=Food.Measurement.GRAMS,
+                    energy=100 + i % 400,
+                    fat=i % 50,
+                    saturates=i % 20,
+                    carbohydrate=i % 80,
+                    sugars=i % 30,
+                    fibre=i % 10,
+                    protein=i % 40,
+                    salt=i % 3,
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
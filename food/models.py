@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import (
     Avg,
     Case,
@@ -123,4 +123,6 @@ class Food(Uuidable, Nutritionable, Authorable, Timestampable):
         if not self.slug:
             slug_str = f'{self.name} {self.brand} {self.serving}'
             self.slug = slugify(slug_str)
-        super().save(*args, **kwargs)
+        # Atomic so post_save receivers, such as the saved meal totals, update in the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
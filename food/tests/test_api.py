@@ -0,0 +1,44 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from food.api.serializers import FoodSerializer, FoodValuesSerializer
+from food.models import Brand, Category, Food
+
+
+class FoodValuesSerializerTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='user', email='testuser@email.com', password='test1pass2word3')
+        brand = Brand.objects.create(name='Tesco', description='Supermarket')
+        category = Category.objects.create(name='Generic', description='Generic category')
+        for name in ['Chicken Breast', 'Salmon Fillet']:
+            Food.objects.create(
+                name=name,
+                brand=brand,
+                category=category,
+                data_value=100,
+                data_measurement='g',
+                energy=105,
+                fat=1.5,
+                saturates=1,
+                carbohydrate=0,
+                sugars=0,
+                fibre=0,
+                protein=22.4,
+                salt=0.25,
+                user_created=self.user,
+            )
+
+    def test_output_matches_model_serializer(self):
+        queryset = Food.objects.all()
+        expected = json.loads(json.dumps(FoodSerializer(queryset, many=True).data, default=str))
+        actual = FoodValuesSerializer(FoodValuesSerializer.get_rows(queryset)).data
+        self.assertEqual(actual, expected)
+
+    def test_list_api(self):
+        self.client.login(username='user', password='test1pass2word3')
+        response = self.client.get(reverse('food:food_listcreate_api'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([food['name'] for food in response.json()], ['Chicken Breast', 'Salmon Fillet'])
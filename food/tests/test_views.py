@@ -1,7 +1,7 @@
 from unittest import skip
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import AsyncClient, TestCase, TransactionTestCase
 from django.urls import reverse
 
 from food.models import Brand, Category, Food
@@ -49,3 +49,52 @@ class FoodTests(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertContains(response, '')
     #     self.assertTemplateUsed(response, 'bs5_food/food_create.html')
+
+
+class FoodAsyncViewTests(TransactionTestCase):
+    # Async views query on the pool's own connections, which can't see a TestCase transaction.
+    def setUp(self):
+        get_user_model().objects.create_user(username='user', email='testuser@email.com', password='test1pass2word3')
+        brand = Brand.objects.create(name='Tesco', description='Supermarket')
+        category = Category.objects.create(name='Generic', description='Generic category')
+        for name, active in (('Chicken Breast', True), ('Chicken Thigh', True), ('Chickpeas', True), ('Chicken Wing', False)):
+            Food.objects.create(
+                name=name,
+                brand=brand,
+                category=category,
+                data_value=100,
+                data_measurement='g',
+                energy=105,
+                fat=1,
+                saturates=1,
+                carbohydrate=0,
+                sugars=0,
+                fibre=0,
+                protein=22,
+                salt=1,
+                active=active,
+            )
+        self.async_client.login(username='user', password='test1pass2word3')
+
+    async def test_search_pages(self):
+        response = await self.async_client.get(reverse('food:food_search_api'), {'q': 'chick', 'page_size': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['has_next'])
+        self.assertEqual([food['name'] for food in data['results']], ['Chicken Breast', 'Chicken Thigh'])
+        self.assertEqual(data['results'][0]['food_brand'], 'Tesco')
+
+        response = await self.async_client.get(reverse('food:food_search_api'), {'q': 'chick', 'page_size': 2, 'page': 2})
+        data = response.json()
+        self.assertFalse(data['has_next'])
+        self.assertEqual([food['name'] for food in data['results']], ['Chickpeas'])
+
+    async def test_autocomplete(self):
+        response = await self.async_client.get(reverse('food:food_autocomplete_api'), {'q': 'Chicken'})
+        self.assertEqual([food['name'] for food in response.json()['results']], ['Chicken Breast', 'Chicken Thigh'])
+        response = await self.async_client.get(reverse('food:food_autocomplete_api'), {'q': 'C'})
+        self.assertEqual(response.json(), {'results': []})
+
+    async def test_anonymous(self):
+        response = await AsyncClient().get(reverse('food:food_search_api'))
+        self.assertEqual(response.status_code, 403)
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 from .api import views as api_views
 
 app_name = 'food'
@@ -11,6 +11,8 @@ urlpatterns = [
         api_views.FoodRetrieveUpdateDestroyAPIView.as_view(),
         name='food_retrieveupdatedelete_api',
     ),
+    path('api/search/', async_views.food_search_view, name='food_search_api'),
+    path('api/autocomplete/', async_views.food_autocomplete_view, name='food_autocomplete_api'),
     # Food urls
     path('', views.FoodListView.as_view(), name='list'),
     path('create/', views.FoodCreateView.as_view(), name='create'),
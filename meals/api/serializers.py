@@ -0,0 +1,71 @@
+from rest_framework import serializers
+
+from ..models import Meal, MealItem, total_from_rows
+
+
+class MealItemSerializer(serializers.ModelSerializer):
+    """ Serializes rows from MealItemQuerySet.summary(). """
+
+    food_name = serializers.CharField(read_only=True)
+    brand_name = serializers.CharField(read_only=True)
+    serving_value = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    serving_measurement = serializers.CharField(read_only=True)
+    energy = serializers.IntegerField(read_only=True)
+    fat = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    saturates = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    carbohydrate = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    sugars = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    fibre = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    protein = serializers.DecimalField(max_digits=None, decimal_places=1, read_only=True)
+    salt = serializers.DecimalField(max_digits=None, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = MealItem
+        fields = [
+            'id',
+            'food',
+            'quantity',
+            'food_name',
+            'brand_name',
+            'serving_value',
+            'serving_measurement',
+            'energy',
+            'fat',
+            'saturates',
+            'carbohydrate',
+            'sugars',
+            'fibre',
+            'protein',
+            'salt',
+        ]
+
+
+class MealSerializer(serializers.ModelSerializer):
+    """
+    Serializes a meal with its items and totals.
+    Expects the items prefetched into `items`, see MealListAPIView.
+    """
+
+    items = MealItemSerializer(many=True, read_only=True)
+    total = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Meal
+        fields = [
+            'id',
+            'name',
+            'description',
+            'slug',
+            'datetime_created',
+            'datetime_updated',
+            'items',
+            'total',
+        ]
+
+    def get_total(self, obj):
+        return total_from_rows(obj.items)
+
+
+class MealItemWriteSerializer(serializers.Serializer):
+    food = serializers.UUIDField()
+    quantity = serializers.DecimalField(max_digits=4, decimal_places=2, min_value=0.01)
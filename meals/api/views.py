@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models import Prefetch
+from django.shortcuts import get_object_or_404
+from rest_framework import serializers
+from rest_framework.generics import ListAPIView, RetrieveAPIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from food.models import Food
+
+from ..models import Meal, MealItem, defer_meal_totals, mark_meal_totals
+from .serializers import MealItemWriteSerializer, MealSerializer
+
+
+class MealQuerySetMixin:
+    """
+    Limits meals to the current user and prefetches their summarised items,
+    so any number of meals is serialized with two queries.
+    """
+
+    def get_queryset(self):
+        return (
+            Meal.objects.filter(user=self.request.user)
+            .prefetch_related(
+                Prefetch('mealitem_set', queryset=MealItem.objects.summary().order_by('datetime_created'), to_attr='items')
+            )
+            .order_by('name')
+        )
+
+
+class MealListAPIView(MealQuerySetMixin, ListAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = MealSerializer
+
+
+class MealRetrieveAPIView(MealQuerySetMixin, RetrieveAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = MealSerializer
+
+
+class MealItemReplaceAPIView(MealQuerySetMixin, APIView):
+    """
+    Replaces the items of a meal with the submitted list of {"food", "quantity"} objects.
+    All food is validated with one query and the items are swapped in one transaction.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def put(self, request, pk):
+        serializer = MealItemWriteSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        items = serializer.validated_data
+
+        food_ids = {item['food'] for item in items}
+        found = set(Food.objects.filter(id__in=food_ids).values_list('id', flat=True))
+        missing = food_ids - found
+        if missing:
+            raise serializers.ValidationError({'food': [f'Food {food_id} does not exist.' for food_id in missing]})
+
+        with transaction.atomic(), defer_meal_totals():
+            # Locking the meal serialises concurrent replacements of the same item list.
+            meal = get_object_or_404(Meal.objects.select_for_update(), pk=pk, user=request.user)
+            MealItem.objects.filter(meal=meal).delete()
+            MealItem.objects.bulk_create(
+                [MealItem(meal=meal, food_id=item['food'], quantity=item['quantity']) for item in items]
+            )
+            mark_meal_totals(meal.pk)
+
+        return Response(MealSerializer(self.get_queryset().get(pk=meal.pk)).data)
@@ -1,5 +1,7 @@
+from decimal import Decimal
+
 from django import forms
-from django.forms import formset_factory, widgets
+from django.forms import BaseFormSet, formset_factory, widgets
 
 from .models import Meal, MealItem
 
@@ -27,6 +29,25 @@ class MealCreateForm(forms.ModelForm):
         return cleaned_data
 
 
+class MealScaleForm(forms.Form):
+    """ Portions of a saved meal, used to display or add the meal at e.g. 1.5x. """
+
+    scale = forms.DecimalField(
+        min_value=Decimal('0.25'),
+        max_value=10,
+        max_digits=4,
+        decimal_places=2,
+        required=False,
+        widget=forms.NumberInput(attrs={'class': 'form-control', 'step': '0.25', 'placeholder': '1'}),
+    )
+
+    def get_scale(self):
+        """ The valid scale, or 1 when blank or invalid, views display the form's errors. """
+        if self.is_valid() and self.cleaned_data['scale']:
+            return self.cleaned_data['scale']
+        return Decimal(1)
+
+
 class AddToMealForm(forms.ModelForm):
     class Meta:
         model = MealItem
@@ -53,4 +74,14 @@ class MealItemForm(forms.Form):
     )
 
 
-AddToMealFormSet = formset_factory(MealItemForm, extra=0)
+class BaseMealItemFormSet(BaseFormSet):
+    # Only checks if quantities are in any of the forms submitted
+    def clean(self):
+        if any(self.errors):
+            return
+
+        if not any(form.cleaned_data.get('quantity') for form in self.forms):
+            raise forms.ValidationError('You have not selected any food to add')
+
+
+AddToMealFormSet = formset_factory(MealItemForm, formset=BaseMealItemFormSet, extra=0)
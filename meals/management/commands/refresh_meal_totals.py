@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from meals.models import Meal
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the stored item count and nutrient totals of saved meals in bulk.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Meals updated per UPDATE statement.')
+        parser.add_argument('--user', help='Only refresh the meals of this username.')
+
+    def handle(self, *args, **options):
+        queryset = Meal.objects.order_by('pk')
+        if options['user']:
+            queryset = queryset.filter(user__username=options['user'])
+
+        chunk_size = options['chunk_size']
+        start = time.perf_counter()
+        updated = 0
+        last_pk = None
+        while True:
+            # Keyset pagination over the primary key keeps every chunk query cheap.
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            updated += Meal.objects.filter(pk__in=pks).refresh_totals()
+            last_pk = pks[-1]
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'Refreshed totals of {updated} meals in {elapsed:.1f}s'))
@@ -0,0 +1,83 @@
+# Generated by Django 3.1.6 on 2026-10-19 09:00
+
+from django.db import migrations, models
+from django.db.models import Count, ExpressionWrapper, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+NUTRIENT_FIELDS = ['energy', 'fat', 'saturates', 'carbohydrate', 'sugars', 'fibre', 'protein', 'salt']
+
+
+def populate_totals(apps, schema_editor):
+    Meal = apps.get_model('meals', 'Meal')
+    MealItem = apps.get_model('meals', 'MealItem')
+
+    def item_aggregate(aggregate, output_field):
+        subquery = MealItem.objects.filter(meal=OuterRef('pk')).order_by().values('meal').annotate(value=aggregate).values('value')
+        return Coalesce(Subquery(subquery, output_field=output_field), 0)
+
+    Meal.objects.update(
+        item_count=item_aggregate(Count('id'), models.IntegerField()),
+        **{
+            field: item_aggregate(
+                Sum(ExpressionWrapper(F('quantity') * F(f'food__{field}'), output_field=models.DecimalField())),
+                models.DecimalField(),
+            )
+            for field in NUTRIENT_FIELDS
+        },
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meals', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='meal',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='energy',
+            field=models.IntegerField(default=0, editable=False, verbose_name='calories (kcal)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='fat',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='fat (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='saturates',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='saturates (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='carbohydrate',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='carbohydrate (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='sugars',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='sugars (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='fibre',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='fibre (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='protein',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='protein (g)'),
+        ),
+        migrations.AddField(
+            model_name='meal',
+            name='salt',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=7, verbose_name='salt (g)'),
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
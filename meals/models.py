@@ -1,5 +1,9 @@
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.db.models import (
     Avg,
     Case,
@@ -7,12 +11,16 @@ from django.db.models import (
     ExpressionWrapper,
     F,
     Func,
+    OuterRef,
+    Subquery,
     Sum,
     Value,
     When,
     Window,
 )
 from django.db.models.functions import Coalesce, Concat, Round
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils.text import slugify
 
@@ -20,9 +28,82 @@ from food.models import Food
 from utils.behaviours import Timestampable, Uuidable
 
 
+NUTRIENT_FIELDS = ['energy', 'fat', 'saturates', 'carbohydrate', 'sugars', 'fibre', 'protein', 'salt']
+
+_deferred_totals = threading.local()
+
+
+@contextmanager
+def defer_meal_totals():
+    """
+    Collects the meals whose items change inside the block and refreshes their
+    stored totals once on exit, instead of once per changed item.
+    Use around bulk changes, calling mark_meal_totals() for bulk_create and
+    queryset update() which do not send signals. Nothing is refreshed if the block
+    raises, so use it inside transaction.atomic() to roll the changes back too.
+    """
+    if getattr(_deferred_totals, 'meal_ids', None) is not None:
+        # Nested blocks are refreshed with the outermost one.
+        yield
+        return
+    _deferred_totals.meal_ids = set()
+    try:
+        yield
+        meal_ids = _deferred_totals.meal_ids
+    finally:
+        _deferred_totals.meal_ids = None
+    if meal_ids:
+        Meal.objects.filter(pk__in=meal_ids).refresh_totals()
+
+
+def mark_meal_totals(*meal_ids):
+    """ Refreshes the stored totals of the meals now, or at the end of a defer_meal_totals() block. """
+    deferred = getattr(_deferred_totals, 'meal_ids', None)
+    if deferred is not None:
+        deferred.update(meal_ids)
+    else:
+        Meal.objects.filter(pk__in=meal_ids).refresh_totals()
+
+
 class MealQuerySet(models.QuerySet):
     def summary(self):
-        return self.annotate(item_count=Count('mealitem'))
+        """
+        Exposes the stored meal totals under the total_ names used by the diary and templates.
+        The totals are maintained by refresh_totals(), so this needs no join.
+        """
+        return self.annotate(
+            total_energy=F('energy'),
+            total_protein=F('protein'),
+            total_carbohydrate=F('carbohydrate'),
+            total_fat=F('fat'),
+        )
+
+    def refresh_totals(self):
+        """
+        Recomputes the stored item count and nutrient totals of the meals with one
+        UPDATE, using a grouped subquery over MealItem x Food per column.
+        """
+
+        def item_aggregate(aggregate, output_field):
+            subquery = (
+                MealItem.objects.filter(meal=OuterRef('pk'))
+                .order_by()
+                .values('meal')
+                .annotate(value=aggregate)
+                .values('value')
+            )
+            return Coalesce(Subquery(subquery, output_field=output_field), 0)
+
+        def item_sum(field):
+            return item_aggregate(
+                Sum(ExpressionWrapper(F('quantity') * F(f'food__{field}'), output_field=models.DecimalField())),
+                models.DecimalField(),
+            )
+
+        return self.update(
+            item_count=item_aggregate(Count('id'), models.IntegerField()),
+            **{field: item_sum(field) for field in NUTRIENT_FIELDS},
+        )
 
 
 class Meal(Uuidable, Timestampable):
@@ -31,6 +112,19 @@ class Meal(Uuidable, Timestampable):
     description = models.TextField(max_length=1000, null=True, blank=True, help_text='Optional.')
     slug = models.SlugField(max_length=255, unique=True)
 
+    # Totals of the meal's items, maintained by MealQuerySet.refresh_totals() when items or their food change.
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+    energy = models.IntegerField(verbose_name='calories (kcal)', default=0, editable=False)
+    fat = models.DecimalField(verbose_name='fat (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+    saturates = models.DecimalField(verbose_name='saturates (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+    carbohydrate = models.DecimalField(
+        verbose_name='carbohydrate (g)', max_digits=7, decimal_places=2, default=0, editable=False
+    )
+    sugars = models.DecimalField(verbose_name='sugars (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+    fibre = models.DecimalField(verbose_name='fibre (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+    protein = models.DecimalField(verbose_name='protein (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+    salt = models.DecimalField(verbose_name='salt (g)', max_digits=7, decimal_places=2, default=0, editable=False)
+
     objects = MealQuerySet.as_manager()
 
     class Meta:
@@ -66,8 +160,16 @@ class Round2(Func):
 
 
 class MealItemQuerySet(models.QuerySet):
-    def summary(self):
+    def summary(self, scale=1):
+        """
+        Annotates each item with its serving and nutrient values. A `scale` other
+        than 1 multiplies the quantity in the query, e.g. the meal at 1.5 portions.
+        """
+        quantity = F('quantity')
+        if scale != 1:
+            quantity = ExpressionWrapper(quantity * Value(Decimal(str(scale))), output_field=models.DecimalField())
         return self.select_related('food', 'meal').annotate(
+            scaled_quantity=quantity,
             food_name=F('food__name'),
             brand_name=F('food__brand__name'),
             data_measurement=F('food__data_measurement'),
@@ -78,7 +180,7 @@ class MealItemQuerySet(models.QuerySet):
                     data_measurement='g',
                     then=Round(
                         ExpressionWrapper(
-                            F('quantity') * F('food__data_value'),
+                            quantity * F('food__data_value'),
                             output_field=models.DecimalField(),
                         )
                     ),
@@ -87,7 +189,7 @@ class MealItemQuerySet(models.QuerySet):
                     data_measurement='ml',
                     then=Round(
                         ExpressionWrapper(
-                            F('quantity') * F('food__data_value'),
+                            quantity * F('food__data_value'),
                             output_field=models.DecimalField(),
                         )
                     ),
@@ -96,7 +198,7 @@ class MealItemQuerySet(models.QuerySet):
                     data_measurement='srv',
                     then=Round1(
                         ExpressionWrapper(
-                            F('quantity') * F('food__data_value'),
+                            quantity * F('food__data_value'),
                             output_field=models.DecimalField(),
                         )
                     ),
@@ -111,14 +213,14 @@ class MealItemQuerySet(models.QuerySet):
                 default=Value(''),
                 output_field=models.CharField(),
             ),
-            energy=ExpressionWrapper(F('quantity') * F('food__energy'), output_field=models.IntegerField()),
-            fat=F('quantity') * F('food__fat'),
-            saturates=F('quantity') * F('food__saturates'),
-            carbohydrate=F('quantity') * F('food__carbohydrate'),
-            sugars=F('quantity') * F('food__sugars'),
-            fibre=F('quantity') * F('food__fibre'),
-            protein=F('quantity') * F('food__protein'),
-            salt=F('quantity') * F('food__salt'),
+            energy=ExpressionWrapper(quantity * F('food__energy'), output_field=models.IntegerField()),
+            fat=quantity * F('food__fat'),
+            saturates=quantity * F('food__saturates'),
+            carbohydrate=quantity * F('food__carbohydrate'),
+            sugars=quantity * F('food__sugars'),
+            fibre=quantity * F('food__fibre'),
+            protein=quantity * F('food__protein'),
+            salt=quantity * F('food__salt'),
             sodium=F('salt') * 400,
         )
 
@@ -136,6 +238,38 @@ class MealItemQuerySet(models.QuerySet):
         )
 
 
+def total_from_rows(rows):
+    """
+    Reduces rows from MealItemQuerySet.summary() to the same totals as
+    MealItemQuerySet.total(), for when the rows have already been fetched.
+    """
+    total = dict.fromkeys(
+        [
+            'total_energy',
+            'total_fat',
+            'total_saturates',
+            'total_carbohydrate',
+            'total_sugars',
+            'total_fibre',
+            'total_protein',
+            'total_salt',
+            'total_sodium',
+        ],
+        0,
+    )
+    for row in rows:
+        total['total_energy'] += row.energy
+        total['total_fat'] += row.fat
+        total['total_saturates'] += row.saturates
+        total['total_carbohydrate'] += row.carbohydrate
+        total['total_sugars'] += row.sugars
+        total['total_fibre'] += row.fibre
+        total['total_protein'] += row.protein
+        total['total_salt'] += row.salt
+        total['total_sodium'] += row.sodium
+    return total
+
+
 class MealItem(Uuidable, Timestampable):
     meal = models.ForeignKey(Meal, on_delete=models.CASCADE)
     food = models.ForeignKey(Food, on_delete=models.CASCADE)
@@ -150,5 +284,64 @@ class MealItem(Uuidable, Timestampable):
     def __str__(self):
         return f'{self.food.name} of {self.meal.name}'
 
+    def save(self, *args, **kwargs):
+        # The post_save signal refreshes the meal's stored totals within the same transaction.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('meals:item_list', kwargs={'pk': self.meal.id})
+
+
+def _deleting():
+    """ The meals and foods being deleted on this thread, between their pre_delete and post_delete signals. """
+    if not hasattr(_deferred_totals, 'deleting'):
+        _deferred_totals.deleting = {Meal: set(), Food: {}}
+    return _deferred_totals.deleting
+
+
+@receiver(post_save, sender=MealItem)
+@receiver(post_delete, sender=MealItem)
+def update_meal_totals(sender, instance, signal, **kwargs):
+    # Keeps the stored totals of the item's meal current. Saves and deletes are atomic, so this
+    # runs in the same transaction as the change.
+    if signal is post_delete:
+        deleting = _deleting()
+        # Items are deleted before the meal or food they cascade from, so a deleted meal needs
+        # no refresh and a deleted food's meals are refreshed once after it.
+        if instance.meal_id in deleting[Meal]:
+            return
+        if instance.food_id in deleting[Food]:
+            deleting[Food][instance.food_id].add(instance.meal_id)
+            return
+    mark_meal_totals(instance.meal_id)
+
+
+@receiver(pre_delete, sender=Meal)
+def start_meal_delete(sender, instance, **kwargs):
+    _deleting()[Meal].add(instance.pk)
+
+
+@receiver(post_delete, sender=Meal)
+def finish_meal_delete(sender, instance, **kwargs):
+    _deleting()[Meal].discard(instance.pk)
+
+
+@receiver(pre_delete, sender=Food)
+def start_food_delete(sender, instance, **kwargs):
+    _deleting()[Food][instance.pk] = set()
+
+
+@receiver(post_delete, sender=Food)
+def finish_food_delete(sender, instance, **kwargs):
+    # Refreshes every meal which lost items with the food in one query.
+    meal_ids = _deleting()[Food].pop(instance.pk, None)
+    if meal_ids:
+        mark_meal_totals(*meal_ids)
+
+
+@receiver(post_save, sender=Food)
+def update_meal_totals_for_food(sender, instance, created, **kwargs):
+    # A change to a food's nutrients changes the totals of every meal containing it.
+    if not created:
+        Meal.objects.filter(id__in=MealItem.objects.filter(food=instance).values('meal')).refresh_totals()
@@ -1,3 +1,327 @@
+import datetime
+import io
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from diaries.models import Diary
+from food.models import Brand, Category, Food
+
+from .forms import AddToMealFormSet
+from .models import Meal, MealItem, MealQuerySet, defer_meal_totals, mark_meal_totals
+
+
+class MealTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        brand = Brand.objects.create(name='Tesco')
+        category = Category.objects.create(name='Generic')
+        cls.chicken = Food.objects.create(
+            name='Chicken Breast',
+            brand=brand,
+            category=category,
+            data_value=100,
+            data_measurement='g',
+            energy=105,
+            fat=1,
+            saturates=1,
+            carbohydrate=0,
+            sugars=0,
+            fibre=0,
+            protein=22,
+            salt=1,
+        )
+        cls.rice = Food.objects.create(
+            name='Rice',
+            brand=brand,
+            category=category,
+            data_value=100,
+            data_measurement='g',
+            energy=130,
+            fat=0.3,
+            saturates=0.1,
+            carbohydrate=28,
+            sugars=0.1,
+            fibre=0.4,
+            protein=2.7,
+            salt=0,
+        )
+
+    def create_meal(self, name, user=None):
+        meal = Meal.objects.create(user=user or self.user, name=name)
+        MealItem.objects.create(meal=meal, food=self.chicken, quantity=2)
+        MealItem.objects.create(meal=meal, food=self.rice, quantity=1.5)
+        return meal
+
+
+class MealAPITests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_meal_list_api_constant_queries(self):
+        self.create_meal('Meal 1')
+        with CaptureQueriesContext(connection) as one_meal:
+            self.client.get(reverse('meals:meal_list_api'))
+        for i in range(2, 6):
+            self.create_meal(f'Meal {i}')
+        with CaptureQueriesContext(connection) as five_meals:
+            response = self.client.get(reverse('meals:meal_list_api'))
+        self.assertEqual(len(response.json()), 5)
+        self.assertEqual(len(one_meal), len(five_meals))
+
+    def test_meal_list_api_totals(self):
+        self.create_meal('Meal 1')
+        response = self.client.get(reverse('meals:meal_list_api'))
+        meal = response.json()[0]
+        self.assertEqual(len(meal['items']), 2)
+        self.assertEqual(meal['total']['total_energy'], 405)
+
+    def test_meal_item_replace_api(self):
+        meal = self.create_meal('Meal 1')
+        response = self.client.put(
+            reverse('meals:meal_item_replace_api', kwargs={'pk': meal.pk}),
+            [{'food': str(self.rice.pk), 'quantity': '3'}],
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(meal.mealitem_set.values_list('food', 'quantity')), [(self.rice.pk, 3)])
+
+    def test_meal_item_replace_api_other_user(self):
+        other = get_user_model().objects.create_user(username='other', email='other@email.com', password='password')
+        meal = self.create_meal('Meal 1', user=other)
+        response = self.client.put(
+            reverse('meals:meal_item_replace_api', kwargs={'pk': meal.pk}),
+            [{'food': str(self.rice.pk), 'quantity': '3'}],
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(meal.mealitem_set.count(), 2)
+
+
+class MealItemListViewTests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_meal_item_list_view_single_query(self):
+        meal = self.create_meal('Meal 1')
+        url = reverse('meals:item_list', kwargs={'pk': meal.pk})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        meal_queries = [query for query in queries if 'meals_mealitem' in query['sql'] or 'meals_meal' in query['sql']]
+        self.assertEqual(len(meal_queries), 1)
+        self.assertEqual(response.context['object'], meal)
+        self.assertEqual(response.context['total']['total_energy'], 405)
+
+    def test_meal_item_list_view_scaled(self):
+        meal = self.create_meal('Meal 1')
+        response = self.client.get(reverse('meals:item_list', kwargs={'pk': meal.pk}), {'scale': '1.5'})
+        self.assertEqual(response.context['total']['total_protein'], Decimal('72.075'))
+        self.assertEqual(
+            sorted(row.scaled_quantity for row in response.context['object_list']), [Decimal('2.25'), Decimal('3.00')]
+        )
+
+    def test_add_saved_meal_scaled(self):
+        meal = self.create_meal('Meal 1')
+        date = datetime.date(2021, 3, 1)
+        count = Diary.objects.add_saved_meals(self.user, date, [(meal.pk, Diary.Meal.MEAL1, Decimal('1.5'))])
+        self.assertEqual(count, 2)
+        self.assertEqual(
+            sorted(Diary.objects.filter(user=self.user, date=date).values_list('quantity', flat=True)),
+            [Decimal('2.25'), Decimal('3.00')],
+        )
+
+    def test_meal_item_list_view_invalid_scale(self):
+        meal = self.create_meal('Meal 1')
+        response = self.client.get(reverse('meals:item_list', kwargs={'pk': meal.pk}), {'scale': '20'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('scale', response.context['scale_form'].errors)
+        self.assertEqual(response.context['total']['total_energy'], 405)
+
+    def test_add_saved_meal_quantity_limit(self):
+        meal = Meal.objects.create(user=self.user, name='Bulk')
+        MealItem.objects.create(meal=meal, food=self.rice, quantity=12)
+        date = datetime.date(2021, 3, 1)
+        with self.assertRaisesMessage(ValidationError, 'at most 99.99'):
+            Diary.objects.add_saved_meals(self.user, date, [(meal.pk, Diary.Meal.MEAL1, Decimal('10'))])
+        self.assertFalse(Diary.objects.filter(user=self.user, date=date).exists())
+
+    def test_meal_item_list_view_empty_meal(self):
+        meal = Meal.objects.create(user=self.user, name='Empty')
+        response = self.client.get(reverse('meals:item_list', kwargs={'pk': meal.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total']['total_energy'], 0)
+
+
+class MealItemCreateMultipleViewTests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+        self.meal = Meal.objects.create(user=self.user, name='Meal 1')
+        # Food is listed by name, chicken then rice.
+        self.url = reverse('meals:meal_add_multiple', kwargs={'meal_id': self.meal.pk})
+
+    def post(self, *quantities):
+        data = {'form-TOTAL_FORMS': len(quantities), 'form-INITIAL_FORMS': len(quantities)}
+        data.update({f'form-{i}-quantity': quantity for i, quantity in enumerate(quantities)})
+        return self.client.post(self.url, data)
+
+    def test_adds_rows_with_quantities(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post('2', '')
+        self.assertRedirects(response, self.meal.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(list(self.meal.mealitem_set.values_list('food', 'quantity')), [(self.chicken.pk, 2)])
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "meals_mealitem"')]
+        self.assertEqual(len(inserts), 1)
+        self.meal.refresh_from_db()
+        self.assertEqual((self.meal.item_count, self.meal.energy), (1, 210))
+
+    def test_blank_rows(self):
+        response = self.post('', '0')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['formset'].non_form_errors(), ['You have not selected any food to add'])
+        self.assertFalse(self.meal.mealitem_set.exists())
+
+    def test_invalid_quantity(self):
+        response = self.post('2', '-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('quantity', response.context['formset'].forms[1].errors)
+        self.assertFalse(self.meal.mealitem_set.exists())
+
+    def test_food_ids_from_page(self):
+        # The id fields are disabled, posted ids are ignored in favour of the listed food.
+        data = {'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': str(self.rice.pk), 'form-0-quantity': '1'}
+        formset = AddToMealFormSet(data=data, initial=[{'id': self.chicken.pk}])
+        self.assertTrue(formset.is_valid())
+        self.assertEqual(formset.cleaned_data, [{'id': self.chicken.pk, 'quantity': Decimal('1')}])
+
+
+class MealListViewTests(MealTestCase):
+    def test_meal_summary_totals(self):
+        self.create_meal('Meal 1')
+        Meal.objects.create(user=self.user, name='Empty')
+        meals = {meal.name: meal for meal in Meal.objects.filter(user=self.user).summary()}
+        self.assertEqual(meals['Meal 1'].item_count, 2)
+        self.assertEqual(meals['Meal 1'].total_energy, 405)
+        self.assertEqual(meals['Meal 1'].total_protein, Decimal('48.05'))
+        self.assertEqual(meals['Empty'].item_count, 0)
+        self.assertEqual(meals['Empty'].total_energy, 0)
+
+    def test_meal_list_view_single_query(self):
+        for i in range(5):
+            self.create_meal(f'Meal {i}')
+        self.client.login(username='user', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('meals:list'))
+        self.assertEqual(len(response.context['object_list']), 5)
+        self.assertEqual(len([query for query in queries if 'meals_meal' in query['sql']]), 1)
+
+
+class MealOwnershipViewTests(MealTestCase):
+    def setUp(self):
+        self.client.login(username='user', password='password')
+        self.meal = self.create_meal('Meal 1')
+
+    def test_meal_add_food_loads_meal_once(self):
+        url = reverse('meals:meal_add_2', kwargs={'meal_id': self.meal.pk, 'food_id': self.chicken.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.context['meal'], self.meal)
+        self.assertEqual(len([query for query in queries if 'FROM "meals_meal"' in query['sql']]), 1)
+
+    def test_meal_item_delete_loads_item_once(self):
+        item = self.meal.mealitem_set.first()
+        url = reverse('meals:item_delete', kwargs={'pk': item.pk})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url)
+        self.assertRedirects(response, reverse('meals:item_list', kwargs={'pk': self.meal.pk}), fetch_redirect_response=False)
+        self.assertFalse(MealItem.objects.filter(pk=item.pk).exists())
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('SELECT') and 'FROM "meals_mealitem"' in query['sql']]), 1)
+
+    def test_other_user_forbidden(self):
+        other = get_user_model().objects.create_user(username='other', email='other@email.com', password='password')
+        meal = self.create_meal('Other', user=other)
+        response = self.client.get(reverse('meals:meal_add_1', kwargs={'meal_id': meal.pk}))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(reverse('meals:delete', kwargs={'pk': meal.pk}))
+        self.assertEqual(response.status_code, 403)
+        self.assertTrue(Meal.objects.filter(pk=meal.pk).exists())
+
+
+class MealTotalsTests(MealTestCase):
+    def assertTotals(self, meal, item_count, energy, protein):
+        meal.refresh_from_db()
+        self.assertEqual((meal.item_count, meal.energy, meal.protein), (item_count, energy, Decimal(protein)))
+
+    def test_item_changes(self):
+        meal = self.create_meal('Meal 1')
+        self.assertTotals(meal, 2, 405, '48.05')
+        item = meal.mealitem_set.get(food=self.chicken)
+        item.quantity = 1
+        item.save()
+        self.assertTotals(meal, 2, 300, '26.05')
+        item.delete()
+        self.assertTotals(meal, 1, 195, '4.05')
+
+    def test_food_change(self):
+        meal = self.create_meal('Meal 1')
+        self.chicken.energy = 110
+        self.chicken.save()
+        self.assertTotals(meal, 2, 415, '48.05')
+
+    def test_deferred_refreshes_once(self):
+        meal = Meal.objects.create(user=self.user, name='Meal 1')
+        with mock.patch.object(MealQuerySet, 'refresh_totals', autospec=True) as refresh_totals:
+            with defer_meal_totals():
+                MealItem.objects.create(meal=meal, food=self.chicken, quantity=2)
+                with defer_meal_totals():
+                    MealItem.objects.create(meal=meal, food=self.rice, quantity=1.5)
+                refresh_totals.assert_not_called()
+        refresh_totals.assert_called_once()
+        self.assertEqual(list(refresh_totals.call_args[0][0]), [meal])
+
+    def test_deferred_skipped_on_error(self):
+        meal = Meal.objects.create(user=self.user, name='Meal 1')
+        with mock.patch.object(MealQuerySet, 'refresh_totals', autospec=True) as refresh_totals:
+            with self.assertRaises(ZeroDivisionError):
+                with defer_meal_totals():
+                    mark_meal_totals(meal.pk)
+                    1 / 0
+            refresh_totals.assert_not_called()
+        # The block is reset, so totals are refreshed straight away again.
+        MealItem.objects.create(meal=meal, food=self.chicken, quantity=2)
+        self.assertTotals(meal, 1, 210, '44')
+
+    def test_cascades_refresh_once(self):
+        meal = self.create_meal('Meal 1')
+        other = self.create_meal('Meal 2')
+        with mock.patch.object(MealQuerySet, 'refresh_totals', autospec=True) as refresh_totals:
+            meal.delete()
+            refresh_totals.assert_not_called()
+            # Fresh instances, as deleting sets the pk of the shared test data to None.
+            Food.objects.get(pk=self.chicken.pk).delete()
+        refresh_totals.assert_called_once()
+        self.assertEqual(list(refresh_totals.call_args[0][0]), [other])
+        Food.objects.get(pk=self.rice.pk).delete()
+        self.assertTotals(other, 0, 0, '0')
+
+    def test_refresh_command(self):
+        meal = self.create_meal('Meal 1')
+        Meal.objects.update(item_count=0, energy=0, protein=0)
+        call_command('refresh_meal_totals', chunk_size=1, stdout=io.StringIO())
+        self.assertTotals(meal, 2, 405, '48.05')
 
-# Create your tests here.
+    def test_migration_backfill(self):
+        meal = self.create_meal('Meal 1')
+        Meal.objects.update(item_count=0, energy=0, protein=0)
+        import_module('meals.migrations.0002_meal_totals').populate_totals(apps, None)
+        self.assertTotals(meal, 2, 405, '48.05')
@@ -1,9 +1,13 @@
 from django.urls import path
 
 from . import views
+from .api import views as api_views
 
 app_name = 'meals'
 urlpatterns = [
+    path('api/', api_views.MealListAPIView.as_view(), name='meal_list_api'),
+    path('api/<uuid:pk>/', api_views.MealRetrieveAPIView.as_view(), name='meal_retrieve_api'),
+    path('api/<uuid:pk>/items/', api_views.MealItemReplaceAPIView.as_view(), name='meal_item_replace_api'),
     path('', views.MealListView.as_view(), name='list'),
     path('create/', views.MealCreateView.as_view(), name='create'),
     path(
@@ -11,6 +15,11 @@ urlpatterns = [
         views.MealItemCreateStep1View.as_view(),
         name='meal_add_1',
     ),
+    path(
+        '<uuid:meal_id>/add-multiple-food/',
+        views.MealItemCreateMultipleView.as_view(),
+        name='meal_add_multiple',
+    ),
     path(
         '<uuid:meal_id>/add/<uuid:food_id>/',
         views.MealItemCreateStep2View.as_view(),
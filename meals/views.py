@@ -1,18 +1,22 @@
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
+from django.core.paginator import Paginator
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.views.generic import CreateView, FormView, ListView, TemplateView, View
 from django.views.generic.detail import DetailView
 from django.views.generic.edit import DeleteView
 
+from diaries.mixins import FoodFilterMixin as FoodFormsetFilterMixin
 from food.forms import FoodFilterForm
 from food.mixins import FoodFilterMixin
 from food.models import Food
+from utils.mixins import OwnedObjectMixin
 
-from .forms import AddToMealForm, MealCreateForm
-from .models import Meal, MealItem
+from .forms import AddToMealForm, AddToMealFormSet, MealCreateForm, MealScaleForm
+from .models import Meal, MealItem, defer_meal_totals, mark_meal_totals, total_from_rows
 
 
 class MealListView(LoginRequiredMixin, ListView):
@@ -36,40 +40,36 @@ class MealCreateView(LoginRequiredMixin, CreateView):
         return super().form_valid(form)
 
     def get_success_url(self):
-        return reverse('meals:meal_add_1', kwargs={'meal_id': self.object.pk})
+        return reverse('meals:meal_add_multiple', kwargs={'meal_id': self.object.pk})
 
 
-class MealItemCreateStep1View(LoginRequiredMixin, UserPassesTestMixin, FoodFilterMixin, ListView):
+class MealItemCreateStep1View(LoginRequiredMixin, OwnedObjectMixin, FoodFilterMixin, ListView):
     """ Step 2: Find food to add to the meal. """
 
     model = Food
     template_name = 'meals/meal_add_1.html'
     paginate_by = 20
-
-    def test_func(self):
-        meal = get_object_or_404(Meal, id=self.kwargs.get('meal_id'))
-        return meal.user == self.request.user
+    owned_model = Meal
+    owned_url_kwarg = 'meal_id'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['form'] = FoodFilterForm(self.request.GET)
-        context['meal'] = get_object_or_404(Meal, id=self.kwargs.get('meal_id'))
+        context['meal'] = self.get_owned_object()
         return context
 
 
-class MealItemCreateStep2View(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+class MealItemCreateStep2View(LoginRequiredMixin, OwnedObjectMixin, TemplateView):
     """ Step 3: Display food details and render form to enable user to add food to the meal. """
 
     template_name = 'meals/meal_add_2.html'
-
-    def test_func(self):
-        meal = get_object_or_404(Meal, id=self.kwargs.get('meal_id'))
-        return meal.user == self.request.user
+    owned_model = Meal
+    owned_url_kwarg = 'meal_id'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['food'] = get_object_or_404(Food, id=self.kwargs.get('food_id'))
-        context['meal'] = get_object_or_404(Meal, id=self.kwargs.get('meal_id'))
+        context['meal'] = self.get_owned_object()
         context['form'] = AddToMealForm(self.request.POST or None)
         return context
 
@@ -84,34 +84,72 @@ class MealItemCreateStep2View(LoginRequiredMixin, UserPassesTestMixin, TemplateV
         return self.render_to_response(context)
 
 
-class MealDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class MealItemCreateMultipleView(LoginRequiredMixin, OwnedObjectMixin, FoodFormsetFilterMixin, TemplateView):
+    """
+    Step 2: Find food and add several to the meal at once via formset, as the diary does.
+    The food ids in the formset are disabled fields taken from the one filtered food
+    page query, so every submitted food is validated by that query, and all items
+    are written with one bulk_create.
+    """
+
+    template_name = 'meals/meal_add_multiple.html'
+    owned_model = Meal
+    owned_url_kwarg = 'meal_id'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        paginator = Paginator(context['queryset'], 20)  # FoodFilterMixin
+        page_obj = paginator.get_page(self.request.GET.get('page'))
+        context['page_obj'] = page_obj
+        context['formset'] = AddToMealFormSet(data=self.request.POST or None, initial=page_obj)
+        context['meal'] = self.get_owned_object()
+        return context
+
+    def post(self, request, *args, **kwargs):
+        context = self.get_context_data(**kwargs)
+        meal = context['meal']
+        if context['formset'].is_valid():
+            items = [
+                MealItem(meal=meal, food_id=form['id'], quantity=form['quantity'])
+                for form in context['formset'].cleaned_data
+                if form.get('quantity')
+            ]
+            with transaction.atomic():
+                MealItem.objects.bulk_create(items)
+                mark_meal_totals(meal.pk)
+            messages.success(request, f'Added {len(items)} food to {meal.name}')
+
+            if 'another' in request.POST:
+                return redirect('meals:meal_add_multiple', meal_id=meal.pk)
+            return redirect(meal.get_absolute_url())
+
+        return self.render_to_response(context)
+
+
+class MealDeleteView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     """ Delete a meal and return user to meal list view. """
 
     model = Meal
     success_url = reverse_lazy('meals:list')
 
-    def test_func(self):
-        obj = self.get_object()
-        return obj.user == self.request.user
-
     def delete(self, request, *args, **kwargs):
         obj = self.get_object()
         messages.success(self.request, f'Deleted Meal {obj.name}')
-        return super().delete(request, *args, **kwargs)
+        # Skips refreshing the totals of the deleted meal once per cascaded item.
+        with defer_meal_totals():
+            return super().delete(request, *args, **kwargs)
 
 
-class MealItemDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class MealItemDeleteView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     """ Delete a food from meal and return user to the meal detail view of the deleted food. """
 
     model = MealItem
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.meal.user == self.request.user
+    owned_select_related = ('meal', 'food')
+    owner_field = 'meal__user'
 
     def get_success_url(self):
         obj = self.get_object()
-        return reverse('meals:item_list', kwargs={'pk': obj.meal.pk})
+        return reverse('meals:item_list', kwargs={'pk': obj.meal_id})
 
     def delete(self, request, *args, **kwargs):
         obj = self.get_object()
@@ -120,13 +158,28 @@ class MealItemDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
 
 
 class MealItemListView(ListView):
+    """
+    Displays the food in a meal with its totals.
+    The rows, meal and totals all come from the one summary() query, the totals
+    are reduced from the fetched rows and the meal is taken from the first row's
+    select_related meal. Only an empty meal needs a second query.
+    ?scale=1.5 displays the meal at 1.5 portions, scaled in the same query.
+    """
+
     def get_queryset(self):
-        return MealItem.objects.filter(meal=self.kwargs.get('pk')).summary()
+        self.scale_form = MealScaleForm(self.request.GET or None)
+        return MealItem.objects.filter(meal=self.kwargs.get('pk')).summary(scale=self.scale_form.get_scale())
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['object'] = get_object_or_404(Meal, id=self.kwargs.get('pk'))
-        context['total'] = self.get_queryset().total()
+        context['scale_form'] = self.scale_form
+        # Evaluates and caches the queryset, the template iterates the cached rows.
+        object_list = context['object_list']
+        context['total'] = total_from_rows(object_list)
+        if object_list:
+            context['object'] = object_list[0].meal
+        else:
+            context['object'] = get_object_or_404(Meal, id=self.kwargs.get('pk'))
         return context
 
 
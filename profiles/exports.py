@@ -0,0 +1,170 @@
+"""
+Full account data export.
+Each dataset is read with a server-side cursor (QuerySet.iterator) and written
+to disk as it is read, so memory use is constant however many rows a user has.
+The export is built in the background pool into a temporary file which is
+renamed into place once complete.
+"""
+import csv
+import io
+import os
+import time
+import zipfile
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from diaries.models import Diary
+from meals.models import Meal, MealItem
+from progress.models import Progress
+from utils.tasks import submit
+
+from .models import Profile
+
+CHUNK_SIZE = 2000
+STALE_BUILD_SECONDS = 60 * 60
+
+FORMATS = {
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'csv': ('zip', 'application/zip'),
+}
+
+PROFILE_FIELDS = [
+    'sex',
+    'height',
+    'weight',
+    'date_of_birth',
+    'activity_level',
+    'goal_weight',
+    'goal',
+    'calculation_method',
+    'energy',
+    'fat',
+    'saturates',
+    'carbohydrate',
+    'sugars',
+    'fibre',
+    'protein',
+    'salt',
+    'protein_pct',
+    'carbohydrate_pct',
+    'fat_pct',
+]
+DIARY_FIELDS = [
+    'date',
+    'meal',
+    'food_name',
+    'brand_name',
+    'quantity',
+    'data_value',
+    'data_measurement',
+    'energy',
+    'fat',
+    'saturates',
+    'carbohydrate',
+    'sugars',
+    'fibre',
+    'protein',
+    'salt',
+]
+PROGRESS_FIELDS = ['date', 'weight', 'notes', 'image']
+MEAL_FIELDS = ['id', 'name', 'description', 'datetime_created']
+MEAL_ITEM_FIELDS = ['meal_id', 'meal__name', 'food__name', 'food__brand__name', 'quantity']
+
+
+def get_datasets(user):
+    """ Returns (name, fields, values queryset) for every dataset in the export. """
+    return [
+        ('profile', PROFILE_FIELDS, Profile.objects.filter(user=user).values(*PROFILE_FIELDS)),
+        (
+            'diary',
+            DIARY_FIELDS,
+            Diary.objects.filter(user=user).summary().order_by('date', 'meal', 'datetime_created').values(*DIARY_FIELDS),
+        ),
+        ('progress', PROGRESS_FIELDS, Progress.objects.filter(user=user).order_by('date').values(*PROGRESS_FIELDS)),
+        ('meals', MEAL_FIELDS, Meal.objects.filter(user=user).order_by('name').values(*MEAL_FIELDS)),
+        (
+            'meal_items',
+            MEAL_ITEM_FIELDS,
+            MealItem.objects.filter(meal__user=user).order_by('meal__name', 'datetime_created').values(*MEAL_ITEM_FIELDS),
+        ),
+    ]
+
+
+def export_path(user_id, fmt):
+    extension = FORMATS[fmt][0]
+    return os.path.join(settings.EXPORT_ROOT, str(user_id), f'export.{extension}')
+
+
+def export_status(user_id, fmt):
+    """ Returns 'ready', 'building' or None if no export has been requested. """
+    path = export_path(user_id, fmt)
+    if os.path.exists(f'{path}.tmp'):
+        return 'building'
+    if os.path.exists(path):
+        return 'ready'
+    return None
+
+
+def write_ndjson(f, user):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    writer = io.TextIOWrapper(f, encoding='utf-8', write_through=False)
+    for name, _, queryset in get_datasets(user):
+        for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+            row['type'] = name
+            writer.write(encoder.encode(row))
+            writer.write('\n')
+    writer.flush()
+    writer.detach()
+
+
+def write_csv_zip(f, user):
+    with zipfile.ZipFile(f, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, fields, queryset in get_datasets(user):
+            with archive.open(f'{name}.csv', 'w', force_zip64=True) as member:
+                writer = io.TextIOWrapper(member, encoding='utf-8', newline='')
+                csv_writer = csv.writer(writer)
+                csv_writer.writerow(fields)
+                for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+                    csv_writer.writerow([row[field] for field in fields])
+                writer.flush()
+                writer.detach()
+
+
+def build_export(user, fmt):
+    """
+    Builds the export file for the user. Returns False without doing anything
+    if another build of the same export is already running.
+    """
+    path = export_path(user.pk, fmt)
+    tmp_path = f'{path}.tmp'
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if os.path.exists(tmp_path) and time.time() - os.path.getmtime(tmp_path) > STALE_BUILD_SECONDS:
+        # Left behind by a crashed build.
+        os.remove(tmp_path)
+    try:
+        f = open(tmp_path, 'xb')
+    except FileExistsError:
+        return False
+
+    try:
+        with f:
+            if fmt == 'ndjson':
+                write_ndjson(f, user)
+            else:
+                write_csv_zip(f, user)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return True
+
+
+def start_export(user, fmt):
+    """ Queues an export build in the background pool. """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown export format {fmt}')
+    if export_status(user.pk, fmt) == 'building':
+        return None
+    return submit(build_export, user, fmt)
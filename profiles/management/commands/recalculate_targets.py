@@ -0,0 +1,66 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from profiles.models import Profile
+from profiles.targets import INPUT_FIELDS, TARGET_FIELDS, apply_targets
+
+
+class Command(BaseCommand):
+    help = 'Recalculates the recommended, percent and grams targets of every profile in vectorised chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Profiles loaded and updated per chunk.')
+        parser.add_argument('--user', help='Only recalculate the targets of this username.')
+        parser.add_argument('--dry-run', action='store_true', help='Print the changes without saving them.')
+        parser.add_argument('--diff-limit', type=int, default=20, help='Profiles whose changes are printed.')
+
+    def handle(self, *args, **options):
+        queryset = (
+            Profile.objects.exclude(calculation_method__isnull=True)
+            .exclude(calculation_method=Profile.CalculationMethod.CUSTOM)
+            .select_related('user')
+            .only('user__username', *INPUT_FIELDS, *TARGET_FIELDS)
+            .order_by('pk')
+        )
+        if options['user']:
+            queryset = queryset.filter(user__username=options['user'])
+
+        chunk_size = options['chunk_size']
+        dry_run = options['dry_run']
+        diffs_left = options['diff_limit']
+        start = time.perf_counter()
+        total = updated = skipped = 0
+        last_pk = None
+        while True:
+            # Keyset pagination over the primary key keeps every chunk query cheap.
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            profiles = list(chunk[:chunk_size])
+            if not profiles:
+                break
+            changed, chunk_skipped = apply_targets(profiles)
+            total += len(profiles)
+            skipped += chunk_skipped
+            updated += len(changed)
+            last_pk = profiles[-1].pk
+
+            if dry_run:
+                for profile, changes in changed[: max(diffs_left, 0)]:
+                    self.stdout.write(profile.user.username)
+                    for field, (old, new) in changes.items():
+                        self.stdout.write(f'    {field}: {old} -> {new}')
+                diffs_left -= len(changed)
+            elif changed:
+                with transaction.atomic():
+                    Profile.objects.bulk_update([profile for profile, _ in changed], TARGET_FIELDS, batch_size=500)
+
+        elapsed = time.perf_counter() - start
+        rate = total / elapsed if elapsed else 0
+        verb = 'Would update' if dry_run else 'Updated'
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'{verb} {updated} of {total} profiles, skipped {skipped} with incomplete stats, '
+                f'in {elapsed:.1f}s ({rate:.0f} profiles/s)'
+            )
+        )
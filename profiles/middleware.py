@@ -0,0 +1,34 @@
+import asyncio
+
+from django.utils.functional import SimpleLazyObject
+
+from .models import Profile
+
+
+def get_target_profile(user):
+    if not user.is_authenticated:
+        return None
+    return Profile.objects.targets().filter(user=user).first()
+
+
+class ProfileMiddleware:
+    """
+    Adds request.profile, the authenticated user's profile with only its target
+    columns, loaded on first use. Views, DiaryQuerySet.remaining() and templates
+    share the one instance, so a request makes at most one profile query for targets.
+    Must come after AuthenticationMiddleware. Runs natively in both the sync and async
+    middleware chains; async views must only evaluate request.profile off the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function to the handler, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        request.profile = SimpleLazyObject(lambda: get_target_profile(request.user))
+        return self.get_response(request)
@@ -0,0 +1,19 @@
+# Generated by Django 3.1.6 on 2026-10-19 12:00
+
+from django.db import migrations
+import utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='image',
+            field=utils.fields.BoundedImageField(blank=True, default='images/profile_pictures/default.png', null=True, upload_to='images/profile_pictures', verbose_name='profile picture'),
+        ),
+    ]
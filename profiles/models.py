@@ -1,12 +1,14 @@
 from datetime import date
-from decimal import Decimal
+from decimal import ROUND_HALF_EVEN, ROUND_HALF_UP, Context, Decimal
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.checks import messages
 from django.core.validators import MaxValueValidator
-from django.db import models
-from django.db.models.signals import post_save, pre_save
+from django.db import models, transaction
+from django.db.models import DEFERRED, Case, ExpressionWrapper, F, Func, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
@@ -14,9 +16,94 @@ from django.utils.translation import gettext_lazy as _
 
 from progress.models import Progress
 from utils.behaviours import Nutritionable, Uuidable
+from utils.fields import BoundedImageField
+from utils.functional import cached_metric
+from utils.images import loaded_name, release_image, schedule_derivatives
 
 User = settings.AUTH_USER_MODEL
 
+# Daily calorie and macronutrient targets, compared against the food diary totals.
+NUTRIENT_TARGET_FIELDS = ['energy', 'fat', 'saturates', 'carbohydrate', 'sugars', 'fibre', 'protein', 'salt']
+
+
+def quantize_decimal(field, value):
+    """
+    Rounds a value to the decimal places a DecimalField stores, half to even, reading
+    floats to max_digits significant digits first as DecimalField.to_python() does.
+    """
+    context = Context(prec=field.max_digits, rounding=ROUND_HALF_EVEN)
+    if not isinstance(value, Decimal):
+        value = context.create_decimal_from_float(value)
+    return value.quantize(Decimal(1).scaleb(-field.decimal_places), context=context)
+
+
+class Round1(Func):
+    """ Postgres specific database function to round floating point numbers to 1 decimal place """
+
+    function = 'ROUND'
+    template = '%(function)s(%(expressions)s::numeric, 1)'
+
+
+class RoundEven(Func):
+    """
+    Postgres specific database function to round to a whole number as Python's round(),
+    half to even, by rounding as a double. Numeric rounds halves away from zero.
+    """
+
+    template = 'ROUND((%(expressions)s)::double precision)::integer'
+    output_field = models.IntegerField()
+
+
+class Age(Func):
+    """ Postgres specific database function for the whole years between a date and today """
+
+    template = "DATE_PART('year', AGE(%(expressions)s))::integer"
+    output_field = models.IntegerField()
+
+
+class ProfileQuerySet(models.QuerySet):
+    def targets(self):
+        """ Loads only the daily calorie and macronutrient target columns. """
+        return self.only('user', *NUTRIENT_TARGET_FIELDS)
+
+    def with_metrics(self):
+        """
+        Annotates age, BMI, BMR and TDEE calculated in SQL, as the Profile metrics of the
+        same name, for listings and reports. The annotations fill the cached metrics so
+        they aren't calculated again in Python.
+        """
+        sex_modifier = Case(
+            When(sex=Profile.Sex.MALE, then=Value(5)),
+            When(sex=Profile.Sex.FEMALE, then=Value(-161)),
+            default=Value(0),
+        )
+        # Floats, so the multiplication matches Profile.tdee exactly.
+        activity_modifier = Case(
+            When(activity_level=Profile.ActivityLevel.SEDENTARY, then=Value(1.2)),
+            When(activity_level=Profile.ActivityLevel.LIGHTLY_ACTIVE, then=Value(1.375)),
+            When(activity_level=Profile.ActivityLevel.MODERATELY_ACTIVE, then=Value(1.55)),
+            When(activity_level=Profile.ActivityLevel.VERY_ACTIVE, then=Value(1.725)),
+            When(activity_level=Profile.ActivityLevel.EXTRA_ACTIVE, then=Value(1.9)),
+            output_field=models.FloatField(),
+        )
+        # BMR is exact as a double, as weight has one decimal place and 6.25 * height at most two.
+        return self.annotate(
+            age=Age('date_of_birth'),
+            bmi=Round1(
+                ExpressionWrapper(
+                    F('weight') / (F('height') * F('height') / Value(10000.0)), output_field=models.DecimalField()
+                )
+            ),
+            bmr=RoundEven(
+                ExpressionWrapper(
+                    10 * F('weight') + Value(Decimal('6.25')) * F('height') - 5 * F('age') + sex_modifier,
+                    output_field=models.DecimalField(),
+                )
+            ),
+            tdee=RoundEven(
+                ExpressionWrapper(Cast('bmr', models.FloatField()) * activity_modifier, output_field=models.FloatField())
+            ),
+        )
 
 
 class Profile(Uuidable):
@@ -47,7 +134,7 @@ class Profile(Uuidable):
         CUSTOM = 'CUS', _('Custom')
 
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    image = models.ImageField(
+    image = BoundedImageField(
         verbose_name='profile picture',
         upload_to='images/profile_pictures',
         default='images/profile_pictures/default.png',
@@ -167,24 +254,28 @@ class Profile(Uuidable):
         help_text="""The amount of fat (in grams) per kilogram of body weight.""",
     )
 
+    objects = ProfileQuerySet.as_manager()
+
     __original_weight = None  # Only used to determine previous value of self.weight if changed
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__original_weight = self.weight
+        # Read from __dict__ so loading a profile with weight deferred, e.g. targets(), doesn't fetch it.
+        self.__original_weight = self.__dict__.get('weight', DEFERRED)
+        # The stored picture, released when a save replaces or clears it.
+        self._stored_image = loaded_name(self)
 
     def save(self, *args, **kwargs):
-        if self.weight != self.__original_weight:
-            # Checks if self.weight value was changed
-            post = Progress.objects.filter(user=self.user, date=timezone.now()).first()
-            if post:
-                post.weight = self.weight
-                post.save()
-                print('Updated log for user weight in the progress model for this date')
-            else:
-                Progress.objects.create(user=self.user, date=timezone.now(), weight=self.weight)
-                print('Logged user weight in the progress model for this date')
-        super().save(*args, **kwargs)
+        self.image_changed = self._state.adding or loaded_name(self) != self._stored_image
+        with transaction.atomic():
+            if self.__original_weight is not DEFERRED and self.weight != self.__original_weight:
+                # Logs a changed weight in the progress model for today, creating or updating the day's log in one query.
+                Progress.objects.upsert_weights(self.user, [(timezone.localdate(), self.weight)])
+            if self.image_changed and self._stored_image is not DEFERRED:
+                release_image(self._stored_image, self._meta.get_field('image').storage)
+            super().save(*args, **kwargs)
+        self.__original_weight = self.__dict__.get('weight', DEFERRED)
+        self._stored_image = loaded_name(self)
 
     def __str__(self):
         return self.user.username
@@ -198,19 +289,19 @@ class Profile(Uuidable):
         if self.salt is not None:
             return round(self.salt * 400)
 
-    @property
+    @cached_metric('weight')
     def weight_lb(self):
         # Converts user's weight from kg to lb
         if self.weight:
             return round(self.weight * Decimal(2.20462))
 
-    @property
+    @cached_metric('goal_weight')
     def goal_weight_lb(self):
         # Converts user's weight from kg to lb
         if self.goal_weight:
             return round(self.goal_weight * Decimal(2.20462))
 
-    @property
+    @cached_metric('weight')
     def weight_st(self):
         # Converts user's weight from kg to st and lb
         if self.weight_lb:
@@ -219,7 +310,7 @@ class Profile(Uuidable):
             weight['lb'] = round(self.weight_lb % 14)
             return weight
 
-    @property
+    @cached_metric('goal_weight')
     def goal_weight_st(self):
         # Converts user's goal weight from kg to st and lb
         if self.goal_weight_lb:
@@ -228,13 +319,13 @@ class Profile(Uuidable):
             weight['lb'] = round(self.goal_weight_lb % 14)
             return weight
 
-    @property
+    @cached_metric('height')
     def height_in(self):
         # Converts user's height from cm to in
         if self.height:
             return round(self.height / Decimal(2.54))
 
-    @property
+    @cached_metric('height')
     def height_ft(self):
         # Converts user's height from cm to ft and in
         if self.height_in:
@@ -243,7 +334,7 @@ class Profile(Uuidable):
             height['in'] = round(self.height_in % 12)
             return height
 
-    @property
+    @cached_metric('date_of_birth')
     def age(self):
         # Calculates user's current age from their date of birth
         if self.date_of_birth:
@@ -254,7 +345,7 @@ class Profile(Uuidable):
                 - ((now.month, now.day) < (self.date_of_birth.month, self.date_of_birth.day))
             )
 
-    @property
+    @cached_metric('weight', 'goal_weight')
     def goal_duration_weeks(self):
         # Calculates how long it will take the user to reach their goal weight in weeks
         if self.weight:
@@ -263,13 +354,15 @@ class Profile(Uuidable):
             duration['long'] = abs(self.weight - self.goal_weight) / Decimal(0.5)
             return duration
 
-    @property
+    @cached_metric('weight', 'height')
     def bmi(self):
         # Calculates Body Mass Index
+        # Rounds half up like Postgres' ROUND on numerics, so it agrees with with_metrics().
         if self.weight and self.height:
-            return round(self.weight / Decimal((self.height / 100) ** 2), 1)
+            bmi = self.weight / (Decimal(self.height * self.height) / 10000)
+            return bmi.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
 
-    @property
+    @cached_metric('weight', 'height', 'sex', 'date_of_birth')
     def bmr(self):
         # Calculates Basal Metablic Rate
         # Uses the Harris–Benedict Equation, revised by Mifflin and St Jeor
@@ -281,7 +374,7 @@ class Profile(Uuidable):
                 modifier = -161
             return round((10 * self.weight) + Decimal(6.25 * self.height) - (5 * self.age) + modifier)
 
-    @property
+    @cached_metric('weight', 'height', 'sex', 'date_of_birth', 'activity_level')
     def tdee(self):
         # Calculates Total Daily Energy Expenditure
         if self.activity_level and self.bmr:
@@ -298,7 +391,7 @@ class Profile(Uuidable):
                 modifier = 1.9
             return round(self.bmr * modifier)
 
-    @property
+    @cached_metric('weight', 'height', 'sex', 'date_of_birth', 'activity_level', 'goal')
     def recommended_calories(self):
         # Sets the users recommended calorie target based on their
         # tdee and goals.
@@ -312,6 +405,27 @@ class Profile(Uuidable):
                 modifier = 1.1
             return round(self.tdee * modifier)
 
+    def quantize_targets(self):
+        """
+        Rounds the Decimal targets the set_ methods calculate to the values their fields
+        store, so what is saved doesn't depend on how the database backend rounds.
+        """
+        for name in (
+            'fat',
+            'saturates',
+            'carbohydrate',
+            'sugars',
+            'fibre',
+            'protein',
+            'salt',
+            'protein_per_kg',
+            'carbohydrate_per_kg',
+            'fat_per_kg',
+        ):
+            value = getattr(self, name)
+            if value is not None:
+                setattr(self, name, quantize_decimal(self._meta.get_field(name), value))
+
     def set_default(self):
         """
         Updates the user's target with the recommended setup targets.
@@ -358,6 +472,7 @@ class Profile(Uuidable):
 
         # self.user.setup_complete = True
         # self.user.save()
+        self.quantize_targets()
         self.save()
 
     def set_percent(self, calories, protein, carbohydrate, fat, **kwargs):
@@ -396,6 +511,7 @@ class Profile(Uuidable):
 
         # self.user.setup_complete = True
         # self.user.save()
+        self.quantize_targets()
         self.save()
 
     def set_grams(self, protein, carbohydrate, fat):
@@ -436,6 +552,7 @@ class Profile(Uuidable):
 
         # self.user.setup_complete = True
         # self.user.save()
+        self.quantize_targets()
         self.save()
 
     def set_custom(self, protein, carbohydrate, fat, saturates, sugars, fibre, salt):
@@ -465,14 +582,30 @@ class Profile(Uuidable):
         self.carbohydrate_per_kg = carbohydrate
         self.fat_per_kg = fat
 
+        self.quantize_targets()
         self.save()
 
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
-    # Creates and links a profile when a user is created.
+    """
+    Creates and links a profile when a user is created, as a single INSERT which
+    does nothing if the profile already exists. Routine user saves, such as
+    last_login being updated on every login, do no work.
+    """
     if created:
-        Profile.objects.create(user=instance)
-    if not Profile.objects.filter(user=instance):
-        Profile.objects.create(user=instance)
-    instance.profile.save()
+        Profile.objects.bulk_create([Profile(user=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Profile)
+def create_image_derivatives(sender, instance, **kwargs):
+    # Generates the thumbnails and WebP variants of a new profile picture in the background.
+    # Saves which leave the picture as it was, e.g. a weight or target change, skip the lookup.
+    if getattr(instance, 'image_changed', True):
+        schedule_derivatives(instance.image)
+
+
+@receiver(post_delete, sender=Profile)
+def release_deleted_image(sender, instance, **kwargs):
+    # Releases the deleted profile's reference to its content addressed picture.
+    release_image(instance._stored_image, sender._meta.get_field('image').storage)
@@ -0,0 +1,243 @@
+"""
+Vectorised recalculation of profile targets.
+Mirrors Profile.set_default(), set_percent() and set_grams() for a whole chunk of
+profiles at once with NumPy arrays, so the targets of every user can be recomputed
+when the nutrition rules change without Decimal arithmetic and a save() per profile.
+Custom targets are left alone.
+
+The set_ methods keep their calories in an unsaved attribute, so percent targets
+take their calories from the stored grams, as set_grams() does, and energy is not
+written. Values are rounded and truncated as the set_ methods and the model fields'
+storage do, so recalculating unchanged profiles changes nothing, save the rare
+percent targets whose grams are stored the same for neighbouring calories.
+"""
+import datetime
+from decimal import Decimal
+
+import numpy as np
+
+from .models import Profile, quantize_decimal
+
+SEX_MODIFIERS = {Profile.Sex.MALE: 5, Profile.Sex.FEMALE: -161}
+SATURATES_LIMITS = {Profile.Sex.MALE: 30, Profile.Sex.FEMALE: 20}
+ACTIVITY_MULTIPLIERS = {
+    Profile.ActivityLevel.SEDENTARY: 1.2,
+    Profile.ActivityLevel.LIGHTLY_ACTIVE: 1.375,
+    Profile.ActivityLevel.MODERATELY_ACTIVE: 1.55,
+    Profile.ActivityLevel.VERY_ACTIVE: 1.725,
+    Profile.ActivityLevel.EXTRA_ACTIVE: 1.9,
+}
+GOAL_MULTIPLIERS = {
+    Profile.Goal.LOSE_WEIGHT: 0.8,
+    Profile.Goal.MAINTAIN_WEIGHT: 1,
+    Profile.Goal.GAIN_WEIGHT: 1.1,
+}
+# Recommended (protein, carbohydrate, fat) percent of calories per goal.
+GOAL_SPLITS = {
+    Profile.Goal.LOSE_WEIGHT: (40, 40, 20),
+    Profile.Goal.MAINTAIN_WEIGHT: (25, 55, 20),
+    Profile.Goal.GAIN_WEIGHT: (25, 55, 20),
+}
+FIBRE = 30
+SALT = 6
+
+INPUT_FIELDS = [
+    'sex',
+    'weight',
+    'height',
+    'date_of_birth',
+    'activity_level',
+    'goal',
+    'calculation_method',
+]
+TARGET_FIELDS = [
+    'fat',
+    'saturates',
+    'carbohydrate',
+    'sugars',
+    'fibre',
+    'protein',
+    'salt',
+    'protein_pct',
+    'carbohydrate_pct',
+    'fat_pct',
+    'calories_per_kg',
+    'protein_per_kg',
+    'carbohydrate_per_kg',
+    'fat_per_kg',
+]
+# Fields the set_ methods round with round(), to these decimal places.
+ROUNDED_FIELDS = {
+    'protein_pct': 0,
+    'carbohydrate_pct': 0,
+    'fat_pct': 0,
+    'protein_per_kg': 2,
+    'carbohydrate_per_kg': 2,
+    'fat_per_kg': 2,
+}
+# Fields set_default() calculates by dividing by the stored Decimal weight.
+WEIGHT_QUOTIENT_FIELDS = {'calories_per_kg', 'protein_per_kg', 'carbohydrate_per_kg', 'fat_per_kg'}
+# Significant digits kept when reading a float as the Decimal it approximates.
+DECIMAL_DIGITS = 12
+# Largest value each field can store, rows exceeding them are skipped.
+TARGET_LIMITS = {'fat': 999.9, 'saturates': 999.9, 'carbohydrate': 999.9, 'sugars': 999.9, 'protein': 999.9}
+
+
+def _array(values):
+    return np.array([np.nan if value is None else float(value) for value in values], dtype=float)
+
+
+def _lookup(values, mapping):
+    return np.array([mapping.get(value, np.nan) for value in values], dtype=float)
+
+
+def _age(date_of_birth, today):
+    if date_of_birth is None:
+        return np.nan
+    return today.year - date_of_birth.year - ((today.month, today.day) < (date_of_birth.month, date_of_birth.day))
+
+
+def _calories(grams):
+    # Summed in the order set_grams() does, so the floats are identical.
+    return grams[:, 0] * 4 + grams[:, 1] * 4 + grams[:, 2] * 9
+
+
+def _percent_calories(grams, pct):
+    """
+    Calories aren't stored, so percent targets take them from their stored grams as
+    set_grams() does. The grams are rounded to 0.1g, so of the whole calories around
+    that total, the ones whose grams at the stored percents best match the stored
+    grams are those set_percent() was given.
+    """
+    candidates = np.round(_calories(grams))[:, None] + np.array([-1, 0, 1])
+    candidate_grams = candidates[:, :, None] * (pct[:, None, :] / 100) / np.array([4, 4, 9])
+    error = np.nan_to_num(np.abs(candidate_grams - grams[:, None, :]).max(axis=2), nan=np.inf)
+    return candidates[np.arange(len(candidates)), np.argmin(error, axis=1)]
+
+
+def calculate_targets(profiles, today=None):
+    """
+    Calculates the targets of a sequence of profiles.
+    Returns a dict of TARGET_FIELDS to arrays, one value per profile, and a boolean
+    array of the profiles whose targets could be calculated.
+    """
+    today = today or datetime.date.today()
+    method = np.array([profile.calculation_method or '' for profile in profiles])
+    sex = [profile.sex for profile in profiles]
+    weight = _array(profile.weight for profile in profiles)
+    height = _array(profile.height for profile in profiles)
+    age = np.array([_age(profile.date_of_birth, today) for profile in profiles], dtype=float)
+    goals = [profile.goal for profile in profiles]
+
+    # Mifflin-St Jeor BMR, TDEE and recommended calories, as Profile.bmr/tdee/recommended_calories.
+    bmr = np.round(10 * weight + 6.25 * height - 5 * age + np.array([SEX_MODIFIERS.get(s, 0) for s in sex]))
+    tdee = np.round(bmr * _lookup([profile.activity_level for profile in profiles], ACTIVITY_MULTIPLIERS))
+    recommended = np.round(tdee * _lookup(goals, GOAL_MULTIPLIERS))
+
+    is_rec = method == Profile.CalculationMethod.RECOMMENDED.value
+    is_per = method == Profile.CalculationMethod.PERCENT.value
+    is_gra = method == Profile.CalculationMethod.GRAMS.value
+
+    split = np.array([GOAL_SPLITS.get(goal, (np.nan,) * 3) for goal in goals], dtype=float).reshape(-1, 3)
+    stored_pct = np.column_stack(
+        [_array(getattr(profile, f'{macro}_pct') for profile in profiles) for macro in ('protein', 'carbohydrate', 'fat')]
+    ).reshape(-1, 3)
+    per_kg = np.column_stack(
+        [
+            _array(getattr(profile, f'{macro}_per_kg') for profile in profiles)
+            for macro in ('protein', 'carbohydrate', 'fat')
+        ]
+    ).reshape(-1, 3)
+    stored_grams = np.column_stack(
+        [_array(getattr(profile, macro) for profile in profiles) for macro in ('protein', 'carbohydrate', 'fat')]
+    ).reshape(-1, 3)
+
+    pct = np.where(is_rec[:, None], split, stored_pct)
+    calories = np.where(is_rec, recommended, _percent_calories(stored_grams, pct))
+    grams = calories[:, None] * (pct / 100) / np.array([4, 4, 9])
+    grams = np.where(is_rec[:, None], np.round(grams), grams)
+    grams = np.where(is_gra[:, None], per_kg * weight[:, None], grams)
+    calories = np.where(is_gra, _calories(grams), calories)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pct = np.where(is_gra[:, None], grams * np.array([4, 4, 9]) / calories[:, None] * 100, pct)
+        calories_per_kg = calories / weight
+        grams_per_kg = np.where(is_gra[:, None], per_kg, grams / weight[:, None])
+    protein, carbohydrate, fat = grams.T
+
+    targets = {
+        'protein': protein,
+        'carbohydrate': carbohydrate,
+        'fat': fat,
+        'saturates': np.minimum(fat * 0.35, np.array([SATURATES_LIMITS.get(s, np.inf) for s in sex])),
+        'sugars': np.minimum(calories * 0.045, carbohydrate),
+        'fibre': np.full(len(profiles), FIBRE, dtype=float),
+        'salt': np.full(len(profiles), SALT, dtype=float),
+        'protein_pct': pct[:, 0],
+        'carbohydrate_pct': pct[:, 1],
+        'fat_pct': pct[:, 2],
+        'calories_per_kg': calories_per_kg,
+        'protein_per_kg': grams_per_kg[:, 0],
+        'carbohydrate_per_kg': grams_per_kg[:, 1],
+        'fat_per_kg': grams_per_kg[:, 2],
+    }
+
+    valid = (is_rec | is_per | is_gra) & (weight > 0) & (calories > 0)
+    for field, values in targets.items():
+        valid &= np.isfinite(values) & (values >= 0)
+        if field in TARGET_LIMITS:
+            valid &= values <= TARGET_LIMITS[field]
+    return targets, valid
+
+
+def _field_values(field, values, in_decimal):
+    """
+    Converts a target array to the values the field stores after the set_ methods:
+    round() where they round, int() truncation for integer fields and, for Decimal
+    fields, quantize_decimal() as Profile.quantize_targets() rounds them.
+    Where `in_decimal`, values are read as the Decimal they approximate before
+    rounding or truncating, as set_default() divides by the stored Decimal weight.
+    The other methods only run with a float weight and round floats.
+    """
+    values = [
+        Decimal(format(value, f'.{DECIMAL_DIGITS}g')) if decimal and np.isfinite(value) else value
+        for value, decimal in zip(values.tolist(), in_decimal.tolist())
+    ]
+    if field in ROUNDED_FIELDS:
+        values = [round(value, ROUNDED_FIELDS[field]) for value in values]
+    model_field = Profile._meta.get_field(field)
+    if model_field.get_internal_type() != 'DecimalField':
+        return [int(value) for value in values]
+    return [quantize_decimal(model_field, value) for value in values]
+
+
+def apply_targets(profiles, today=None):
+    """
+    Recalculates and sets the targets of each profile in place.
+    Returns a list of (profile, {field: (old, new)}) for the profiles which changed,
+    and the number of profiles which were skipped as their targets could not be calculated.
+    """
+    if not profiles:
+        return [], 0
+    targets, valid = calculate_targets(profiles, today)
+    indices = np.flatnonzero(valid)
+    is_rec = np.array([profile.calculation_method == Profile.CalculationMethod.RECOMMENDED for profile in profiles])
+    not_decimal = np.zeros(len(indices), dtype=bool)
+    values = {
+        field: _field_values(
+            field, targets[field][indices], is_rec[indices] if field in WEIGHT_QUOTIENT_FIELDS else not_decimal
+        )
+        for field in TARGET_FIELDS
+    }
+    changed = []
+    for position, index in enumerate(indices.tolist()):
+        profile = profiles[index]
+        changes = {}
+        for field in TARGET_FIELDS:
+            new = values[field][position]
+            old = getattr(profile, field)
+            if old is None or new != old:
+                changes[field] = (old, new)
+                setattr(profile, field, new)
+        if changes:
+            changed.append((profile, changes))
+    return changed, len(profiles) - len(indices)
@@ -0,0 +1,338 @@
+import csv
+import datetime
+import io
+import json
+import os
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from diaries.models import Diary
+from meals.models import Meal, MealItem
+from meals.tests import MealTestCase
+from progress.models import Progress
+
+from . import exports
+from .models import Profile
+from .targets import TARGET_FIELDS, apply_targets
+
+
+def profile_queries(queries):
+    return [query['sql'] for query in queries if 'profiles_profile' in query['sql']]
+
+
+class CreateProfileSignalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+
+    def test_registration_creates_profile_with_one_insert(self):
+        with CaptureQueriesContext(connection) as queries:
+            user = get_user_model().objects.create_user(username='new', email='new@email.com', password='password')
+        sql = profile_queries(queries)
+        self.assertEqual(len(sql), 1)
+        self.assertTrue(sql[0].startswith('INSERT'))
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+
+    def test_registration_view_creates_profile(self):
+        data = {
+            'first_name': 'New',
+            'last_name': 'User',
+            'username': 'new',
+            'email': 'new@email.com',
+            'password1': 'a-long-password',
+            'password2': 'a-long-password',
+        }
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('accounts:register'), data)
+        self.assertEqual(len(profile_queries(queries)), 1)
+        self.assertTrue(Profile.objects.filter(user__username='new').exists())
+
+    def test_login_does_not_touch_profile(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('accounts:login'), {'username': 'user', 'password': 'password'})
+        self.assertTrue(self.client.session.get('_auth_user_id'))
+        self.assertEqual(profile_queries(queries), [])
+
+    def test_username_change_does_not_touch_profile(self):
+        self.client.login(username='user', password='password')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('accounts:username_change'), {'username': 'renamed'})
+        self.assertEqual(profile_queries(queries), [])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.username, 'renamed')
+
+    def test_existing_profile_is_kept(self):
+        profile = self.user.profile
+        self.user.save()
+        self.assertEqual(Profile.objects.filter(user=self.user).get(), profile)
+
+
+class ProfileWeightLoggingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+
+    def test_weight_change_logs_progress_once_per_day(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.weight = Decimal('80.5')
+        profile.save()
+        profile.weight = Decimal('80.1')
+        profile.save()
+        log = Progress.objects.get(user=self.user)
+        self.assertEqual(log.date, timezone.localdate())
+        self.assertEqual(log.weight, Decimal('80.1'))
+
+    def test_unchanged_weight_does_not_touch_progress(self):
+        profile = Profile.objects.get(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            profile.save()
+        self.assertEqual([query for query in queries if 'progress_progress' in query['sql']], [])
+
+    def test_upsert_weights_bulk(self):
+        Progress.objects.create(user=self.user, date=datetime.date(2021, 1, 2), weight=90, notes='Keep me')
+        entries = [(datetime.date(2021, 1, day), Decimal(80 + day)) for day in range(1, 11)]
+        with CaptureQueriesContext(connection) as queries:
+            count = Progress.objects.upsert_weights(self.user, entries, batch_size=4)
+        self.assertEqual(count, 10)
+        self.assertEqual(len([query for query in queries if 'progress_progress' in query['sql']]), 3)
+        self.assertEqual(Progress.objects.filter(user=self.user).count(), 10)
+        existing = Progress.objects.get(user=self.user, date=datetime.date(2021, 1, 2))
+        self.assertEqual(existing.weight, Decimal('82'))
+        self.assertEqual(existing.notes, 'Keep me')
+
+
+class ProfileMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        Profile.objects.filter(user=user).update(
+            sex=Profile.Sex.FEMALE,
+            # BMR is 600 + 6.25 * 170 - 5 * 35 - 161 = 1326.5, a tie rounded half to even to 1326.
+            height=170,
+            weight=Decimal('60.0'),
+            date_of_birth=datetime.date.today() - datetime.timedelta(days=12800),
+            activity_level=Profile.ActivityLevel.LIGHTLY_ACTIVE,
+            goal=Profile.Goal.LOSE_WEIGHT,
+        )
+        cls.user = user
+
+    def test_with_metrics_matches_properties(self):
+        annotated = Profile.objects.with_metrics().get(user=self.user)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(annotated.age, profile.age)
+        self.assertEqual(annotated.bmi, profile.bmi)
+        self.assertEqual((annotated.age, annotated.bmr), (35, 1326))
+        self.assertEqual(annotated.bmr, profile.bmr)
+        self.assertEqual(annotated.tdee, profile.tdee)
+        self.assertEqual(annotated.recommended_calories, profile.recommended_calories)
+
+    def test_bmi_tie_rounds_half_up(self):
+        # 60.2kg / 2m squared is exactly 15.05.
+        Profile.objects.filter(user=self.user).update(height=200, weight=Decimal('60.2'))
+        annotated = Profile.objects.with_metrics().get(user=self.user)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual(profile.bmi, Decimal('15.1'))
+        self.assertEqual(annotated.bmi, profile.bmi)
+
+    def test_metrics_invalidated_on_change(self):
+        profile = Profile.objects.get(user=self.user)
+        bmi = profile.bmi
+        profile.weight = Decimal('70.0')
+        self.assertNotEqual(profile.bmi, bmi)
+
+
+class RecalculateTargetsTests(TestCase):
+    def make_profile(self, username, **stats):
+        user = get_user_model().objects.create_user(
+            username=username, email=f'{username}@email.com', password='password'
+        )
+        profile = Profile.objects.get(user=user)
+        for field, value in stats.items():
+            setattr(profile, field, value)
+        return profile
+
+    def assert_recalculated_unchanged(self, profile):
+        profile.refresh_from_db()
+        stored = {field: getattr(profile, field) for field in TARGET_FIELDS}
+        changed, skipped = apply_targets([profile])
+        self.assertEqual((changed, skipped), ([], 0))
+        self.assertEqual({field: getattr(profile, field) for field in TARGET_FIELDS}, stored)
+
+    def test_matches_set_default(self):
+        for username, stats in [
+            ('male', dict(sex='M', height=180, weight=Decimal('80.0'), goal=Profile.Goal.MAINTAIN_WEIGHT)),
+            # 134g of protein / 80kg is a decimal tie, 1.675.
+            ('female', dict(sex='F', height=166, weight=Decimal('62.5'), goal=Profile.Goal.LOSE_WEIGHT)),
+        ]:
+            profile = self.make_profile(
+                username,
+                date_of_birth=datetime.date(1990, 6, 15),
+                activity_level=Profile.ActivityLevel.SEDENTARY,
+                **stats,
+            )
+            profile.set_default()
+            self.assert_recalculated_unchanged(profile)
+
+    def test_matches_set_percent(self):
+        # set_percent() and set_grams() only work with a float weight, as from a form's cleaned data.
+        for username, weight, targets in [('percent', 80.0, (2250, 30, 45, 25)), ('uneven', 58.3, (1850, 35, 40, 25))]:
+            profile = self.make_profile(username, sex='F', weight=weight)
+            profile.set_percent(*targets)
+            self.assert_recalculated_unchanged(profile)
+            # Calories come from the stored grams, not the energy field set_percent() leaves alone.
+            self.assertEqual(profile.energy, 2000)
+
+    def test_matches_set_grams(self):
+        profile = self.make_profile('grams', sex='F', weight=65.0)
+        profile.set_grams(2.0, 3.5, 0.9)
+        self.assert_recalculated_unchanged(profile)
+
+    def test_set_methods_quantize_targets(self):
+        profile = self.make_profile('quantized', sex='F', weight=58.3)
+        profile.set_percent(1850, 35, 40, 25)
+        # Integer fields are still truncated on save, calories_per_kg is left a float.
+        fields = [field for field in TARGET_FIELDS if field != 'calories_per_kg']
+        calculated = {field: getattr(profile, field) for field in fields}
+        self.assertEqual(calculated['protein'], Decimal('161.9'))
+        profile.refresh_from_db()
+        self.assertEqual({field: getattr(profile, field) for field in fields}, calculated)
+
+    def test_rule_change_recalculates(self):
+        profile = self.make_profile('changed', sex='M', weight=80.0)
+        profile.set_percent(2000, 30, 45, 25)
+        Profile.objects.filter(pk=profile.pk).update(protein_per_kg=0)
+        profile.refresh_from_db()
+        changed, _ = apply_targets([profile])
+        self.assertEqual(changed[0][1], {'protein_per_kg': (Decimal('0.00'), Decimal('1.88'))})
+
+
+class ProfileMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_diary_day_loads_profile_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('diaries:today'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(profile_queries(queries)), 1)
+        self.assertEqual(response.context['target'].energy, 2000)
+        self.assertEqual(response.context['remaining']['energy'], 2000)
+
+    def test_profile_not_loaded_when_unused(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('accounts:account'))
+        self.assertEqual(profile_queries(queries), [])
+
+
+class ProfilePictureReferenceTests(TransactionTestCase):
+    # Pictures are released once the transaction commits, which a TestCase never does.
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        override = self.settings(MEDIA_ROOT=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        submit = mock.patch('utils.images.submit')
+        submit.start()
+        self.addCleanup(submit.stop)
+        self.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def picture(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue())
+
+    def test_replaced_and_deleted_pictures_released(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.image = self.picture('red')
+        profile.save()
+        first, storage = profile.image.name, profile.image.storage
+        self.assertTrue(storage.exists(first))
+
+        profile.image = self.picture('blue')
+        profile.save()
+        self.assertFalse(storage.exists(first))
+
+        second = profile.image.name
+        self.user.delete()
+        self.assertFalse(storage.exists(second))
+
+
+class ExportTests(MealTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.meal = Meal.objects.create(user=cls.user, name='Lunch')
+        MealItem.objects.create(meal=cls.meal, food=cls.chicken, quantity=2)
+        Diary.objects.create(user=cls.user, date=datetime.date(2021, 1, 1), meal=1, food=cls.rice, quantity=1.5)
+        Progress.objects.upsert_weights(cls.user, [(datetime.date(2021, 1, 1), 80)])
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        override = self.settings(EXPORT_ROOT=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def test_ndjson(self):
+        self.assertTrue(exports.build_export(self.user, 'ndjson'))
+        with open(exports.export_path(self.user.pk, 'ndjson'), encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual([row['type'] for row in rows], ['profile', 'diary', 'progress', 'meals', 'meal_items'])
+        diary = rows[1]
+        self.assertEqual((diary['date'], diary['food_name'], diary['quantity']), ('2021-01-01', 'Rice', '1.50'))
+        self.assertEqual(Decimal(str(diary['energy'])), 195)
+        self.assertEqual((rows[2]['date'], rows[2]['weight']), ('2021-01-01', '80.0'))
+        self.assertEqual((rows[4]['meal__name'], rows[4]['food__name']), ('Lunch', 'Chicken Breast'))
+        self.assertEqual(exports.export_status(self.user.pk, 'ndjson'), 'ready')
+
+    def test_csv_zip(self):
+        self.assertTrue(exports.build_export(self.user, 'csv'))
+        with zipfile.ZipFile(exports.export_path(self.user.pk, 'csv')) as archive:
+            self.assertEqual(
+                archive.namelist(), ['profile.csv', 'diary.csv', 'progress.csv', 'meals.csv', 'meal_items.csv']
+            )
+            with archive.open('diary.csv') as member:
+                rows = list(csv.reader(io.TextIOWrapper(member, encoding='utf-8')))
+        self.assertEqual(rows[0], exports.DIARY_FIELDS)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(dict(zip(rows[0], rows[1]))['food_name'], 'Rice')
+
+    def test_build_running(self):
+        path = exports.export_path(self.user.pk, 'ndjson')
+        os.makedirs(os.path.dirname(path))
+        open(f'{path}.tmp', 'w').close()
+        self.assertFalse(exports.build_export(self.user, 'ndjson'))
+        self.assertEqual(exports.export_status(self.user.pk, 'ndjson'), 'building')
+
+    def test_download_ranges(self):
+        self.client.login(username='user', password='password')
+        url = reverse('profiles:export_download', kwargs={'fmt': 'ndjson'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        exports.build_export(self.user, 'ndjson')
+        with open(exports.export_path(self.user.pk, 'ndjson'), 'rb') as f:
+            content = f.read()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), content)
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="user-export.ndjson"')
+        response = self.client.get(url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), content[10:])
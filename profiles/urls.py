@@ -5,5 +5,7 @@ from . import views
 app_name = 'profiles'
 urlpatterns = [
     path('profile/', views.ProfileView.as_view(), name='profile'),
+    path('profile/export/', views.ExportView.as_view(), name='export'),
+    path('profile/export/<str:fmt>/download/', views.ExportDownloadView.as_view(), name='export_download'),
     path('profile/<str:username>/', views.UserProfileView.as_view(), name='user_profile'),
 ]
@@ -1,6 +1,12 @@
-from django.shortcuts import get_object_or_404
-from django.views.generic import TemplateView
+from django.contrib import messages
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
+from django.shortcuts import get_object_or_404, redirect
+from django.views.generic import TemplateView, View
 
+from utils.http import ranged_file_response
+
+from .exports import FORMATS, export_path, export_status, start_export
 from .models import Profile
 
 
@@ -9,7 +15,7 @@ class ProfileView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['profile'] = get_object_or_404(Profile, user=self.request.user)
+        context['profile'] = get_object_or_404(Profile.objects.with_metrics(), user=self.request.user)
         return context
 
 
@@ -18,5 +24,45 @@ class UserProfileView(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['profile'] = get_object_or_404(Profile, user__username=self.kwargs.get('username'))
+        context['profile'] = get_object_or_404(Profile.objects.with_metrics(), user__username=self.kwargs.get('username'))
+        return context
+
+
+class ExportView(LoginRequiredMixin, TemplateView):
+    """
+    Lets the user request a full export of their data as NDJSON or a zip of CSV files.
+    The export is built in the background, the page shows when it is ready to download.
+    """
+
+    template_name = 'profiles/export.html'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['exports'] = [(fmt, export_status(self.request.user.pk, fmt)) for fmt in FORMATS]
         return context
+
+    def post(self, request, *args, **kwargs):
+        fmt = request.POST.get('format')
+        if fmt not in FORMATS:
+            messages.error(request, 'Invalid export format')
+        elif start_export(request.user, fmt) is None:
+            messages.warning(request, 'Your export is already being built')
+        else:
+            messages.success(request, 'Your export is being built, refresh this page to check when it is ready')
+        return redirect('profiles:export')
+
+
+class ExportDownloadView(LoginRequiredMixin, View):
+    """ Serves a built export, supporting range requests so large downloads can be resumed. """
+
+    def get(self, request, fmt):
+        if fmt not in FORMATS or export_status(request.user.pk, fmt) != 'ready':
+            raise Http404('Export not found')
+        extension, content_type = FORMATS[fmt]
+        return ranged_file_response(
+            request,
+            export_path(request.user.pk, fmt),
+            filename=f'{request.user.username}-export.{extension}',
+            content_type=content_type,
+            headers={'Cache-Control': 'private, no-cache'},
+        )
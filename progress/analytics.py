@@ -0,0 +1,103 @@
+"""
+Weight trend analytics for the progress chart.
+Weigh-ins are irregular, so every calculation works on day numbers rather than
+row positions: the exponentially smoothed trend decays by the number of days
+between weigh-ins, the weekly mean covers the 7 calendar days up to each
+weigh-in, and the rate of change compares the trend with its value a week before.
+Long histories are downsampled with Largest-Triangle-Three-Buckets so the chart
+keeps its shape with a fixed number of points.
+"""
+import numpy as np
+
+# Share of the gap between the trend and a weigh-in closed per day, as the Hacker's Diet 10% trend.
+SMOOTHING = 0.1
+WEEK = 7
+
+
+def exponential_trend(days, weights, smoothing=SMOOTHING):
+    """ Exponentially smoothed weights, decayed by the days since the previous weigh-in. """
+    trend = np.empty_like(weights)
+    if not len(weights):
+        return trend
+    keep = (1 - smoothing) ** np.diff(days, prepend=days[0])
+    trend[0] = weights[0]
+    # A recurrence, each value depends on the last, but a few thousand steps take around a millisecond.
+    for i in range(1, len(weights)):
+        trend[i] = weights[i] + keep[i] * (trend[i - 1] - weights[i])
+    return trend
+
+
+def rolling_mean(days, weights, window=WEEK):
+    """ Mean of the weigh-ins in the `window` calendar days up to and including each weigh-in. """
+    sums = np.concatenate([[0], np.cumsum(weights)])
+    starts = np.searchsorted(days, days - window + 1)
+    ends = np.arange(1, len(days) + 1)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def weekly_rate(days, trend):
+    """ Change in trend weight over the previous week, NaN for the first week of history. """
+    if not len(days):
+        return np.empty(0)
+    week_ago = np.interp(days - WEEK, days, trend)
+    return np.where(days - WEEK >= days[0], trend - week_ago, np.nan)
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets downsampling, returns the indices of the `threshold`
+    points which best keep the visual shape of the (x, y) line.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # The first and last points are kept, the rest are split into threshold - 2 buckets.
+    edges = np.floor(np.linspace(1, n - 1, threshold - 1)).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        # The triangle's third point is the mean of the next bucket.
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+        areas = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def _value(value, places):
+    return None if np.isnan(value) else round(float(value), places)
+
+
+def weight_trend(rows, points=None, smoothing=SMOOTHING):
+    """
+    Calculates the trend of (date, weight) rows ordered by date.
+    Returns a list of dicts of date, weight, trend, weekly_mean and weekly_rate,
+    downsampled to at most `points` entries when given.
+    """
+    if not rows:
+        return []
+    dates = [row[0] for row in rows]
+    days = np.array([date.toordinal() for date in dates], dtype=float)
+    weights = np.array([float(row[1]) for row in rows])
+
+    trend = exponential_trend(days, weights, smoothing)
+    mean = rolling_mean(days, weights)
+    rate = weekly_rate(days, trend)
+
+    indices = lttb(days, weights, points) if points else np.arange(len(days))
+    return [
+        {
+            'date': dates[i],
+            'weight': round(float(weights[i]), 1),
+            'trend': _value(trend[i], 2),
+            'weekly_mean': _value(mean[i], 2),
+            'weekly_rate': _value(rate[i], 2),
+        }
+        for i in indices.tolist()
+    ]
@@ -0,0 +1,13 @@
+from datetime import date
+
+from rest_framework import serializers
+
+
+class WeightEntrySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    weight = serializers.DecimalField(max_digits=4, decimal_places=1, min_value=1)
+
+    def validate_date(self, value):
+        if value > date.today():
+            raise serializers.ValidationError('Weight cannot be logged for a future date.')
+        return value
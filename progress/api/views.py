@@ -0,0 +1,27 @@
+from rest_framework import serializers
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from ..models import Progress
+from .serializers import WeightEntrySerializer
+
+
+class WeightImportAPIView(APIView):
+    """
+    Imports weight history, e.g. from a smart scale, as a list of {"date", "weight"} objects.
+    Days which already have a progress log have their weight updated, all days are
+    written with one INSERT ... ON CONFLICT per batch.
+    """
+
+    permission_classes = (IsAuthenticated,)
+    max_entries = 5000
+
+    def post(self, request):
+        serializer = WeightEntrySerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        entries = serializer.validated_data
+        if len(entries) > self.max_entries:
+            raise serializers.ValidationError(f'Import at most {self.max_entries} entries at a time.')
+        count = Progress.objects.upsert_weights(request.user, [(entry['date'], entry['weight']) for entry in entries])
+        return Response({'imported': count})
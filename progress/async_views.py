@@ -0,0 +1,54 @@
+"""
+Async read endpoints, served without tying up a worker thread when deployed with config.asgi.
+ORM work runs on the bounded pool from utils.aio.
+"""
+from django.http import JsonResponse
+
+from utils.aio import async_login_required, run_in_pool
+
+from . import analytics
+from .models import Progress
+
+
+TREND_POINTS = 500
+MIN_TREND_POINTS = 3
+MAX_TREND_POINTS = 2000
+
+
+def _weights(user):
+    return list(Progress.objects.filter(user=user, weight__isnull=False).order_by('date').values_list('date', 'weight'))
+
+
+def _trend_data(user, points):
+    rows = _weights(user)
+    return len(rows), analytics.weight_trend(rows, points=points)
+
+
+def _chart_data(user):
+    return [{'date': date, 'weight': weight} for date, weight in _weights(user)]
+
+
+@async_login_required
+async def progress_chart_view(request):
+    """ Weight by date for the user's progress chart. """
+    data = await run_in_pool(_chart_data, request.user)
+    return JsonResponse({'results': data})
+
+
+@async_login_required
+async def progress_trend_view(request):
+    """
+    Smoothed weight trend, weekly mean and weekly rate of change for the user's progress chart,
+    downsampled to ?points= (default 500) so long histories stay small.
+    """
+    try:
+        points = int(request.GET.get('points', TREND_POINTS))
+    except ValueError:
+        return JsonResponse({'detail': 'points must be a whole number.'}, status=400)
+    if not MIN_TREND_POINTS <= points <= MAX_TREND_POINTS:
+        return JsonResponse(
+            {'detail': f'points must be between {MIN_TREND_POINTS} and {MAX_TREND_POINTS}.'}, status=400
+        )
+    # The trend is NumPy work, run with the query so it doesn't block the event loop.
+    count, results = await run_in_pool(_trend_data, request.user, points)
+    return JsonResponse({'count': count, 'latest': results[-1] if results else None, 'results': results})
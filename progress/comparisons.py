@@ -0,0 +1,88 @@
+"""
+Side by side and stacked comparisons of progress pictures.
+A comparison is rendered once into a single JPEG named after the hash of its layout
+and the content hashes of its pictures, in order:
+
+    cas/comparisons/3f/a2/3fa2...e9.jpg
+
+so the same pictures compared the same way always map to the same file. Later views
+only check the cache and are served like any other content addressed media file.
+"""
+import hashlib
+import io
+import posixpath
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from utils.images import content_hash
+
+SIDE_BY_SIDE = 'side'
+STACKED = 'stack'
+LAYOUTS = {SIDE_BY_SIDE: 'Side by side', STACKED: 'Stacked'}
+# Height of each picture side by side, or width of each stacked picture.
+PANEL_SIZE = 800
+GAP = 16
+BACKGROUND = 'white'
+MAX_PICTURES = 4
+# Bump to re-render every comparison after changing how they are drawn.
+VERSION = 1
+DIRECTORY = 'cas/comparisons'
+
+
+def comparison_name(hashes, layout):
+    key = hashlib.sha256(f'{VERSION}:{layout}:{",".join(hashes)}'.encode()).hexdigest()
+    return posixpath.join(DIRECTORY, key[:2], key[2:4], f'{key}.jpg')
+
+
+def _panel(storage, name, layout):
+    target = (PANEL_SIZE * 4, PANEL_SIZE) if layout == SIDE_BY_SIDE else (PANEL_SIZE, PANEL_SIZE * 4)
+    with storage.open(name, 'rb') as file:
+        with Image.open(file) as image:
+            # Decodes JPEGs at a reduced scale where the panel is much smaller than the picture.
+            image.draft('RGB', target)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    if layout == SIDE_BY_SIDE:
+        size = (max(1, round(image.width * PANEL_SIZE / image.height)), PANEL_SIZE)
+    else:
+        size = (PANEL_SIZE, max(1, round(image.height * PANEL_SIZE / image.width)))
+    return image.resize(size, Image.LANCZOS)
+
+
+def render_comparison(names, layout=SIDE_BY_SIDE, storage=None):
+    """ Renders the stored pictures `names`, in order, into one JPEG and returns its bytes. """
+    storage = storage or default_storage
+    panels = [_panel(storage, name, layout) for name in names]
+    gaps = GAP * (len(panels) - 1)
+    if layout == SIDE_BY_SIDE:
+        canvas = Image.new('RGB', (sum(panel.width for panel in panels) + gaps, PANEL_SIZE), BACKGROUND)
+    else:
+        canvas = Image.new('RGB', (PANEL_SIZE, sum(panel.height for panel in panels) + gaps), BACKGROUND)
+    offset = 0
+    for panel in panels:
+        canvas.paste(panel, (offset, 0) if layout == SIDE_BY_SIDE else (0, offset))
+        offset += (panel.width if layout == SIDE_BY_SIDE else panel.height) + GAP
+    buffer = io.BytesIO()
+    canvas.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def get_comparison(names, layout=SIDE_BY_SIDE, storage=None):
+    """
+    Returns the storage name of the comparison of the pictures `names`, rendering
+    and saving it only if it does not exist yet.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f'Unknown layout {layout!r}')
+    if not 2 <= len(names) <= MAX_PICTURES:
+        raise ValueError(f'Compare between 2 and {MAX_PICTURES} pictures')
+    storage = storage or default_storage
+    name = comparison_name([content_hash(picture, storage) for picture in names], layout)
+    cache_key = f'progress-comparison:{name}'
+    if not cache.get(cache_key):
+        if not storage.exists(name):
+            storage.save(name, ContentFile(render_comparison(names, layout, storage)))
+        cache.set(cache_key, True, None)
+    return name
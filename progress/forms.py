@@ -1,5 +1,7 @@
 from django import forms
 
+from .comparisons import LAYOUTS, MAX_PICTURES, SIDE_BY_SIDE
+from .importers import KG, UNITS, parse_entries
 from .models import Progress
 
 
@@ -19,3 +21,43 @@ class ProgressForm(forms.ModelForm):
         if Progress.objects.exclude(id=self.instance.id).filter(user=self.user, date=date).exists():
             raise forms.ValidationError('You have already entered a weight for this date.')
         return cleaned_data
+
+
+class ProgressCompareForm(forms.Form):
+    progress = forms.ModelMultipleChoiceField(
+        label='Pictures',
+        queryset=Progress.objects.none(),
+        to_field_name='slug',
+        widget=forms.CheckboxSelectMultiple,
+    )
+    layout = forms.ChoiceField(choices=list(LAYOUTS.items()), initial=SIDE_BY_SIDE)
+
+    def __init__(self, *args, **kwargs):
+        self.user = kwargs.pop('user')
+        super().__init__(*args, **kwargs)
+        self.fields['progress'].queryset = (
+            Progress.objects.filter(user=self.user).exclude(image='').exclude(image__isnull=True).order_by('date')
+        )
+
+    def clean_progress(self):
+        progress = sorted(self.cleaned_data['progress'], key=lambda log: log.date)
+        if not 2 <= len(progress) <= MAX_PICTURES:
+            raise forms.ValidationError(f'Select between 2 and {MAX_PICTURES} pictures to compare.')
+        return progress
+
+
+class ProgressImportForm(forms.Form):
+    file = forms.FileField(
+        help_text='A CSV with date and weight columns, or JSON list of {"date", "weight"} objects.'
+    )
+    unit = forms.ChoiceField(choices=list(UNITS.items()), initial=KG, help_text='Unit of the weights in the file.')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        file = cleaned_data.get('file')
+        if file:
+            try:
+                cleaned_data['entries'] = parse_entries(file, cleaned_data.get('unit', KG))
+            except forms.ValidationError as error:
+                self.add_error('file', error)
+        return cleaned_data
@@ -0,0 +1,140 @@
+"""
+Weight history imports from other trackers, as CSV or JSON.
+Every row is parsed and validated before anything is written, so an import either
+succeeds as a whole or reports all its problems, with row numbers, at once.
+
+CSV files need a header row with a date and a weight column, e.g. "Date,Weight (kg)".
+JSON files hold a list of {"date": ..., "weight": ...} objects, optionally under "results".
+Dates are ISO (2021-03-31) or day first (31/03/2021).
+"""
+import codecs
+import csv
+import datetime
+import json
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+
+KG = 'kg'
+LB = 'lb'
+UNITS = {KG: 'Kilograms', LB: 'Pounds'}
+LB_TO_KG = Decimal('0.45359237')
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y')
+DATE_COLUMNS = ('date', 'day')
+WEIGHT_COLUMNS = ('weight', 'weight (kg)', 'weight_kg', 'weight (lb)', 'weight_lb', 'body weight')
+# Weight fits Progress.weight, max_digits=4 and decimal_places=1.
+MIN_WEIGHT = Decimal('1')
+MAX_WEIGHT = Decimal('999.9')
+MAX_ROWS = 20000
+MAX_FILE_SIZE = 5 * 1024 * 1024
+MAX_ERRORS = 20
+
+
+def parse_date(value):
+    value = str(value).strip()
+    # Datetimes from exports, e.g. 2021-03-31T07:15:00, keep their date.
+    value = value.split('T')[0].split(' ')[0]
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f'"{value}" is not a date')
+
+
+def parse_weight(value, unit=KG):
+    try:
+        weight = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f'"{value}" is not a weight')
+    if not weight.is_finite():
+        raise ValueError(f'"{value}" is not a weight')
+    if unit == LB:
+        weight *= LB_TO_KG
+    weight = weight.quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+    if not MIN_WEIGHT <= weight <= MAX_WEIGHT:
+        raise ValueError(f'{weight} kg is out of range')
+    return weight
+
+
+def _find_column(header, names):
+    for index, column in enumerate(header):
+        if column.strip().lower() in names:
+            return index
+    raise ValidationError(f'The file needs a {names[0]} column.')
+
+
+def read_csv(file):
+    """ Yields (row number, date, weight) values from a CSV file. """
+    reader = csv.reader(codecs.iterdecode(file, 'utf-8-sig'))
+    header = next(reader, None)
+    if not header:
+        raise ValidationError('The file is empty.')
+    date_index = _find_column(header, DATE_COLUMNS)
+    weight_index = _find_column(header, WEIGHT_COLUMNS)
+    for number, row in enumerate(reader, start=2):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) <= max(date_index, weight_index):
+            yield number, None, None
+        else:
+            yield number, row[date_index], row[weight_index]
+
+
+def read_json(file):
+    """ Yields (row number, date, weight) values from a JSON file. """
+    data = json.load(file)
+    if isinstance(data, dict):
+        data = data.get('results')
+    if not isinstance(data, list):
+        raise ValidationError('The file should hold a list of {"date", "weight"} objects.')
+    for number, entry in enumerate(data, start=1):
+        if isinstance(entry, dict):
+            yield number, entry.get('date'), entry.get('weight')
+        else:
+            yield number, None, None
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+def parse_entries(file, unit=KG, today=None):
+    """
+    Parses and validates an uploaded CSV or JSON weight history.
+    Returns a list of (date, weight in kg) pairs, or raises ValidationError listing
+    the first MAX_ERRORS problems by row.
+    """
+    today = today or datetime.date.today()
+    if file.size > MAX_FILE_SIZE:
+        raise ValidationError(f'Upload a file no larger than {MAX_FILE_SIZE // 1024 // 1024} MB.')
+    extension = file.name.rsplit('.', 1)[-1].lower()
+    if extension not in READERS:
+        raise ValidationError('Upload a .csv or .json file.')
+
+    entries = []
+    errors = []
+    try:
+        for number, day, weight in READERS[extension](file):
+            if len(errors) >= MAX_ERRORS:
+                break
+            if len(entries) >= MAX_ROWS:
+                raise ValidationError(f'Import at most {MAX_ROWS} rows at a time.')
+            if day in (None, '') or weight in (None, ''):
+                errors.append(f'Row {number}: a date and weight are required.')
+                continue
+            try:
+                day = parse_date(day)
+                if day > today:
+                    raise ValueError(f'{day} is in the future')
+                entries.append((day, parse_weight(weight, unit)))
+            except ValueError as error:
+                errors.append(f'Row {number}: {error}.')
+    except (UnicodeDecodeError, csv.Error, json.JSONDecodeError):
+        raise ValidationError(f'The file could not be read as {extension.upper()}.')
+
+    if errors:
+        raise ValidationError(errors)
+    if not entries:
+        raise ValidationError('The file has no weights to import.')
+    return entries
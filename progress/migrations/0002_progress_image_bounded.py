@@ -0,0 +1,19 @@
+# Generated by Django 3.1.6 on 2026-10-19 12:00
+
+from django.db import migrations
+import utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('progress', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='progress',
+            name='image',
+            field=utils.fields.BoundedImageField(blank=True, help_text='Upload an optional progress picture for this day.', null=True, upload_to='images/progress_pictures', verbose_name='progress picture'),
+        ),
+    ]
@@ -1,14 +1,67 @@
+import uuid
 from datetime import date
 from decimal import Decimal
 
 from django.conf import settings
 from django.core.validators import MaxValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.text import slugify
 
 from utils.behaviours import Timestampable, Uuidable
+from utils.fields import BoundedImageField
+from utils.images import loaded_name, release_image, schedule_derivatives
+
+
+class ProgressQuerySet(models.QuerySet):
+    def upsert_weights(self, user, entries, batch_size=1000):
+        """
+        Logs the user's weight for each (date, weight) pair in `entries`, creating the
+        day's progress log or updating the weight of an existing one, e.g. when
+        importing weight history from a device. Each batch is a single
+        INSERT ... ON CONFLICT (user_id, date) DO UPDATE, so there is no read before the
+        write and no race against the unique_user_date constraint. Later entries for the
+        same date win. Returns the number of days written.
+        """
+        weights = {}
+        for day, weight in entries:
+            weights[day] = weight
+        if not weights:
+            return 0
+
+        opts = self.model._meta
+        connection = connections[self.db]
+        qn = connection.ops.quote_name
+        columns = ['id', 'user', 'date', 'slug', 'weight', 'datetime_created', 'datetime_updated']
+        fields = [opts.get_field(name) for name in columns]
+        placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+        sql_prefix = 'INSERT INTO %s (%s) VALUES ' % (qn(opts.db_table), ', '.join(qn(field.column) for field in fields))
+        sql_suffix = ' ON CONFLICT (%s, %s) DO UPDATE SET %s = EXCLUDED.%s, %s = EXCLUDED.%s' % (
+            qn(opts.get_field('user').column),
+            qn(opts.get_field('date').column),
+            qn(opts.get_field('weight').column),
+            qn(opts.get_field('weight').column),
+            qn(opts.get_field('datetime_updated').column),
+            qn(opts.get_field('datetime_updated').column),
+        )
+
+        now = timezone.now()
+        rows = [
+            [uuid.uuid4(), user.pk, day, slugify(f'{day} {user.username}'), weight, now, now]
+            for day, weight in weights.items()
+        ]
+        with transaction.atomic(using=self.db, savepoint=False), connection.cursor() as cursor:
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+                params = [
+                    field.get_db_prep_save(value, connection) for row in batch for field, value in zip(fields, row)
+                ]
+                cursor.execute(sql_prefix + ', '.join([placeholders] * len(batch)) + sql_suffix, params)
+        return len(rows)
 
 
 class Progress(Uuidable, Timestampable):
@@ -26,7 +79,7 @@ class Progress(Uuidable, Timestampable):
         null=True,
         blank=True,
     )
-    image = models.ImageField(
+    image = BoundedImageField(
         verbose_name='progress picture',
         upload_to='images/progress_pictures',
         null=True,
@@ -35,11 +88,18 @@ class Progress(Uuidable, Timestampable):
     )
     notes = models.TextField('notes', max_length=1000, null=True, blank=True)
 
+    objects = ProgressQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'progress log'
         verbose_name_plural = 'progress logs'
         constraints = [models.UniqueConstraint(fields=['user', 'date'], name='unique_user_date')]
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The stored picture, released when a save replaces or clears it, DEFERRED if not loaded.
+        self._stored_image = loaded_name(self)
+
     def __str__(self):
         return f'{self.user.username}, {self.date}'
 
@@ -49,7 +109,12 @@ class Progress(Uuidable, Timestampable):
     def save(self, *args, **kwargs):
         slug_str = f'{self.date} {self.user.username}'
         self.slug = slugify(slug_str)
-        super().save(*args, **kwargs)
+        self.image_changed = self._state.adding or loaded_name(self) != self._stored_image
+        with transaction.atomic():
+            if self.image_changed and self._stored_image is not DEFERRED:
+                release_image(self._stored_image, self._meta.get_field('image').storage)
+            super().save(*args, **kwargs)
+        self._stored_image = loaded_name(self)
 
     @property
     def weight_lb(self):
@@ -65,3 +130,17 @@ class Progress(Uuidable, Timestampable):
             stone = weight["st"]
             pounds = weight["lb"]
             return f'{stone} st, {pounds} lb'
+
+
+@receiver(post_save, sender=Progress)
+def create_image_derivatives(sender, instance, **kwargs):
+    # Generates the thumbnails and WebP variants of a new progress picture in the background.
+    # Saves which leave the picture as it was, e.g. a weight or target change, skip the lookup.
+    if getattr(instance, 'image_changed', True):
+        schedule_derivatives(instance.image)
+
+
+@receiver(post_delete, sender=Progress)
+def release_deleted_image(sender, instance, **kwargs):
+    # Releases the deleted log's reference to its content addressed picture.
+    release_image(instance._stored_image, sender._meta.get_field('image').storage)
@@ -0,0 +1,316 @@
+import datetime
+import io
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+import numpy as np
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from utils import images
+
+from . import analytics, comparisons, importers
+from .models import Progress
+
+
+class WeightTrendTests(SimpleTestCase):
+    def test_trend_decays_by_days_between_weigh_ins(self):
+        days = np.array([0, 1, 3], dtype=float)
+        trend = analytics.exponential_trend(days, np.array([80.0, 81.0, 81.0]))
+        self.assertAlmostEqual(trend[1], 80.1)
+        self.assertAlmostEqual(trend[2], 81 - 0.9 ** 2 * 0.9)
+
+    def test_rolling_mean_uses_calendar_days(self):
+        days = np.array([0, 1, 2, 10], dtype=float)
+        mean = analytics.rolling_mean(days, np.array([1.0, 2.0, 3.0, 4.0]))
+        np.testing.assert_allclose(mean, [1, 1.5, 2, 4])
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        x = np.arange(1000, dtype=float)
+        y = np.zeros(1000)
+        y[500] = 10
+        indices = analytics.lttb(x, y, 50)
+        self.assertEqual(len(indices), 50)
+        self.assertEqual((indices[0], indices[-1]), (0, 999))
+        self.assertIn(500, indices)
+
+    def test_weight_trend_downsampled(self):
+        start = datetime.date(2016, 1, 1)
+        rows = [(start + datetime.timedelta(days=day), 90 - day * 0.01) for day in range(1800)]
+        results = analytics.weight_trend(rows, points=200)
+        self.assertEqual(len(results), 200)
+        self.assertEqual(results[-1]['date'], rows[-1][0])
+        self.assertIsNone(results[0]['weekly_rate'])
+        self.assertLess(results[-1]['weekly_rate'], 0)
+
+
+class ProgressListViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        start = datetime.date(2021, 1, 1)
+        Progress.objects.upsert_weights(cls.user, [(start + datetime.timedelta(days=day), 80) for day in range(60)])
+
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_keyset_pages(self):
+        url = reverse('progress:list')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        progress_sql = [query['sql'] for query in queries if 'progress_progress' in query['sql']]
+        self.assertEqual(len(progress_sql), 1)
+        self.assertNotIn('COUNT', progress_sql[0])
+        self.assertNotIn('OFFSET', progress_sql[0])
+        first = response.context['progress_list']
+        self.assertEqual(len(first), 25)
+        self.assertEqual(first[0].date, datetime.date(2021, 3, 1))
+        self.assertNotIn('newer_date', response.context)
+
+        response = self.client.get(url, {'before': response.context['older_date']})
+        second = response.context['progress_list']
+        self.assertEqual(second[0].date, first[-1].date - datetime.timedelta(days=1))
+
+        response = self.client.get(url, {'after': response.context['newer_date']})
+        self.assertEqual([log.pk for log in response.context['progress_list']], [log.pk for log in first])
+
+    def test_last_page(self):
+        response = self.client.get(reverse('progress:list'), {'before': '2021-01-05'})
+        self.assertEqual(len(response.context['progress_list']), 4)
+        self.assertNotIn('older_date', response.context)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('progress:list'), {'before': 'yesterday'})
+        self.assertEqual(response.status_code, 404)
+
+
+class ProgressAsyncViewTests(TransactionTestCase):
+    # Async views query on the pool's own connections, which can't see a TestCase transaction.
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        start = datetime.date(2021, 1, 1)
+        Progress.objects.upsert_weights(self.user, [(start + datetime.timedelta(days=day), 80) for day in range(60)])
+        self.client.login(username='user', password='password')
+        self.async_client.login(username='user', password='password')
+
+    async def test_chart(self):
+        response = await self.async_client.get(reverse('progress:chart_api'))
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(len(results), 60)
+        self.assertEqual(results[0], {'date': '2021-01-01', 'weight': '80.0'})
+
+    def test_downsampled(self):
+        response = self.client.get(reverse('progress:trend_api'), {'points': 10})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 60)
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(data['results'][-1]['date'], '2021-03-01')
+        self.assertEqual(data['latest'], data['results'][-1])
+
+    def test_points_out_of_range(self):
+        for points in (0, 2, 2001, 5000, 'many'):
+            response = self.client.get(reverse('progress:trend_api'), {'points': points})
+            self.assertEqual(response.status_code, 400)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.get(reverse('progress:trend_api'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ComparisonTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name)
+        self.names = [self.save_picture(color, size) for color, size in (('red', (300, 400)), ('blue', (600, 400)))]
+
+    def tearDown(self):
+        cache.clear()
+        self.directory.cleanup()
+
+    def save_picture(self, color, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'JPEG')
+        return self.storage.save(f'images/progress_pictures/{color}.jpg', ContentFile(buffer.getvalue()))
+
+    def test_side_by_side(self):
+        name = comparisons.get_comparison(self.names, comparisons.SIDE_BY_SIDE, self.storage)
+        self.assertRegex(name, r'^cas/comparisons/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        with self.storage.open(name) as file:
+            size = Image.open(file).size
+        self.assertEqual(size, (600 + 1200 + comparisons.GAP, comparisons.PANEL_SIZE))
+
+    def test_rendered_once(self):
+        name = comparisons.get_comparison(self.names, comparisons.STACKED, self.storage)
+        with mock.patch('progress.comparisons.render_comparison') as render:
+            self.assertEqual(comparisons.get_comparison(self.names, comparisons.STACKED, self.storage), name)
+            cache.clear()
+            self.assertEqual(comparisons.get_comparison(self.names, comparisons.STACKED, self.storage), name)
+        render.assert_not_called()
+
+    def test_named_by_order_and_layout(self):
+        names = {
+            comparisons.get_comparison(self.names, comparisons.SIDE_BY_SIDE, self.storage),
+            comparisons.get_comparison(self.names[::-1], comparisons.SIDE_BY_SIDE, self.storage),
+            comparisons.get_comparison(self.names, comparisons.STACKED, self.storage),
+        }
+        self.assertEqual(len(names), 3)
+
+
+class ProgressCompareViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        cls.log = Progress.objects.create(
+            user=cls.user, date=datetime.date(2021, 1, 1), image='images/progress_pictures/a.jpg'
+        )
+
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_requires_two_pictures(self):
+        response = self.client.get(reverse('progress:compare'), {'progress': [self.log.slug], 'layout': 'side'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('progress', response.context['form'].errors)
+        self.assertNotIn('comparison_url', response.context)
+
+
+class ProgressPictureReferenceTests(TransactionTestCase):
+    # Pictures are released once the transaction commits, which a TestCase never does.
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        override = self.settings(MEDIA_ROOT=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        submit = mock.patch('utils.images.submit')
+        submit.start()
+        self.addCleanup(submit.stop)
+        self.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def picture(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (40, 30), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile('photo.jpg', buffer.getvalue())
+
+    def test_delete_releases_picture(self):
+        first = Progress.objects.create(user=self.user, date=datetime.date(2021, 1, 1), image=self.picture())
+        second = Progress.objects.create(user=self.user, date=datetime.date(2021, 1, 2), image=self.picture())
+        name, storage = first.image.name, first.image.storage
+        self.assertEqual(second.image.name, name)
+        derivative = images.derivative_name(name, 160, images.WEBP)
+        storage.save(derivative, ContentFile(b'webp'))
+
+        first.delete()
+        self.assertTrue(storage.exists(name))
+        Progress.objects.filter(pk=second.pk).delete()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(storage.exists(derivative))
+
+    def test_derivatives_scheduled_for_new_pictures(self):
+        with mock.patch('progress.models.schedule_derivatives') as schedule:
+            log = Progress.objects.create(user=self.user, date=datetime.date(2021, 1, 1), image=self.picture())
+            self.assertEqual(schedule.call_count, 1)
+            log = Progress.objects.get(pk=log.pk)
+            log.notes = 'Same picture'
+            log.save()
+            self.assertEqual(schedule.call_count, 1)
+            log.image = self.picture('blue')
+            log.save()
+            self.assertEqual(schedule.call_count, 2)
+
+    def test_replacing_releases_picture(self):
+        log = Progress.objects.create(user=self.user, date=datetime.date(2021, 1, 1), image=self.picture('red'))
+        name, storage = log.image.name, log.image.storage
+        log = Progress.objects.get(pk=log.pk)
+        log.notes = 'Same picture'
+        log.save()
+        self.assertTrue(storage.exists(name))
+
+        log.image = self.picture('blue')
+        log.save()
+        log.save()
+        self.assertFalse(storage.exists(name))
+        self.assertTrue(storage.exists(log.image.name))
+
+
+class ImporterTests(SimpleTestCase):
+    def test_csv(self):
+        content = '\ufeffDate,Weight (lb),Notes\r\n31/03/2021,176.4,\r\n\r\n2021-04-01,176\r\n'
+        file = SimpleUploadedFile('weights.csv', content.encode())
+        entries = importers.parse_entries(file, importers.LB)
+        self.assertEqual(
+            entries, [(datetime.date(2021, 3, 31), Decimal('80.0')), (datetime.date(2021, 4, 1), Decimal('79.8'))]
+        )
+
+    def test_json(self):
+        file = SimpleUploadedFile('weights.json', b'{"results": [{"date": "2021-01-01T07:00:00", "weight": 80.25}]}')
+        self.assertEqual(importers.parse_entries(file), [(datetime.date(2021, 1, 1), Decimal('80.3'))])
+
+    def test_errors_listed_by_row(self):
+        content = b'date,weight\n2021-13-01,80\n2999-01-01,80\n2021-01-01,abc\n2021-01-02,\n'
+        file = SimpleUploadedFile('weights.csv', content)
+        with self.assertRaises(ValidationError) as context:
+            importers.parse_entries(file)
+        rows = [message.split(':')[0] for message in context.exception.messages]
+        self.assertEqual(rows, ['Row 2', 'Row 3', 'Row 4', 'Row 5'])
+
+    def test_non_finite_weights(self):
+        content = b'date,weight\n2021-01-01,nan\n2021-01-02,Infinity\n'
+        with self.assertRaises(ValidationError) as context:
+            importers.parse_entries(SimpleUploadedFile('weights.csv', content))
+        self.assertEqual(len(context.exception.messages), 2)
+        content = b'[{"date": "2021-01-01", "weight": NaN}, {"date": "2021-01-02", "weight": -Infinity}]'
+        with self.assertRaises(ValidationError) as context:
+            importers.parse_entries(SimpleUploadedFile('weights.json', content))
+        self.assertEqual(len(context.exception.messages), 2)
+
+    def test_missing_column(self):
+        with self.assertRaises(ValidationError):
+            importers.parse_entries(SimpleUploadedFile('weights.csv', b'date,kg\n2021-01-01,80\n'))
+
+
+class ProgressImportViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='user', email='user@email.com', password='password')
+        Progress.objects.create(user=cls.user, date=datetime.date(2021, 1, 1), weight=90, notes='Kept')
+
+    def setUp(self):
+        self.client.login(username='user', password='password')
+
+    def test_import_upserts(self):
+        start = datetime.date(2021, 1, 1)
+        rows = '\n'.join(f'{start + datetime.timedelta(days=day)},{80 + day / 10}' for day in range(365))
+        file = SimpleUploadedFile('weights.csv', f'date,weight\n{rows}\n'.encode())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('progress:import'), {'file': file, 'unit': 'kg'})
+        self.assertRedirects(response, reverse('progress:list'))
+        self.assertEqual(Progress.objects.filter(user=self.user).count(), 365)
+        existing = Progress.objects.get(user=self.user, date=datetime.date(2021, 1, 1))
+        self.assertEqual((existing.weight, existing.notes), (Decimal('80.0'), 'Kept'))
+        self.assertEqual(len([query for query in queries if 'INSERT INTO "progress_progress"' in query['sql']]), 1)
+        # The list the import redirects to shows the imported history, newest first.
+        response = self.client.get(reverse('progress:list'))
+        self.assertEqual(response.context['progress_list'][0].date, start + datetime.timedelta(days=364))
+
+    def test_invalid_file_imports_nothing(self):
+        file = SimpleUploadedFile('weights.csv', b'date,weight\n2021-02-01,80\n2021-02-02,heavy\n')
+        response = self.client.post(reverse('progress:import'), {'file': file, 'unit': 'kg'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('file', response.context['form'].errors)
+        self.assertEqual(Progress.objects.filter(user=self.user).count(), 1)
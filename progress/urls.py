@@ -1,11 +1,17 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
+from .api import views as api_views
 
 app_name = 'progress'
 urlpatterns = [
     path('', views.ProgressListView.as_view(), name='list'),
+    path('api/chart/', async_views.progress_chart_view, name='chart_api'),
+    path('api/trend/', async_views.progress_trend_view, name='trend_api'),
+    path('api/weights/', api_views.WeightImportAPIView.as_view(), name='weight_import_api'),
     path('create/', views.ProgressCreateView.as_view(), name='create'),
+    path('compare/', views.ProgressCompareView.as_view(), name='compare'),
+    path('import/', views.ProgressImportView.as_view(), name='import'),
     path('<slug:slug>/detail/', views.ProgressDetailView.as_view(), name='detail'),
     path('<slug:slug>/update/', views.ProgressUpdateView.as_view(), name='update'),
     path('<slug:slug>/delete/', views.ProgressDeleteView.as_view(), name='delete'),
@@ -1,5 +1,8 @@
+import datetime
+
 from django.contrib import messages
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.http import Http404
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from django.views.generic import (
@@ -12,20 +15,61 @@ from django.views.generic import (
     View,
 )
 
-from utils.mixins import UserFormKwargsMixin
+from utils.mixins import OwnedObjectMixin, UserFormKwargsMixin
 
-from .forms import ProgressForm
+from .comparisons import get_comparison
+from .forms import ProgressCompareForm, ProgressForm, ProgressImportForm
 from .models import Progress
 
 
 class ProgressListView(LoginRequiredMixin, ListView):
-    """ View to list all the posts in progress """
+    """
+    View to list all the posts in progress, newest first.
+    Pages are keyset paginated on date, ?before=<date> for older logs and ?after=<date>
+    for newer, so every page is one read of the unique (user, date) index, scanned backwards
+    for newest first, with no OFFSET or COUNT.
+    """
 
-    ordering = ('-date',)
-    paginate_by = 25
+    model = Progress
+    context_object_name = 'progress_list'
+    page_size = 25
+    # Fields displayed by the list template.
+    list_fields = ('slug', 'date', 'weight', 'notes', 'image')
+
+    def get_cursor(self, name):
+        value = self.request.GET.get(name)
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            raise Http404(f'Invalid {name} date')
 
     def get_queryset(self, **kwargs):
-        return Progress.objects.filter(user=self.request.user)  # .order_by('-date')
+        queryset = Progress.objects.filter(user=self.request.user).only(*self.list_fields)
+        before, after = self.get_cursor('before'), self.get_cursor('after')
+        if after:
+            # Newer page: read upwards from the cursor, then show newest first.
+            rows = list(queryset.filter(date__gt=after).order_by('date')[: self.page_size + 1])
+            self.has_newer = len(rows) > self.page_size
+            self.has_older = True
+            return rows[: self.page_size][::-1]
+        if before:
+            queryset = queryset.filter(date__lt=before)
+        # One extra row tells whether there is an older page.
+        rows = list(queryset.order_by('-date')[: self.page_size + 1])
+        self.has_older = len(rows) > self.page_size
+        self.has_newer = before is not None
+        return rows[: self.page_size]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        rows = context['object_list']
+        if rows and self.has_older:
+            context['older_date'] = rows[-1].date.isoformat()
+        if rows and self.has_newer:
+            context['newer_date'] = rows[0].date.isoformat()
+        return context
 
 
 class ProgressCreateView(LoginRequiredMixin, UserFormKwargsMixin, CreateView):
@@ -39,24 +83,73 @@ class ProgressCreateView(LoginRequiredMixin, UserFormKwargsMixin, CreateView):
         return super().form_valid(form)
 
 
+class ProgressImportView(LoginRequiredMixin, FormView):
+    """
+    Imports weight history exported from another tracker, see progress.importers.
+    The whole file is validated first, then written with Progress.objects.upsert_weights()
+    in one transaction, so days already logged have their weight updated.
+    """
+
+    form_class = ProgressImportForm
+    template_name = 'progress/progress_import.html'
+    success_url = reverse_lazy('progress:list')
+
+    def form_valid(self, form):
+        count = Progress.objects.upsert_weights(self.request.user, form.cleaned_data['entries'])
+        messages.success(self.request, f'Imported {count} days of weights')
+        return super().form_valid(form)
+
+
+class ProgressCompareView(LoginRequiredMixin, UserFormKwargsMixin, FormView):
+    """
+    Compares the user's progress pictures of several dates, oldest first, as one
+    side by side or stacked image rendered on the first request, see progress.comparisons.
+    The form is submitted by GET so comparisons can be bookmarked.
+    """
+
+    form_class = ProgressCompareForm
+    template_name = 'progress/progress_compare.html'
+
+    def get_form_kwargs(self):
+        kwargs = super().get_form_kwargs()
+        if 'progress' in self.request.GET:
+            kwargs['data'] = self.request.GET
+        return kwargs
+
+    def get(self, request, *args, **kwargs):
+        form = self.get_form()
+        if form.is_bound and form.is_valid():
+            return self.form_valid(form)
+        return self.render_to_response(self.get_context_data(form=form))
+
+    def form_valid(self, form):
+        progress = form.cleaned_data['progress']
+        name = get_comparison([log.image.name for log in progress], form.cleaned_data['layout'])
+        return self.render_to_response(
+            self.get_context_data(form=form, compared=progress, comparison_url=progress[0].image.storage.url(name))
+        )
+
+
 class ProgressDetailView(DetailView):
     model = Progress
 
 
-class ProgressUpdateView(LoginRequiredMixin, UserFormKwargsMixin, UpdateView):
+class ProgressUpdateView(LoginRequiredMixin, OwnedObjectMixin, UserFormKwargsMixin, UpdateView):
     model = Progress
     form_class = ProgressForm
+    owned_url_kwarg = 'slug'
+    owned_lookup = 'slug'
+    owned_select_related = ('user',)
 
 
-class ProgressDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
+class ProgressDeleteView(LoginRequiredMixin, OwnedObjectMixin, DeleteView):
     # SuccessMessageMixin hooks to form_valid which is not present on DeleteView to push its message to the user.
 
     model = Progress
     success_url = reverse_lazy('progress:list')
-
-    def test_func(self):
-        obj = self.get_object()
-        return obj.user == self.request.user
+    owned_url_kwarg = 'slug'
+    owned_lookup = 'slug'
+    owned_select_related = ('user',)
 
     def delete(self, request, *args, **kwargs):
         obj = self.get_object()
@@ -0,0 +1,58 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the bounded thread pool async views run their ORM work on.
+    Each worker thread keeps its own database connection, so ASYNC_DB_POOL_SIZE
+    also caps the connections used by async views per process.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_DB_POOL_SIZE', 8),
+                    thread_name_prefix='async-db',
+                )
+    return _executor
+
+
+def _call(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_pool(func, *args, **kwargs):
+    """ Runs a synchronous (ORM) callable on the bounded pool without blocking the event loop. """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), partial(_call, func, *args, **kwargs))
+
+
+def async_login_required(view):
+    """
+    Decorator for async views returning a 403 JSON response to anonymous users.
+    Resolving request.user hits the session and user tables, so it is done on the pool.
+    """
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        is_authenticated = await run_in_pool(lambda: request.user.is_authenticated)
+        if not is_authenticated:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=403)
+        return await view(request, *args, **kwargs)
+
+    return wrapper
@@ -1,4 +1,7 @@
 from django.db.models.fields import CharField, EmailField
+from django.db.models.fields.files import ImageField
+
+from .forms import BoundedImageField as BoundedImageFormField
 
 
 class LowercaseCharField(CharField):
@@ -17,3 +20,10 @@ class LowercaseEmailField(EmailField):
         value = super().to_python(value)
         if isinstance(value, str):
             return value.lower()
+
+
+class BoundedImageField(ImageField):
+    """ ImageField whose form field enforces the upload limits and strips metadata, see utils.forms. """
+
+    def formfield(self, **kwargs):
+        return super().formfield(**{'form_class': BoundedImageFormField, **kwargs})
@@ -1,4 +1,11 @@
+import posixpath
+
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+from .images import get_upload_limits, ingest_image
 
 
 class DateInput(forms.DateInput):
@@ -7,3 +14,62 @@ class DateInput(forms.DateInput):
     def __init__(self, **kwargs):
         kwargs['format'] = '%Y-%m-%d'
         super().__init__(**kwargs)
+
+
+class BoundedImageField(forms.ImageField):
+    """
+    ImageField which rejects uploads over a file size or pixel count, read from the
+    header, before any decoding, then stores the image downscaled to `max_dimension`
+    and without its EXIF data, see utils.images.ingest_image.
+    Limits default to the IMAGE_UPLOAD_* settings.
+    """
+
+    default_error_messages = {
+        'file_too_large': 'Please upload an image no larger than %(max_size)s.',
+        'too_many_pixels': 'Please upload an image of no more than %(max_megapixels)s megapixels.',
+    }
+
+    def __init__(self, *, max_size=None, max_pixels=None, max_dimension=None, **kwargs):
+        default_size, default_pixels, default_dimension = get_upload_limits()
+        self.max_size = max_size or default_size
+        self.max_pixels = max_pixels or default_pixels
+        self.max_dimension = max_dimension or default_dimension
+        super().__init__(**kwargs)
+
+    def to_python(self, data):
+        # Skips ImageField.to_python(), which decodes the whole image to verify it.
+        f = forms.FileField.to_python(self, data)
+        if f is None:
+            return None
+        if f.size > self.max_size:
+            raise forms.ValidationError(
+                self.error_messages['file_too_large'],
+                code='file_too_large',
+                params={'max_size': filesizeformat(self.max_size)},
+            )
+
+        source = f.temporary_file_path() if hasattr(f, 'temporary_file_path') else f
+        try:
+            # Opening only parses the header.
+            with Image.open(source) as image:
+                width, height = image.size
+        except Image.DecompressionBombError:
+            width = height = self.max_pixels
+        except Exception as exc:
+            raise forms.ValidationError(self.error_messages['invalid_image'], code='invalid_image') from exc
+        if width * height > self.max_pixels:
+            raise forms.ValidationError(
+                self.error_messages['too_many_pixels'],
+                code='too_many_pixels',
+                params={'max_megapixels': round(self.max_pixels / 1_000_000)},
+            )
+
+        try:
+            output, extension = ingest_image(source, self.max_dimension)
+        except Exception as exc:
+            raise forms.ValidationError(self.error_messages['invalid_image'], code='invalid_image') from exc
+        output.seek(0, 2)
+        size = output.tell()
+        output.seek(0)
+        name = f'{posixpath.splitext(posixpath.basename(f.name))[0]}.{extension}'
+        return UploadedFile(output, name=name, content_type=Image.MIME.get(extension.upper()), size=size)
@@ -0,0 +1,47 @@
+class cached_metric:
+    """
+    Decorator which turns a method into a property computed once per instance, like
+    cached_property, but recomputed whenever one of the instance attributes it
+    depends on has changed.
+
+        @cached_metric('weight', 'height')
+        def bmi(self):
+            ...
+
+    Metrics built on other metrics list the underlying fields, so a change to any of
+    them invalidates the whole chain. The value can also be assigned, e.g. by a
+    queryset annotation of the same name, and is kept until a dependency changes.
+    """
+
+    def __init__(self, *depends_on):
+        self.depends_on = depends_on
+        self.func = None
+
+    def __call__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.cache_name = f'_{name}_metric'
+
+    def get_key(self, instance):
+        return tuple(getattr(instance, field) for field in self.depends_on)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        key = self.get_key(instance)
+        cached = instance.__dict__.get(self.cache_name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = self.func(instance)
+        instance.__dict__[self.cache_name] = (key, value)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.cache_name] = (self.get_key(instance), value)
+
+    def __delete__(self, instance):
+        instance.__dict__.pop(self.cache_name, None)
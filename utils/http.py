@@ -0,0 +1,57 @@
+import mimetypes
+import os
+import re
+
+from django.http import HttpResponse, StreamingHttpResponse
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def ranged_file_response(request, path, filename=None, content_type=None, headers=None):
+    """
+    Streams a file from disk honouring a single byte range in the Range header,
+    so large downloads can be resumed. Multiple ranges are answered with the full file.
+    """
+    size = os.path.getsize(path)
+    content_type = content_type or mimetypes.guess_type(str(path))[0] or 'application/octet-stream'
+    start, end = 0, size - 1
+    status = 200
+
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', '').strip())
+    if match and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range, the last N bytes.
+            start = max(size - int(last), 0)
+        if start > end or start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+        status = 206
+
+    length = end - start + 1
+    response = StreamingHttpResponse(_read_range(path, start, length), status=status, content_type=content_type)
+    response['Content-Length'] = length
+    response['Accept-Ranges'] = 'bytes'
+    if status == 206:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    for header, value in (headers or {}).items():
+        response[header] = value
+    return response
@@ -0,0 +1,243 @@
+"""
+Thumbnail and WebP derivatives of uploaded images.
+Each image is resized to the widths in IMAGE_DERIVATIVE_WIDTHS, no wider than the
+original, and saved as WebP alongside a JPEG (or PNG for images with transparency)
+fallback under a 'derivatives' folder next to the original:
+
+    images/progress_pictures/derivatives/<name>__320w.webp
+
+Derivatives are generated in the background pool after the upload is committed,
+and the widths available for each image are cached for the srcset template tags.
+"""
+import hashlib
+import io
+import logging
+import posixpath
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import DEFERRED
+from PIL import Image, ImageOps
+
+from .tasks import submit
+
+logger = logging.getLogger(__name__)
+
+WEBP = 'webp'
+CACHE_PREFIX = 'image-derivatives'
+DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+# Seconds an image without derivatives is cached as such.
+MISSING_TIMEOUT = 60
+
+
+def get_widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', (160, 320, 640, 1280))))
+
+
+def fallback_format(name):
+    # Originals which may hold transparency keep it through a PNG fallback.
+    return 'png' if name.lower().endswith(('.png', '.gif')) else 'jpg'
+
+
+def derivative_name(name, width, fmt):
+    directory, filename = posixpath.split(name)
+    root = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derivatives', f'{root}__{width}w.{fmt}')
+
+
+def _cache_key(name):
+    return f'{CACHE_PREFIX}:{name}'
+
+
+def _save(storage, name, image, fmt):
+    buffer = io.BytesIO()
+    if fmt == WEBP:
+        image.save(buffer, 'WEBP', quality=80, method=4)
+    elif fmt == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    else:
+        image.convert('RGB').save(buffer, 'JPEG', quality=82, optimize=True, progressive=True)
+    # Derivative names are fixed, replace rather than let the storage pick a new name.
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def generate_derivatives(name, storage=None, force=False):
+    """
+    Writes the WebP and fallback derivatives of the stored image `name`.
+    Existing derivatives are kept unless `force`. Returns the widths available.
+    """
+    storage = storage or default_storage
+    fallback = fallback_format(name)
+    with storage.open(name, 'rb') as file:
+        with Image.open(file) as original:
+            original = ImageOps.exif_transpose(original)
+            if original.mode not in ('RGB', 'RGBA'):
+                original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+            widths = [width for width in get_widths() if width <= original.width] or [get_widths()[0]]
+            for width in widths:
+                names = {fmt: derivative_name(name, width, fmt) for fmt in (WEBP, fallback)}
+                if not force and all(storage.exists(path) for path in names.values()):
+                    continue
+                height = max(1, round(original.height * min(width, original.width) / original.width))
+                resized = original.resize((min(width, original.width), height), Image.LANCZOS)
+                for fmt, path in names.items():
+                    _save(storage, path, resized, fmt)
+    cache.set(_cache_key(name), widths, None)
+    return widths
+
+
+def available_widths(name, storage=None):
+    """
+    Returns the derivative widths stored for the image `name`, cached after the first lookup.
+    An image without derivatives is only cached for MISSING_TIMEOUT, as they may still be
+    being generated, generate_derivatives() replaces it when they are.
+    """
+    widths = cache.get(_cache_key(name))
+    if widths is None:
+        storage = storage or default_storage
+        widths = [width for width in get_widths() if storage.exists(derivative_name(name, width, WEBP))]
+        cache.set(_cache_key(name), widths, None if widths else MISSING_TIMEOUT)
+    return widths
+
+
+def srcset(name, fmt=WEBP, storage=None):
+    """ Returns the srcset attribute value for the image `name` in the given format, or '' if none exist yet. """
+    storage = storage or default_storage
+    if fmt != WEBP:
+        fmt = fallback_format(name)
+    return ', '.join(
+        f'{storage.url(derivative_name(name, width, fmt))} {width}w' for width in available_widths(name, storage)
+    )
+
+
+def content_hash(name, storage=None):
+    """
+    Returns the SHA-256 of the stored image `name`. Content addressed names already
+    are the hash, see utils.storages, other files are read once and their hash cached.
+    """
+    root = posixpath.splitext(posixpath.basename(name))[0]
+    if DIGEST_RE.match(root):
+        return root
+    key = f'image-hash:{name}'
+    digest = cache.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with (storage or default_storage).open(name, 'rb') as file:
+            for chunk in file.chunks():
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        cache.set(key, digest, None)
+    return digest
+
+
+def schedule_derivatives(field_file):
+    """
+    Generates the derivatives of an uploaded image in the background once the
+    current transaction commits, unless they already exist.
+    """
+    if not field_file:
+        return
+    # Clears a cached miss, the new image would otherwise show no derivatives until it expires.
+    cache.delete(_cache_key(field_file.name))
+    if available_widths(field_file.name, field_file.storage):
+        return
+    name, storage = field_file.name, field_file.storage
+    transaction.on_commit(lambda: submit(generate_derivatives, name, storage))
+
+
+def loaded_name(instance, field_name='image'):
+    """
+    Returns the name held by the file field of a model instance, or DEFERRED if the
+    field wasn't loaded. Reads __dict__, so a deferred field isn't fetched.
+    """
+    value = instance.__dict__.get(field_name, DEFERRED)
+    return getattr(value, 'name', value)
+
+
+def release_image(name, storage=None):
+    """
+    Deletes a reference to the content addressed image `name` once the current
+    transaction commits, see utils.storages. The last reference deletes the file and
+    its derivatives. Other names, such as field defaults, are left alone.
+    """
+    storage = storage or default_storage
+    if not isinstance(name, str) or not hasattr(storage, 'is_content_addressed'):
+        return
+    if not name.startswith(f'{storage.prefix}/'):
+        return
+    transaction.on_commit(lambda: _release_image(name, storage))
+
+
+def _release_image(name, storage):
+    storage.delete(name)
+    if storage.exists(name):
+        return
+    directory = posixpath.join(posixpath.dirname(name), 'derivatives')
+    prefix = f'{posixpath.splitext(posixpath.basename(name))[0]}__'
+    try:
+        files = storage.listdir(directory)[1]
+    except FileNotFoundError:
+        files = []
+    for file in files:
+        if file.startswith(prefix):
+            storage.delete(posixpath.join(directory, file))
+    cache.delete(_cache_key(name))
+
+
+# Formats uploads are re-encoded to, anything else (GIF, BMP, TIFF...) is stored as PNG.
+INGEST_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def get_upload_limits():
+    return (
+        getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 15 * 1024 * 1024),
+        getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', 50_000_000),
+        getattr(settings, 'IMAGE_UPLOAD_MAX_DIMENSION', 2560),
+    )
+
+
+def ingest_image(file, max_dimension=None):
+    """
+    Re-encodes an uploaded image file, no larger than `max_dimension` on its longest
+    side, without its EXIF and other metadata. JPEGs are decoded at a reduced scale
+    with draft(), so a 50 megapixel photo never needs a full size bitmap in memory.
+    The orientation tag is applied before it is dropped. `file` is a path or file
+    object, and the caller checks the size and pixel limits first.
+    Returns a temporary file and its extension.
+    """
+    max_dimension = max_dimension or get_upload_limits()[2]
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    with Image.open(file) as source:
+        fmt = source.format if source.format in INGEST_FORMATS else 'PNG'
+        if max(source.size) > max_dimension:
+            # JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale still larger than the target,
+            # other formats are reduced by whole factors before resampling.
+            source.draft('RGB', (max_dimension, max_dimension))
+            source.thumbnail((max_dimension, max_dimension), Image.LANCZOS, reducing_gap=2.0)
+        image = ImageOps.exif_transpose(source)
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+    output = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    # An empty exif stops PNG and WebP copying it from image.info, the colour profile is kept.
+    options = {'exif': b''}
+    if image.info.get('icc_profile'):
+        options['icc_profile'] = image.info['icc_profile']
+    if fmt == 'JPEG':
+        image.save(output, fmt, quality=88, optimize=True, progressive=True, **options)
+    elif fmt == 'WEBP':
+        image.save(output, fmt, quality=88, method=4, **options)
+    else:
+        image.save(output, fmt, optimize=True, **options)
+    output.seek(0)
+    return output, INGEST_FORMATS[fmt]
@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from profiles.models import Profile
+from progress.models import Progress
+from utils.images import generate_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Generates the thumbnails and WebP variants of existing progress and profile pictures.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Images processed in parallel.')
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives which already exist.')
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (Progress, Profile):
+            names.update(
+                model.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True).distinct()
+            )
+
+        start = time.perf_counter()
+        done = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {
+                executor.submit(generate_derivatives, name, default_storage, options['force']): name
+                for name in sorted(names)
+            }
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                    done += 1
+                except Exception as error:
+                    failed += 1
+                    self.stderr.write(f'{futures[future]}: {error}')
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {done} images in {elapsed:.1f}s' + (f', {failed} failed' if failed else ''))
+        )
@@ -0,0 +1,85 @@
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management.base import BaseCommand
+from PIL import Image, ImageOps
+
+from utils.forms import BoundedImageField
+
+
+def _full_decode(path):
+    # What an unbounded upload costs: the whole image decoded and re-encoded at full size.
+    with Image.open(path) as image:
+        image = ImageOps.exif_transpose(image)
+        image.convert('RGB').save(os.devnull, 'JPEG', quality=88)
+
+
+def _bounded(path):
+    # As a request would: streamed to a temporary file by the upload handler, then cleaned by the form field.
+    upload = TemporaryUploadedFile(os.path.basename(path), 'image/jpeg', os.path.getsize(path), None)
+    with open(path, 'rb') as file:
+        shutil.copyfileobj(file, upload, 64 * 1024)
+    upload.seek(0)
+    BoundedImageField().clean(upload).close()
+    upload.close()
+
+
+METHODS = {'full': _full_decode, 'bounded': _bounded}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _measure(method, path, results):
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    METHODS[method](path)
+    results.put((_peak_rss_mb() - baseline, time.perf_counter() - start))
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the peak memory (RSS) and time of handling one image upload, fully decoded '
+        'and through BoundedImageField, for photos of several sizes. Each upload runs in a fresh process.'
+    )
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--megapixels', type=int, nargs='+', default=[12, 24, 48], help='Sizes of the generated test photos.'
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per size and method, the worst is reported.')
+
+    def handle(self, *args, **options):
+        context = multiprocessing.get_context('fork')
+        self.stdout.write(f'{"megapixels":>10}{"method":>10}{"peak MB":>10}{"ms":>10}')
+        with tempfile.TemporaryDirectory() as directory:
+            for megapixels in options['megapixels']:
+                path = self.make_photo(directory, megapixels)
+                for method in METHODS:
+                    peak = elapsed = 0
+                    for _ in range(options['repeat']):
+                        results = context.Queue()
+                        process = context.Process(target=_measure, args=(method, path, results))
+                        process.start()
+                        run_peak, run_elapsed = results.get()
+                        process.join()
+                        peak, elapsed = max(peak, run_peak), max(elapsed, run_elapsed)
+                    self.stdout.write(f'{megapixels:>10}{method:>10}{peak:>10.1f}{elapsed * 1000:>10.0f}')
+
+    def make_photo(self, directory, megapixels):
+        # A 4:3 photo taken in portrait, with an EXIF orientation tag to apply.
+        width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+        height = width * 3 // 4
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        path = os.path.join(directory, f'{megapixels}mp.jpg')
+        Image.effect_noise((width, height), 64).convert('RGB').save(path, 'JPEG', quality=90, exif=exif.tobytes())
+        return path
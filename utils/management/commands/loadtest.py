@@ -0,0 +1,108 @@
+import asyncio
+import ssl
+import statistics
+import time
+from urllib.parse import urljoin, urlsplit
+
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = [
+    '/food/api/search/?q=chicken',
+    '/food/api/autocomplete/?q=ch',
+    '/progress/api/chart/',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load tests the async read endpoints against one or more running deployments, '
+        'e.g. an ASGI (uvicorn/daphne) and a WSGI (gunicorn) server, and compares throughput and latency.'
+    )
+    requires_system_checks = False
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'targets',
+            nargs='+',
+            help='Deployments to compare as name=base_url, e.g. asgi=http://127.0.0.1:8001 wsgi=http://127.0.0.1:8000',
+        )
+        parser.add_argument('--path', action='append', dest='paths', help='Path to request, may be repeated.')
+        parser.add_argument('--concurrency', type=int, default=50, help='Concurrent connections.')
+        parser.add_argument('--requests', type=int, default=2000, help='Total requests per target.')
+        parser.add_argument('--cookie', default='', help='Cookie header to send, e.g. "sessionid=..."')
+        parser.add_argument('--timeout', type=float, default=30, help='Per request timeout in seconds.')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        self.stdout.write(f'{"target":<10}{"req/s":>10}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}{"errors":>8}')
+        for target in options['targets']:
+            name, _, base_url = target.partition('=')
+            result = asyncio.run(
+                self.run_target(
+                    base_url or name,
+                    paths,
+                    options['concurrency'],
+                    options['requests'],
+                    options['cookie'],
+                    options['timeout'],
+                )
+            )
+            self.stdout.write(
+                f'{name:<10}{result["throughput"]:>10.1f}{result["p50"]:>10.1f}'
+                f'{result["p99"]:>10.1f}{result["max"]:>10.1f}{result["errors"]:>8}'
+            )
+
+    async def run_target(self, base_url, paths, concurrency, total, cookie, timeout):
+        urls = [urljoin(base_url, path) for path in paths]
+        latencies = []
+        errors = 0
+        counter = iter(range(total))
+
+        async def worker():
+            nonlocal errors
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(fetch(urls[i % len(urls)], cookie), timeout)
+                except (OSError, asyncio.TimeoutError, ValueError):
+                    status = None
+                latencies.append((time.perf_counter() - start) * 1000)
+                if status != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        return {
+            'throughput': total / elapsed,
+            'p50': statistics.median(latencies),
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+            'max': latencies[-1],
+            'errors': errors,
+        }
+
+
+async def fetch(url, cookie):
+    """ Minimal HTTP/1.1 GET returning the response status code, the body is read and discarded. """
+    parts = urlsplit(url)
+    secure = parts.scheme == 'https'
+    port = parts.port or (443 if secure else 80)
+    reader, writer = await asyncio.open_connection(
+        parts.hostname, port, ssl=ssl.create_default_context() if secure else None
+    )
+    try:
+        path = parts.path + (f'?{parts.query}' if parts.query else '')
+        headers = [f'GET {path or "/"} HTTP/1.1', f'Host: {parts.netloc}', 'Connection: close']
+        if cookie:
+            headers.append(f'Cookie: {cookie}')
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        await writer.drain()
+        status_line = await reader.readline()
+        status = int(status_line.split()[1])
+        while await reader.read(65536):
+            pass
+        return status
+    finally:
+        writer.close()
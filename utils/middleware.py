@@ -0,0 +1,37 @@
+import asyncio
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Reports the remaining token bucket budget of throttled requests in the
+    X-RateLimit-Limit and X-RateLimit-Remaining response headers.
+    The most restrictive bucket applied to the request is reported.
+    Runs natively in both the sync and async middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Marks the instance as a coroutine function to the handler, as MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return self.add_headers(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.add_headers(request, await self.get_response(request))
+
+    def add_headers(self, request, response):
+        buckets = getattr(request, 'token_buckets', None)
+        if buckets:
+            bucket = min(buckets, key=lambda bucket: bucket.tokens)
+            response['X-RateLimit-Limit'] = bucket.capacity
+            response['X-RateLimit-Remaining'] = bucket.remaining
+            if bucket.tokens < 1:
+                response['Retry-After'] = bucket.wait()
+        return response
@@ -1,3 +1,9 @@
+from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.module_loading import import_string
+
+
 class UserFormKwargsMixin:
     """
     CBV mixin which puts the user from the request into the form kwargs.
@@ -10,3 +16,67 @@ class UserFormKwargsMixin:
         # Update the existing form kwargs dict with the request's user.
         kwargs['user'] = self.request.user
         return kwargs
+
+
+class OwnedObjectMixin(UserPassesTestMixin):
+    """
+    CBV mixin which loads the object a view acts on, with its owner, once per request.
+    The object is fetched by `owned_lookup`=kwargs[`owned_url_kwarg`] with
+    `owned_select_related` and cached on the view, so the permission check,
+    get_object(), context building and success urls all share the one query.
+    `owner_field` is the path to the owning user, e.g. 'user' or 'meal__user',
+    its relations should be in `owned_select_related` so the check is query free.
+    """
+
+    owned_model = None
+    owned_url_kwarg = 'pk'
+    owned_lookup = 'pk'
+    owned_select_related = ()
+    owner_field = 'user'
+
+    def get_owned_queryset(self):
+        model = self.owned_model or self.model
+        return model._default_manager.select_related(*self.owned_select_related)
+
+    def get_owned_object(self):
+        if not hasattr(self, '_owned_object'):
+            lookup = {self.owned_lookup: self.kwargs.get(self.owned_url_kwarg)}
+            self._owned_object = get_object_or_404(self.get_owned_queryset(), **lookup)
+        return self._owned_object
+
+    def get_owner_id(self, obj):
+        *path, owner = self.owner_field.split('__')
+        for name in path:
+            obj = getattr(obj, name)
+        return getattr(obj, f'{owner}_id')
+
+    def test_func(self):
+        return self.get_owner_id(self.get_owned_object()) == self.request.user.pk
+
+    def get_object(self, queryset=None):
+        return self.get_owned_object()
+
+
+class ThrottleMixin:
+    """
+    CBV mixin which applies token bucket throttles to plain Django views.
+    Only requests using one of `throttle_methods` are throttled, with the budget
+    taken from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][`throttle_scope`].
+    Place it after LoginRequiredMixin so anonymous users are redirected first.
+    """
+
+    throttle_classes = ['utils.throttling.ScopedTokenBucketThrottle', 'utils.throttling.IPTokenBucketThrottle']
+    throttle_scope = None
+    throttle_methods = ('POST',)
+
+    def get_throttles(self):
+        return [import_string(throttle)() for throttle in self.throttle_classes]
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in self.throttle_methods:
+            waits = [throttle.wait() for throttle in self.get_throttles() if not throttle.allow_request(request, self)]
+            if waits:
+                response = HttpResponse('Too many requests, please wait before trying again.', status=429)
+                response['Retry-After'] = max(waits)
+                return response
+        return super().dispatch(request, *args, **kwargs)
@@ -1,3 +1,124 @@
+import hashlib
+import os
+import posixpath
+import threading
+from contextlib import contextmanager
+
+from django.core.files import File, locks
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedMixin:
+    """
+    Storage mixin which names uploads by the SHA-256 of their content, so identical
+    uploads are stored once, in directories sharded by the first bytes of the hash:
+
+        cas/3f/a2/3fa2...e9.jpg
+
+    A '<name>.refs' sidecar counts the saves of each file, and delete() only removes
+    the file once every reference to it has been deleted. As the content never
+    changes for a name, files can be served with immutable cache headers.
+    Files under `exempt_dirs`, e.g. image derivatives and progress comparisons, which
+    are already named after the hash of the files they were made from, are stored by
+    name and overwritten.
+    Mix into any Storage with exists/open/save/delete, e.g. an S3 storage.
+    """
+
+    prefix = 'cas'
+    exempt_dirs = ('derivatives', 'comparisons')
+    refs_suffix = '.refs'
+    _refs_lock = threading.Lock()
+
+    def is_content_addressed(self, name):
+        return not set(posixpath.dirname(name).split('/')) & set(self.exempt_dirs)
+
+    def hash_content(self, content):
+        sha = hashlib.sha256()
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        for chunk in content.chunks():
+            sha.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        return sha.hexdigest()
+
+    def content_name(self, digest, name):
+        extension = posixpath.splitext(name)[1].lower()
+        return posixpath.join(self.prefix, digest[:2], digest[2:4], f'{digest}{extension}')
+
+    @contextmanager
+    def locked_refs(self, name):
+        """
+        Yields a dict holding the reference count of `name` while holding a lock on it,
+        the count is written back on exit. Only serialises threads of this process,
+        storages shared between processes should override it with a real lock.
+        """
+        with self._refs_lock:
+            refs_name = name + self.refs_suffix
+            state = {'refs': 0}
+            if super().exists(refs_name):
+                with super().open(refs_name, 'rb') as file:
+                    state['refs'] = int(file.read().strip() or 0)
+            yield state
+            if super().exists(refs_name):
+                super().delete(refs_name)
+            super().save(refs_name, ContentFile(str(state['refs']).encode()))
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        if not self.is_content_addressed(name):
+            if self.exists(name):
+                super().delete(name)
+            return super().save(name, content, max_length=max_length)
+
+        name = self.content_name(self.hash_content(content), name)
+        with self.locked_refs(name) as state:
+            if self.exists(name):
+                # A file stored before reference counting has at least one reference.
+                state['refs'] = max(state['refs'], 1) + 1
+            else:
+                name = super().save(name, content, max_length=max_length)
+                state['refs'] = 1
+        return name
+
+    def delete(self, name):
+        if not self.is_content_addressed(name) or not name.startswith(f'{self.prefix}/'):
+            return super().delete(name)
+        with self.locked_refs(name) as state:
+            state['refs'] = max(state['refs'] - 1, 0)
+            if not state['refs']:
+                super().delete(name)
+
+
+class ContentAddressedStorage(ContentAddressedMixin, FileSystemStorage):
+    """
+    Content addressed storage on the local filesystem under MEDIA_ROOT.
+    Reference counts are updated under an exclusive file lock, so they stay correct
+    with several worker processes.
+    """
+
+    @contextmanager
+    def locked_refs(self, name):
+        path = self.path(name + self.refs_suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a+') as file:
+            locks.lock(file, locks.LOCK_EX)
+            try:
+                file.seek(0)
+                state = {'refs': int(file.read().strip() or 0)}
+                yield state
+                file.seek(0)
+                file.truncate()
+                file.write(str(state['refs']))
+                file.flush()
+            finally:
+                locks.unlock(file)
+
+
 # from django.conf import settings
 # from storages.backends.s3boto3 import S3Boto3Storage
 
@@ -16,3 +137,9 @@
 #     default_acl = 'private'
 #     file_overwrite = False
 #     # custom_domain = False
+
+
+# class ContentAddressedS3Storage(ContentAddressedMixin, PublicMediaStorage):
+#     # Reference counts need a lock shared by every worker, e.g. a database row or Redis lock, in locked_refs().
+#     file_overwrite = True
+#     object_parameters = {'CacheControl': 'public, max-age=31536000, immutable'}
@@ -1,4 +1,7 @@
 from django import template
+from django.utils.html import format_html
+
+from utils import images
 
 register = template.Library()
 
@@ -50,3 +53,40 @@ def param_replace(context, **kwargs):
     for k in [k for k, v in d.items() if not v]:
         del d[k]
     return d.urlencode()
+
+
+@register.filter(name='srcset')
+def srcset(image, fmt='webp'):
+    """
+    Returns the srcset of an ImageField's resized derivatives, 'webp' or 'fallback'
+    (JPEG or PNG), or '' until they have been generated. See utils.images.
+    """
+    if not image:
+        return ''
+    return images.srcset(image.name, fmt, image.storage)
+
+
+@register.simple_tag
+def picture(image, alt='', sizes='100vw', css_class=''):
+    """
+    Renders a responsive <picture> of an ImageField, serving the WebP derivatives
+    where supported and the resized fallbacks otherwise, e.g.
+
+    {% picture object.image alt='Progress picture' sizes='160px' %}
+    """
+    if not image:
+        return ''
+    webp = srcset(image)
+    if not webp:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', image.url, alt, css_class)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        webp,
+        sizes,
+        image.url,
+        srcset(image, 'fallback'),
+        sizes,
+        alt,
+        css_class,
+    )
@@ -1,3 +1,347 @@
-from django.test import TestCase
+import asyncio
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from django.urls import reverse
+from PIL import Image, ImageCms
+
+from . import images
+from .forms import BoundedImageField
+from .functional import cached_metric
+from .http import ranged_file_response
+from .middleware import RateLimitHeadersMiddleware
+from .storages import ContentAddressedStorage
+from .uploadhandlers import BoundedTemporaryFileUploadHandler
+from .throttling import TokenBucket, parse_rate
+
+
+class TokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache('tests', {})
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('60/min'), (60, 1))
+        self.assertEqual(parse_rate('10/s'), (10, 10))
+
+    def test_bucket_allows_burst_then_throttles(self):
+        with mock.patch('utils.throttling.time.time', return_value=1000):
+            bucket = TokenBucket('key', capacity=3, refill_rate=1, cache=self.cache)
+            self.assertEqual([bucket.consume() for _ in range(4)], [True, True, True, False])
+            self.assertEqual(bucket.remaining, 0)
+            self.assertEqual(bucket.wait(), 1)
+
+    def test_bucket_refills_over_time(self):
+        bucket = TokenBucket('key', capacity=2, refill_rate=1, cache=self.cache)
+        with mock.patch('utils.throttling.time.time', return_value=1000):
+            bucket.consume()
+            bucket.consume()
+            self.assertFalse(bucket.consume())
+        with mock.patch('utils.throttling.time.time', return_value=1001.5):
+            self.assertTrue(bucket.consume())
+            self.assertFalse(bucket.consume())
+
+
+class RateLimitHeadersMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+        self.request.token_buckets = [
+            TokenBucket('wide', capacity=100, refill_rate=1, cache=LocMemCache('tests', {})),
+            TokenBucket('narrow', capacity=5, refill_rate=1, cache=LocMemCache('tests', {})),
+        ]
+
+    def test_sync(self):
+        middleware = RateLimitHeadersMiddleware(lambda request: HttpResponse())
+        response = middleware(self.request)
+        self.assertEqual((response['X-RateLimit-Limit'], response['X-RateLimit-Remaining']), ('5', '5'))
+
+    async def test_async(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        middleware = RateLimitHeadersMiddleware(get_response)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = await middleware(self.request)
+        self.assertEqual((response['X-RateLimit-Limit'], response['X-RateLimit-Remaining']), ('5', '5'))
+
+
+class CachedMetricTests(SimpleTestCase):
+    class Body:
+        def __init__(self, weight, height):
+            self.weight = weight
+            self.height = height
+            self.calls = 0
+
+        @cached_metric('weight', 'height')
+        def bmi(self):
+            self.calls += 1
+            return round(self.weight / (self.height / 100) ** 2, 1)
+
+    def test_computed_once(self):
+        body = self.Body(80, 180)
+        self.assertEqual(body.bmi, 24.7)
+        self.assertEqual(body.bmi, 24.7)
+        self.assertEqual(body.calls, 1)
+
+    def test_recomputed_when_dependency_changes(self):
+        body = self.Body(80, 180)
+        body.bmi
+        body.weight = 90
+        self.assertEqual(body.bmi, 27.8)
+        self.assertEqual(body.calls, 2)
+
+    def test_assigned_value_is_kept_until_dependency_changes(self):
+        body = self.Body(80, 180)
+        body.bmi = 25
+        self.assertEqual(body.bmi, 25)
+        self.assertEqual(body.calls, 0)
+        body.height = 170
+        self.assertEqual(body.bmi, 27.7)
+
+
+class ImageDerivativeTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name, base_url='/media/')
+        buffer = io.BytesIO()
+        Image.new('RGB', (500, 300), 'red').save(buffer, 'JPEG')
+        self.name = self.storage.save('images/progress_pictures/photo.jpg', ContentFile(buffer.getvalue()))
+        cache.delete(f'image-derivatives:{self.name}')
+
+    def tearDown(self):
+        cache.delete(f'image-derivatives:{self.name}')
+        self.directory.cleanup()
+
+    def test_generate_derivatives(self):
+        with self.settings(IMAGE_DERIVATIVE_WIDTHS=(160, 320, 640)):
+            widths = images.generate_derivatives(self.name, self.storage)
+        self.assertEqual(widths, [160, 320])
+        for width in widths:
+            for fmt in ('webp', 'jpg'):
+                self.assertTrue(self.storage.exists(images.derivative_name(self.name, width, fmt)))
+        with self.storage.open(images.derivative_name(self.name, 320, 'webp')) as file:
+            self.assertEqual(Image.open(file).size, (320, 192))
+
+    def test_missing_derivatives_cached_briefly(self):
+        with mock.patch.object(self.storage, 'exists', wraps=self.storage.exists) as exists:
+            self.assertEqual(images.available_widths(self.name, self.storage), [])
+            self.assertEqual(images.available_widths(self.name, self.storage), [])
+        self.assertEqual(exists.call_count, len(images.get_widths()))
+        with mock.patch('utils.images.cache.set') as cache_set:
+            cache.delete(f'image-derivatives:{self.name}')
+            images.available_widths(self.name, self.storage)
+        cache_set.assert_called_once_with(f'image-derivatives:{self.name}', [], images.MISSING_TIMEOUT)
+
+    def test_srcset(self):
+        self.assertEqual(images.srcset(self.name, storage=self.storage), '')
+        with self.settings(IMAGE_DERIVATIVE_WIDTHS=(160, 320)):
+            images.generate_derivatives(self.name, self.storage)
+            self.assertEqual(
+                images.srcset(self.name, 'fallback', self.storage),
+                '/media/images/progress_pictures/derivatives/photo__160w.jpg 160w, '
+                '/media/images/progress_pictures/derivatives/photo__320w.jpg 320w',
+            )
+
+
+class ContentAddressedStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.storage = ContentAddressedStorage(location=self.directory.name, base_url='/media/')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_identical_uploads_stored_once(self):
+        first = self.storage.save('images/progress_pictures/a.JPG', ContentFile(b'same'))
+        second = self.storage.save('images/progress_pictures/b.jpg', ContentFile(b'same'))
+        other = self.storage.save('images/progress_pictures/c.jpg', ContentFile(b'other'))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertRegex(first, r'^cas/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        with self.storage.open(first) as file:
+            self.assertEqual(file.read(), b'same')
+
+    def test_delete_removes_file_after_last_reference(self):
+        name = self.storage.save('photo.jpg', ContentFile(b'same'))
+        self.storage.save('photo.jpg', ContentFile(b'same'))
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+
+    def test_release_image_deletes_derivatives_with_last_reference(self):
+        name = self.storage.save('photo.jpg', ContentFile(b'same'))
+        self.storage.save('photo.jpg', ContentFile(b'same'))
+        derivatives = [images.derivative_name(name, 160, 'webp'), images.derivative_name(name, 160, 'jpg')]
+        for derivative in derivatives:
+            self.storage.save(derivative, ContentFile(b'small'))
+        other = self.storage.save('cas/ab/cd/derivatives/abcd__160w.webp', ContentFile(b'other'))
+        with mock.patch('utils.images.transaction.on_commit', side_effect=lambda func: func()):
+            images.release_image(name, self.storage)
+            self.assertTrue(all(self.storage.exists(path) for path in [name, *derivatives]))
+            images.release_image(name, self.storage)
+            images.release_image('images/profile_pictures/default.png', self.storage)
+        self.assertFalse(any(self.storage.exists(path) for path in [name, *derivatives]))
+        self.assertTrue(self.storage.exists(other))
+
+    def test_derivatives_overwritten_by_name(self):
+        name = 'cas/ab/cd/derivatives/abcd__160w.webp'
+        self.assertEqual(self.storage.save(name, ContentFile(b'old')), name)
+        self.assertEqual(self.storage.save(name, ContentFile(b'new')), name)
+        with self.storage.open(name) as file:
+            self.assertEqual(file.read(), b'new')
+
+
+class RangedFileResponseTests(SimpleTestCase):
+    def setUp(self):
+        file = tempfile.NamedTemporaryFile(suffix='.txt', delete=False)
+        file.write(b'0123456789')
+        file.close()
+        self.path = file.name
+        self.addCleanup(os.remove, self.path)
+
+    def get(self, range_header=None):
+        headers = {'HTTP_RANGE': range_header} if range_header else {}
+        return ranged_file_response(RequestFactory().get('/', **headers), self.path, filename='data.txt')
+
+    def test_full(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual((response['Content-Length'], response['Accept-Ranges']), ('10', 'bytes'))
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="data.txt"')
+
+    def test_partial(self):
+        for range_header, content, content_range in (
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        ):
+            response = self.get(range_header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(b''.join(response.streaming_content), content)
+            self.assertEqual(response['Content-Range'], content_range)
+            self.assertEqual(response['Content-Length'], str(len(content)))
+
+    def test_unsatisfiable(self):
+        for range_header in ('bytes=10-', 'bytes=5-2'):
+            response = self.get(range_header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_multiple_ranges_served_in_full(self):
+        response = self.get('bytes=0-1,4-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+
+
+class BoundedTemporaryFileUploadHandlerTests(SimpleTestCase):
+    def test_stops_past_limit(self):
+        handler = BoundedTemporaryFileUploadHandler()
+        with self.settings(IMAGE_UPLOAD_MAX_SIZE=10):
+            handler.new_file('image', 'photo.jpg', 'image/jpeg', None)
+        self.addCleanup(handler.file.close)
+        handler.receive_data_chunk(b'x' * 8, 0)
+        with self.assertRaises(StopUpload) as context:
+            handler.receive_data_chunk(b'x' * 8, 8)
+        self.assertTrue(context.exception.connection_reset)
+        handler.file.seek(0)
+        self.assertEqual(handler.file.read(), b'x' * 8)
+
+
+class ContentAddressedMediaViewTests(SimpleTestCase):
+    digest = 'ab' * 32
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        override = self.settings(MEDIA_ROOT=self.directory.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.path = f'ab/ab/{self.digest}.jpg'
+        # A plain storage keeps the name, a content addressed one would rename it after the real hash.
+        FileSystemStorage(location=self.directory.name).save(f'cas/{self.path}', ContentFile(b'0123456789'))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def url(self, path):
+        return reverse('content_addressed_media', kwargs={'path': path})
+
+    def test_served_immutable(self):
+        response = self.client.get(self.url(self.path))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], f'"{self.digest}.jpg"')
+
+    def test_not_modified(self):
+        response = self.client.get(self.url(self.path), HTTP_IF_NONE_MATCH=f'"{self.digest}.jpg"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_not_found(self):
+        for path in ('ab/ab/photo.jpg', f'ab/ab/{self.digest}.jpg.refs', '../../settings.py', f'cd/cd/{"cd" * 32}.jpg'):
+            response = self.client.get(self.url(path))
+            self.assertEqual(response.status_code, 404)
+
+
+class BoundedImageFieldTests(SimpleTestCase):
+    def upload(self, size=(400, 300), fmt='JPEG', **kwargs):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, fmt, **kwargs)
+        return SimpleUploadedFile(f'photo.{fmt.lower()}', buffer.getvalue())
+
+    def test_downscales_and_strips_exif(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees
+        exif[0x010F] = 'Camera'
+        cleaned = BoundedImageField(max_dimension=200).clean(self.upload(exif=exif.tobytes()))
+        with Image.open(cleaned) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (150, 200))
+            self.assertEqual(dict(image.getexif()), {})
+        self.assertEqual(cleaned.name, 'photo.jpg')
+
+    def test_keeps_format(self):
+        cleaned = BoundedImageField().clean(self.upload(fmt='PNG'))
+        with Image.open(cleaned) as image:
+            self.assertEqual((image.format, image.size), ('PNG', (400, 300)))
+
+    def test_webp_round_trip(self):
+        icc_profile = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        cleaned = BoundedImageField().clean(self.upload(fmt='WEBP', icc_profile=icc_profile))
+        with Image.open(cleaned) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (400, 300)))
+            self.assertEqual(image.info.get('icc_profile'), icc_profile)
+        cleaned = BoundedImageField().clean(self.upload(fmt='WEBP'))
+        with Image.open(cleaned) as image:
+            self.assertEqual(image.format, 'WEBP')
+            self.assertFalse(image.info.get('icc_profile'))
+
+    def test_rejects_large_files(self):
+        with self.assertRaises(ValidationError) as context:
+            BoundedImageField(max_size=100).clean(self.upload())
+        self.assertEqual(context.exception.code, 'file_too_large')
+
+    def test_rejects_large_images_before_decoding(self):
+        with mock.patch('utils.forms.ingest_image') as ingest, self.assertRaises(ValidationError) as context:
+            BoundedImageField(max_pixels=100_000).clean(self.upload(size=(400, 300)))
+        self.assertEqual(context.exception.code, 'too_many_pixels')
+        ingest.assert_not_called()
+
+    def test_rejects_invalid_images(self):
+        with self.assertRaises(ValidationError) as context:
+            BoundedImageField().clean(SimpleUploadedFile('photo.jpg', b'not an image'))
+        self.assertEqual(context.exception.code, 'invalid_image')
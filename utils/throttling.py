@@ -0,0 +1,156 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+DURATIONS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Process local fallback used when the configured throttle cache is unavailable (single node only).
+_local_cache = LocMemCache('throttling', {})
+
+
+def get_throttle_cache():
+    try:
+        return caches[getattr(settings, 'THROTTLE_CACHE', 'default')]
+    except InvalidCacheBackendError:
+        return _local_cache
+
+
+def parse_rate(rate):
+    """
+    Parses a rate string of the form '<requests>/<period>', e.g. '60/min',
+    into a (capacity, tokens refilled per second) tuple.
+    """
+    num, period = rate.split('/')
+    capacity = int(num)
+    return capacity, capacity / DURATIONS[period[0]]
+
+
+class TokenBucket:
+    """
+    Token bucket stored in the cache as a (tokens, timestamp) pair.
+    The bucket holds up to `capacity` tokens and refills continuously at
+    `refill_rate` tokens per second, so short bursts are allowed while the
+    sustained rate is bounded. As with DRF's own throttles the read-modify-write
+    is not atomic, a few extra requests may slip through under heavy contention.
+    """
+
+    def __init__(self, key, capacity, refill_rate, cache=None):
+        self.key = key
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.cache = cache or get_throttle_cache()
+        self.tokens = capacity
+
+    def consume(self, tokens=1):
+        now = time.time()
+        state = self.cache.get(self.key)
+        if state is None:
+            available = self.capacity
+        else:
+            available, timestamp = state
+            available = min(self.capacity, available + (now - timestamp) * self.refill_rate)
+
+        allowed = available >= tokens
+        if allowed:
+            available -= tokens
+        self.tokens = available
+        self.cache.set(self.key, (available, now), math.ceil(self.capacity / self.refill_rate))
+        return allowed
+
+    @property
+    def remaining(self):
+        return int(self.tokens)
+
+    def wait(self):
+        """ Seconds until the next token is available. """
+        if self.tokens >= 1:
+            return 0
+        return math.ceil((1 - self.tokens) / self.refill_rate)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Base token bucket throttle, usable by DRF views and, through
+    `utils.mixins.ThrottleMixin`, by plain Django views.
+    Rates are read from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'] using the throttle scope.
+    The bucket is attached to the request so `RateLimitHeadersMiddleware` can report the remaining budget.
+    """
+
+    scope = None
+
+    def get_scope(self, view):
+        return self.scope
+
+    def get_cache_key(self, request, view):
+        """ Returns the bucket identity for the request, or None to skip throttling. """
+        raise NotImplementedError('.get_cache_key() must be overridden')
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        if scope is None:
+            return True
+        try:
+            rate = api_settings.DEFAULT_THROTTLE_RATES[scope]
+        except KeyError:
+            raise ImproperlyConfigured(f'No default throttle rate set for "{scope}" scope')
+        if rate is None:
+            return True
+
+        ident = self.get_cache_key(request, view)
+        if ident is None:
+            return True
+
+        capacity, refill_rate = parse_rate(rate)
+        self.bucket = TokenBucket(f'throttle_{scope}_{ident}', capacity, refill_rate)
+        allowed = self.bucket.consume()
+
+        # DRF wraps the HttpRequest, the middleware only sees the underlying request.
+        http_request = getattr(request, '_request', request)
+        if not hasattr(http_request, 'token_buckets'):
+            http_request.token_buckets = []
+        http_request.token_buckets.append(self.bucket)
+        return allowed
+
+    def wait(self):
+        return self.bucket.wait()
+
+
+class UserTokenBucketThrottle(TokenBucketThrottle):
+    """ Throttles per authenticated user, falling back to the client IP for anonymous requests. """
+
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """ Throttles per client IP, regardless of authentication. """
+
+    scope = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.get_ident(request)
+
+
+class ScopedTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Throttles per user (or client IP) using the `throttle_scope` attribute of the view,
+    giving heavy endpoints their own budget.
+    """
+
+    def get_scope(self, view):
+        return getattr(view, 'throttle_scope', None)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return self.get_ident(request)
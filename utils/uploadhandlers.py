@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.files.uploadhandler import StopUpload, TemporaryFileUploadHandler
+
+
+class BoundedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams uploads to a temporary file like TemporaryFileUploadHandler, but abandons
+    the request once a file passes IMAGE_UPLOAD_MAX_SIZE, resetting the connection
+    rather than reading the rest of the upload.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.max_size = getattr(settings, 'IMAGE_UPLOAD_MAX_SIZE', 15 * 1024 * 1024)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > self.max_size:
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
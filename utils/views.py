@@ -1,3 +1,37 @@
-from django.shortcuts import render
+import re
 
-# Create your views here.
+from django.conf import settings
+from django.http import Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+
+from .http import ranged_file_response
+
+# Content addressed files, their derivatives and progress comparisons, named after the SHA-256 of their sources.
+CONTENT_ADDRESSED_RE = re.compile(
+    r'^(?:comparisons/)?[0-9a-f]{2}/[0-9a-f]{2}/(?:derivatives/)?(?P<digest>[0-9a-f]{64})(?:__\d+w)?\.[a-z0-9]+$'
+)
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def content_addressed_media_view(request, path):
+    """
+    Serves files from utils.storages.ContentAddressedStorage. A name never changes
+    content, so responses are cacheable for a year and revalidated by the content hash.
+    Behind a web server the same headers should be set on its /media/cas/ location
+    and this view left unused.
+    """
+    match = CONTENT_ADDRESSED_RE.match(path)
+    if not match:
+        raise Http404('Not a content addressed file')
+    etag = f'"{match.group("digest")}{path[path.rindex("."):]}"'
+    if etag in request.META.get('HTTP_IF_NONE_MATCH', ''):
+        response = HttpResponseNotModified()
+    else:
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, 'cas', path)
+            response = ranged_file_response(request, full_path)
+        except FileNotFoundError:
+            raise Http404('File not found')
+    response['Cache-Control'] = IMMUTABLE
+    response['ETag'] = etag
+    return response